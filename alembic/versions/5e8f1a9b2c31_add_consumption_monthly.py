@@ -0,0 +1,56 @@
+"""add consumption_monthly rollup
+
+Revision ID: 5e8f1a9b2c31
+Revises: 3b7c9d2e1f40
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app import config
+
+# revision identifiers, used by Alembic.
+revision = "5e8f1a9b2c31"
+down_revision = "3b7c9d2e1f40"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "consumption_monthly",
+        sa.Column("customer_id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("kwh", sa.Float(), nullable=False),
+        sa.Column("cost_eur", sa.Float(), nullable=False),
+        sa.Column("records", sa.Integer(), nullable=False),
+        sa.Column("first_ts", postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("last_ts", postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["customer_id"], ["customers.id"]),
+        sa.PrimaryKeyConstraint("customer_id", "month"),
+    )
+
+    # Initial backfill; `python -m app.db.rollup backfill` rebuilds it later.
+    op.execute(
+        sa.text(
+            """
+            INSERT INTO consumption_monthly
+                (customer_id, month, kwh, cost_eur, records, first_ts, last_ts)
+            SELECT customer_id,
+                   date_trunc('month', timezone(:tz, ts))::date AS month,
+                   sum(kwh),
+                   sum(kwh * price_eur_per_kwh),
+                   count(*),
+                   min(ts),
+                   max(ts)
+            FROM consumption_records
+            GROUP BY customer_id, month
+            """
+        ).bindparams(tz=config.TZ)
+    )
+
+
+def downgrade():
+    op.drop_table("consumption_monthly")
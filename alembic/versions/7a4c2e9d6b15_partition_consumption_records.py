@@ -0,0 +1,143 @@
+"""partition consumption_records by month
+
+Revision ID: 7a4c2e9d6b15
+Revises: 5e8f1a9b2c31
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app import config
+
+# revision identifiers, used by Alembic.
+revision = "7a4c2e9d6b15"
+down_revision = "5e8f1a9b2c31"
+branch_labels = None
+depends_on = None
+
+_INDEXES = (
+    "consumption_records_pkey",
+    "ix_consumption_customer_ts",
+    "ix_consumption_records_customer_id",
+    "ix_consumption_records_ts",
+)
+
+# Used by app.db.partitions.ensure_partitions; creates each missing monthly partition
+# between the local months of lo and hi, serialized by an advisory lock.
+_ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_consumption_partitions(
+    lo timestamptz, hi timestamptz, tz text
+) RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    m timestamp := date_trunc('month', lo AT TIME ZONE tz);
+    stop timestamp := date_trunc('month', hi AT TIME ZONE tz);
+    part text;
+    created integer := 0;
+BEGIN
+    WHILE m <= stop LOOP
+        part := format('consumption_records_%s', to_char(m, 'YYYY_MM'));
+        IF to_regclass(part) IS NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtext('consumption_records_partitions'));
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF consumption_records '
+                'FOR VALUES FROM (%L) TO (%L)',
+                part,
+                m AT TIME ZONE tz,
+                (m + interval '1 month') AT TIME ZONE tz
+            );
+            created := created + 1;
+        END IF;
+        m := m + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$
+"""
+
+
+def _rename_old_table():
+    op.execute("ALTER TABLE consumption_records RENAME TO consumption_records_old")
+    for name in _INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_old")
+
+
+def _create_indexes():
+    op.create_index(
+        "ix_consumption_customer_ts",
+        "consumption_records",
+        ["customer_id", "ts"],
+        unique=True,
+    )
+    op.create_index(
+        op.f("ix_consumption_records_customer_id"),
+        "consumption_records",
+        ["customer_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_consumption_records_ts"), "consumption_records", ["ts"], unique=False
+    )
+
+
+def _copy_rows_and_drop_old_table():
+    op.execute(
+        """
+        INSERT INTO consumption_records (id, customer_id, ts, kwh, price_eur_per_kwh)
+        SELECT id, customer_id, ts, kwh, price_eur_per_kwh FROM consumption_records_old
+        """
+    )
+    # keep the id sequence: hand it to the new table before the old one goes
+    op.execute(
+        "ALTER SEQUENCE consumption_records_id_seq OWNED BY consumption_records.id"
+    )
+    op.execute("DROP TABLE consumption_records_old")
+
+
+def upgrade():
+    _rename_old_table()
+    op.execute(
+        """
+        CREATE TABLE consumption_records (
+            id integer NOT NULL DEFAULT nextval('consumption_records_id_seq'),
+            customer_id integer NOT NULL REFERENCES customers (id),
+            ts timestamptz NOT NULL,
+            kwh double precision NOT NULL,
+            price_eur_per_kwh double precision NOT NULL,
+            CONSTRAINT consumption_records_pkey PRIMARY KEY (id, ts)
+        ) PARTITION BY RANGE (ts)
+        """
+    )
+    _create_indexes()
+    op.execute(_ENSURE_PARTITIONS_FUNCTION)
+    op.execute(
+        sa.text(
+            """
+            SELECT ensure_consumption_partitions(min(ts), max(ts), :tz)
+            FROM consumption_records_old
+            HAVING count(*) > 0
+            """
+        ).bindparams(tz=config.TZ)
+    )
+    _copy_rows_and_drop_old_table()
+
+
+def downgrade():
+    _rename_old_table()
+    op.execute(
+        """
+        CREATE TABLE consumption_records (
+            id integer NOT NULL DEFAULT nextval('consumption_records_id_seq'),
+            customer_id integer NOT NULL REFERENCES customers (id),
+            ts timestamptz NOT NULL,
+            kwh double precision NOT NULL,
+            price_eur_per_kwh double precision NOT NULL,
+            CONSTRAINT consumption_records_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    _create_indexes()
+    _copy_rows_and_drop_old_table()
+    op.execute(
+        "DROP FUNCTION IF EXISTS ensure_consumption_partitions(timestamptz, timestamptz, text)"
+    )
@@ -0,0 +1,34 @@
+"""add packed consumption_daily
+
+Revision ID: 9c3d5f7a1e28
+Revises: 7a4c2e9d6b15
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "9c3d5f7a1e28"
+down_revision = "7a4c2e9d6b15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `python -m app.db.packed pack`; kept current on import when
+    # PACKED_STORAGE=1.
+    op.create_table(
+        "consumption_daily",
+        sa.Column("customer_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("kwh", postgresql.ARRAY(sa.REAL()), nullable=False),
+        sa.Column("price_eur_per_kwh", postgresql.ARRAY(sa.REAL()), nullable=False),
+        sa.ForeignKeyConstraint(["customer_id"], ["customers.id"]),
+        sa.PrimaryKeyConstraint("customer_id", "day"),
+    )
+
+
+def downgrade():
+    op.drop_table("consumption_daily")
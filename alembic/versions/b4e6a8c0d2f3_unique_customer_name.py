@@ -0,0 +1,135 @@
+"""unique customer name
+
+Revision ID: b4e6a8c0d2f3
+Revises: 9c3d5f7a1e28
+Create Date: 2026-10-18 13:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app import config
+
+# revision identifiers, used by Alembic.
+revision = "b4e6a8c0d2f3"
+down_revision = "9c3d5f7a1e28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge customers sharing a name into the lowest id. Where several of them have
+    # a reading at the same ts (or imported the same file), the lowest id's wins.
+    op.execute(
+        """
+        CREATE TEMP TABLE customer_merge ON COMMIT DROP AS
+        SELECT id, keep_id
+        FROM (
+            SELECT id,
+                   min(id) OVER (PARTITION BY name) AS keep_id,
+                   count(*) OVER (PARTITION BY name) AS n
+            FROM customers
+        ) c
+        WHERE n > 1
+        """
+    )
+    for table, key in (("consumption_records", "ts"), ("import_batches", "content_hash")):
+        op.execute(
+            f"""
+            DELETE FROM {table} r
+            USING customer_merge m
+            WHERE r.customer_id = m.id AND m.id <> m.keep_id
+              AND EXISTS (
+                  SELECT 1
+                  FROM {table} o
+                  JOIN customer_merge mo ON mo.id = o.customer_id
+                  WHERE mo.keep_id = m.keep_id
+                    AND o.{key} = r.{key}
+                    AND o.customer_id < r.customer_id
+              )
+            """
+        )
+    for table in ("consumption_records", "import_batches", "invoices"):
+        op.execute(
+            f"""
+            UPDATE {table} t SET customer_id = m.keep_id
+            FROM customer_merge m
+            WHERE t.customer_id = m.id AND m.id <> m.keep_id
+            """
+        )
+
+    # Derived tables: drop the merged customers' rows and rebuild the survivors'.
+    for table in ("consumption_monthly", "consumption_daily"):
+        op.execute(
+            f"""
+            DELETE FROM {table} t USING customer_merge m
+            WHERE t.customer_id = m.id
+            """
+        )
+    op.execute(
+        sa.text(
+            """
+            INSERT INTO consumption_monthly
+                (customer_id, month, kwh, cost_eur, records, first_ts, last_ts)
+            SELECT customer_id,
+                   date_trunc('month', timezone(:tz, ts))::date AS month,
+                   sum(kwh),
+                   sum(kwh * price_eur_per_kwh),
+                   count(*),
+                   min(ts),
+                   max(ts)
+            FROM consumption_records
+            WHERE customer_id IN (SELECT keep_id FROM customer_merge)
+            GROUP BY customer_id, month
+            """
+        ).bindparams(tz=config.TZ)
+    )
+    if config.PACKED_STORAGE:
+        # repack the survivors' local days, as app.db.packed does
+        op.execute(
+            sa.text(
+                """
+                WITH days AS (
+                    SELECT DISTINCT customer_id, timezone(:tz, ts)::date AS day
+                    FROM consumption_records
+                    WHERE customer_id IN (SELECT keep_id FROM customer_merge)
+                ),
+                slots AS (
+                    SELECT d.customer_id, d.day, s.slot_ts
+                    FROM days d,
+                         generate_series(
+                             timezone(:tz, d.day::timestamp),
+                             timezone(:tz, (d.day + 1)::timestamp)
+                                 - interval '15 minutes',
+                             interval '15 minutes'
+                         ) AS s(slot_ts)
+                )
+                INSERT INTO consumption_daily
+                    (customer_id, day, kwh, price_eur_per_kwh)
+                SELECT s.customer_id,
+                       s.day,
+                       array_agg(r.kwh::real ORDER BY s.slot_ts),
+                       array_agg(r.price_eur_per_kwh::real ORDER BY s.slot_ts)
+                FROM slots s
+                LEFT JOIN consumption_records r
+                       ON r.customer_id = s.customer_id AND r.ts = s.slot_ts
+                GROUP BY s.customer_id, s.day
+                ON CONFLICT (customer_id, day) DO UPDATE
+                SET kwh = EXCLUDED.kwh,
+                    price_eur_per_kwh = EXCLUDED.price_eur_per_kwh
+                """
+            ).bindparams(tz=config.TZ)
+        )
+
+    op.execute(
+        """
+        DELETE FROM customers c USING customer_merge m
+        WHERE c.id = m.id AND m.id <> m.keep_id
+        """
+    )
+    op.create_unique_constraint("uq_customers_name", "customers", ["name"])
+
+
+def downgrade():
+    # merged duplicate customers are not restored
+    op.drop_constraint("uq_customers_name", "customers", type_="unique")
@@ -0,0 +1,42 @@
+"""add invoice pdf cache
+
+Revision ID: c5f7b9d1e3a4
+Revises: b4e6a8c0d2f3
+Create Date: 2026-10-18 14:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c5f7b9d1e3a4"
+down_revision = "b4e6a8c0d2f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("invoices", sa.Column("pdf_key", sa.String(length=64), nullable=True))
+    op.create_table(
+        "invoice_pdfs",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column(
+            "last_used",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(
+        op.f("ix_invoice_pdfs_last_used"), "invoice_pdfs", ["last_used"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_invoice_pdfs_last_used"), table_name="invoice_pdfs")
+    op.drop_table("invoice_pdfs")
+    op.drop_column("invoices", "pdf_key")
@@ -0,0 +1,70 @@
+"""add peak demand to consumption_monthly
+
+Revision ID: d6a8c0e2f4b5
+Revises: c5f7b9d1e3a4
+Create Date: 2026-10-18 15:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app import config
+
+# revision identifiers, used by Alembic.
+revision = "d6a8c0e2f4b5"
+down_revision = "c5f7b9d1e3a4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "consumption_monthly", sa.Column("peak_kw", sa.Float(), nullable=True)
+    )
+    op.add_column(
+        "consumption_monthly", sa.Column("peak_top3_kw", sa.Float(), nullable=True)
+    )
+    op.add_column(
+        "consumption_monthly",
+        sa.Column("peak_ts", postgresql.TIMESTAMP(timezone=True), nullable=True),
+    )
+
+    # Backfill existing months in one pass over consumption_records.
+    op.execute(
+        sa.text(
+            """
+            UPDATE consumption_monthly m
+            SET peak_kw = p.peak_kw,
+                peak_top3_kw = p.peak_top3_kw,
+                peak_ts = p.peak_ts
+            FROM (
+                SELECT customer_id,
+                       month,
+                       max(kwh) * 4 AS peak_kw,
+                       avg(kwh) FILTER (WHERE peak_rank <= 3) * 4 AS peak_top3_kw,
+                       min(ts) FILTER (WHERE peak_rank = 1) AS peak_ts
+                FROM (
+                    SELECT customer_id,
+                           date_trunc('month', timezone(:tz, ts))::date AS month,
+                           ts,
+                           kwh,
+                           row_number() OVER (
+                               PARTITION BY customer_id,
+                                            date_trunc('month', timezone(:tz, ts))
+                               ORDER BY kwh DESC, ts
+                           ) AS peak_rank
+                    FROM consumption_records
+                ) ranked
+                GROUP BY customer_id, month
+            ) p
+            WHERE m.customer_id = p.customer_id AND m.month = p.month
+            """
+        ).bindparams(tz=config.TZ)
+    )
+
+
+def downgrade():
+    op.drop_column("consumption_monthly", "peak_ts")
+    op.drop_column("consumption_monthly", "peak_top3_kw")
+    op.drop_column("consumption_monthly", "peak_kw")
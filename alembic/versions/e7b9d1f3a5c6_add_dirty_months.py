@@ -0,0 +1,36 @@
+"""add dirty_months for incremental invoice recomputation
+
+Revision ID: e7b9d1f3a5c6
+Revises: d6a8c0e2f4b5
+Create Date: 2026-10-18 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "e7b9d1f3a5c6"
+down_revision = "d6a8c0e2f4b5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "dirty_months",
+        sa.Column("customer_id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column(
+            "marked_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["customer_id"], ["customers.id"]),
+        sa.PrimaryKeyConstraint("customer_id", "month"),
+    )
+
+
+def downgrade():
+    op.drop_table("dirty_months")
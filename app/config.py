@@ -2,3 +2,83 @@ import os
 from pathlib import Path
 
 TZ = os.getenv("TZ", "Europe/Ljubljana")
+
+# Default root of uploads, invoice runs and the PDF cache: data/ in the project
+# checkout, wherever the app is started from.
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
+
+# Bulk loader used for consumption_records imports: "copy" (COPY into a staging table)
+# or "batched" (execute_values pages of IMPORT_BATCH_SIZE rows).
+IMPORT_LOADER = os.getenv("IMPORT_LOADER", "copy")
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Batched loader only: commit after every "chunk" or once per "file".
+IMPORT_COMMIT = os.getenv("IMPORT_COMMIT", "file")
+
+# Staging of previewed uploads until commit: "memory" (per-process LRU) or "disk"
+# (UPLOADS_DIR, shared by all workers).
+UPLOAD_STORE = os.getenv("UPLOAD_STORE", "memory")
+UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", DATA_DIR / "uploads"))
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", "3600"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Background import jobs: worker threads and how long finished jobs stay pollable.
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_JOB_RETENTION_SECONDS = int(os.getenv("IMPORT_JOB_RETENTION_SECONDS", "3600"))
+
+# Processes used to parse files in parallel for /imports/batch.
+IMPORT_PARSE_PROCESSES = int(
+    os.getenv("IMPORT_PARSE_PROCESSES", str(os.cpu_count() or 1))
+)
+
+# Rows per chunk when streaming a CSV straight into the loader (/imports/stream).
+IMPORT_STREAM_CHUNK_ROWS = int(os.getenv("IMPORT_STREAM_CHUNK_ROWS", "50000"))
+
+# CSV parser used by billing.parse_csv: "pandas" or "pyarrow".
+CSV_ENGINE = os.getenv("CSV_ENGINE", "pandas")
+
+# Recompute invoice totals row by row in Python and compare with the SQL aggregate.
+INVOICE_VERIFY_TOTALS = os.getenv("INVOICE_VERIFY_TOTALS", "0") == "1"
+
+# Also keep the packed per-day consumption_daily layout up to date on import.
+PACKED_STORAGE = os.getenv("PACKED_STORAGE", "0") == "1"
+
+# Connection pool of each engine (sync and async), per process. Recycle closes
+# connections older than DB_POOL_RECYCLE seconds. The statement timeout applies to
+# request handlers (the async engine) only, never to imports, backfills or invoice
+# runs on the sync engine; 0 is off.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+# Entries in each process's customer name -> id cache (app.services.customer_cache).
+CUSTOMER_ID_CACHE_SIZE = int(os.getenv("CUSTOMER_ID_CACHE_SIZE", "10000"))
+
+# Bulk invoice runs (app.services.invoice_run): output location and render processes.
+INVOICES_DIR = Path(os.getenv("INVOICES_DIR", DATA_DIR / "invoices"))
+INVOICE_RENDER_PROCESSES = int(
+    os.getenv("INVOICE_RENDER_PROCESSES", str(os.cpu_count() or 1))
+)
+
+# Invoice PDF rendering for requests (app.services.pdf.render_pool): worker
+# processes, renders allowed to queue beyond them, and how long a request waits
+# for a slot before getting 503.
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+PDF_RENDER_QUEUE_DEPTH = int(
+    os.getenv("PDF_RENDER_QUEUE_DEPTH", str(2 * PDF_RENDER_WORKERS))
+)
+PDF_RENDER_WAIT_SECONDS = float(os.getenv("PDF_RENDER_WAIT_SECONDS", "10"))
+
+# Cache of rendered invoice PDFs (app.services.pdf_cache): "disk" (PDF_CACHE_DIR)
+# or "db" (invoice_pdfs table), evicting least recently used past the byte limit.
+# Evicted PDFs are not re-rendered (GET /invoices/{id}/pdf answers 404), so the limit
+# should hold at least one month's bulk invoice run.
+PDF_CACHE = os.getenv("PDF_CACHE", "disk")
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", DATA_DIR / "pdf_cache"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Most points GET /customers/{id}/series returns; coarser resolutions are required
+# (or picked, with resolution=auto) for longer ranges.
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "10000"))
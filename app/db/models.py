@@ -1,5 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index, func
-from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    LargeBinary,
+    UniqueConstraint,
+    func,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, REAL, TIMESTAMP
 from sqlalchemy.orm import relationship
 from .base import Base
 
@@ -8,16 +20,24 @@ class Customer(Base):
     __tablename__ = "customers"
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
+    __table_args__ = (UniqueConstraint("name", name="uq_customers_name"),)
 
 
 class ConsumptionRecord(Base):
+    """15-minute readings, range-partitioned by ts into local months.
+
+    Partitions are created on demand by app.db.partitions; the primary key includes
+    ts because PostgreSQL requires the partition key in every unique constraint.
+    """
+
     __tablename__ = "consumption_records"
-    id = Column(Integer, primary_key=True)
+    __table_args__ = {"postgresql_partition_by": "RANGE (ts)"}
+    id = Column(Integer, primary_key=True, autoincrement=True)
     customer_id = Column(
         Integer, ForeignKey("customers.id"), index=True, nullable=False
     )
     ts = Column(
-        TIMESTAMP(timezone=True), index=True, nullable=False
+        TIMESTAMP(timezone=True), primary_key=True, index=True, nullable=False
     )  # timestamp with timezone
     kwh = Column(Float, nullable=False)  # Poraba [kWh]
     price_eur_per_kwh = Column(Float, nullable=False)  # Dinamične Cene [EUR/kWh]
@@ -44,3 +64,89 @@ class Invoice(Base):
     created_at = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
     )
+    # key of the rendered PDF in the invoice PDF cache (app.services.pdf_cache)
+    pdf_key = Column(String(64), nullable=True)
+
+
+class InvoicePdf(Base):
+    """Rendered invoice PDFs for the "db" PDF cache backend, keyed by content hash."""
+
+    __tablename__ = "invoice_pdfs"
+    key = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    last_used = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
+
+
+class ImportBatch(Base):
+    """One committed CSV file, identified by the SHA-256 of its bytes."""
+
+    __tablename__ = "import_batches"
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(
+        Integer, ForeignKey("customers.id"), index=True, nullable=False
+    )
+    content_hash = Column(String(64), nullable=False)
+    rows = Column(Integer, nullable=False)
+    inserted = Column(Integer, nullable=False)
+    updated = Column(Integer, nullable=False)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+    __table_args__ = (
+        UniqueConstraint(
+            "customer_id", "content_hash", name="uq_import_batches_customer_hash"
+        ),
+    )
+
+
+class ConsumptionMonthly(Base):
+    """Per-customer monthly rollup of consumption_records, by local month in config.TZ.
+
+    Maintained by the import loaders (see app.db.rollup) for the months they touch.
+    Peak demand is in kW of a 15-minute reading (kWh * 4): the month's maximum,
+    the average of its three highest readings and when the maximum occurred.
+    """
+
+    __tablename__ = "consumption_monthly"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # first day of the local month
+    kwh = Column(Float, nullable=False)
+    cost_eur = Column(Float, nullable=False)
+    records = Column(Integer, nullable=False)
+    first_ts = Column(TIMESTAMP(timezone=True), nullable=False)
+    last_ts = Column(TIMESTAMP(timezone=True), nullable=False)
+    peak_kw = Column(Float, nullable=True)
+    peak_top3_kw = Column(Float, nullable=True)
+    peak_ts = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+class DirtyMonth(Base):
+    """A (customer, local month) whose readings changed since invoices were last priced.
+
+    Written by the import loaders, consumed by app.services.invoice_recompute.
+    """
+
+    __tablename__ = "dirty_months"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # first day of the local month
+    marked_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class ConsumptionDaily(Base):
+    """Packed per-customer, per-local-day readings (see app.db.packed).
+
+    Element i of each array is the 15-minute slot starting i * 15 min after local
+    midnight in config.TZ, so arrays hold 92, 96 or 100 slots depending on DST.
+    Missing readings are NULL elements. Values are float4.
+    """
+
+    __tablename__ = "consumption_daily"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # local calendar day
+    kwh = Column(ARRAY(REAL), nullable=False)
+    price_eur_per_kwh = Column(ARRAY(REAL), nullable=False)
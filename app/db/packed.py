@@ -0,0 +1,165 @@
+"""Compact per-day storage of interval data in consumption_daily.
+
+Each row packs one customer's local day into float4 arrays on the 15-minute grid
+(92/96/100 slots on DST days), which is several times smaller than one
+consumption_records row per reading. consumption_records stays the source of truth:
+``python -m app.db.packed pack [--customer-id ID]`` packs existing data and, with
+PACKED_STORAGE=1, the import loaders repack the days they touch.
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+from sqlalchemy import select, text
+
+from app import config
+from app.db.models import ConsumptionDaily
+from app.deps import get_db
+
+SLOT = timedelta(minutes=15)
+
+# Packs whole local days of raw rows; {where} restricts consumption_records.
+_PACK_DAYS = """
+WITH days AS (
+    SELECT DISTINCT customer_id, timezone(:tz, ts)::date AS day
+    FROM consumption_records
+    {where}
+),
+slots AS (
+    SELECT d.customer_id, d.day, s.slot_ts
+    FROM days d,
+         generate_series(
+             timezone(:tz, d.day::timestamp),
+             timezone(:tz, (d.day + 1)::timestamp) - interval '15 minutes',
+             interval '15 minutes'
+         ) AS s(slot_ts)
+)
+INSERT INTO consumption_daily (customer_id, day, kwh, price_eur_per_kwh)
+SELECT s.customer_id,
+       s.day,
+       array_agg(r.kwh::real ORDER BY s.slot_ts),
+       array_agg(r.price_eur_per_kwh::real ORDER BY s.slot_ts)
+FROM slots s
+LEFT JOIN consumption_records r
+       ON r.customer_id = s.customer_id AND r.ts = s.slot_ts
+GROUP BY s.customer_id, s.day
+ON CONFLICT (customer_id, day) DO UPDATE
+SET kwh = EXCLUDED.kwh,
+    price_eur_per_kwh = EXCLUDED.price_eur_per_kwh
+"""
+
+# Whole local days from the one containing :lo up to the one containing :hi.
+_SPAN_WHERE = """
+WHERE customer_id = :customer_id
+  AND ts >= timezone(:tz, date_trunc('day', timezone(:tz, :lo)))
+  AND ts < timezone(:tz, date_trunc('day', timezone(:tz, :hi)) + interval '1 day')
+"""
+
+# Billing total straight from packed days, for whole local days [:d0, :d1).
+PACKED_TOTALS = """
+SELECT coalesce(sum(u.k * u.p), 0), count(u.k), coalesce(sum(u.k), 0)
+FROM consumption_daily d,
+     unnest(d.kwh, d.price_eur_per_kwh) AS u(k, p)
+WHERE d.customer_id = :customer_id AND d.day >= :d0 AND d.day < :d1
+"""
+
+
+def refresh_packed_days(db, spans: dict[int, list[datetime]]) -> None:
+    """Repack every local day overlapping each customer's [min, max] ts span.
+
+    Runs in the caller's transaction on `db`.
+    """
+    stmt = text(_PACK_DAYS.format(where=_SPAN_WHERE))
+    for customer_id, (lo, hi) in spans.items():
+        db.execute(
+            stmt, {"tz": config.TZ, "customer_id": customer_id, "lo": lo, "hi": hi}
+        )
+
+
+def pack_all_days(db, customer_id: int | None = None) -> None:
+    """Pack all raw rows, optionally for a single customer (the migration path)."""
+    params: dict = {"tz": config.TZ}
+    where = ""
+    if customer_id is not None:
+        where = "WHERE customer_id = :customer_id"
+        params["customer_id"] = customer_id
+    db.execute(text(_PACK_DAYS.format(where=where)), params)
+
+
+def day_slot_starts(day: date, n_slots: int) -> pd.DatetimeIndex:
+    """UTC start of each 15-minute slot of a local day in config.TZ."""
+    tz = pytz.timezone(config.TZ)
+    midnight = tz.localize(datetime(day.year, day.month, day.day))
+    return pd.date_range(midnight, periods=n_slots, freq=SLOT).tz_convert("UTC")
+
+
+def unpack_days(days: list[tuple[date, list, list]]) -> pd.DataFrame:
+    """Expand packed (day, kwh[], price[]) rows into a ts/kwh/price_eur_per_kwh frame.
+
+    Empty slots are dropped, so the result has one row per stored reading, in order.
+    """
+    if not days:
+        return pd.DataFrame(
+            {
+                "ts": pd.DatetimeIndex([], tz="UTC"),
+                "kwh": np.array([], dtype="float64"),
+                "price_eur_per_kwh": np.array([], dtype="float64"),
+            }
+        )
+    ts = np.concatenate(
+        [
+            day_slot_starts(day, len(k)).to_numpy("datetime64[ns]")
+            for day, k, _ in days
+        ]
+    )
+    kwh = np.concatenate([np.asarray(k, dtype="float64") for _, k, _ in days])
+    price = np.concatenate([np.asarray(p, dtype="float64") for _, _, p in days])
+    keep = ~np.isnan(kwh)
+    return pd.DataFrame(
+        {
+            "ts": pd.DatetimeIndex(ts[keep]).tz_localize("UTC"),
+            "kwh": kwh[keep],
+            "price_eur_per_kwh": price[keep],
+        }
+    )
+
+
+def read_packed_series(
+    db, customer_id: int, first_day: date, end_day: date
+) -> pd.DataFrame:
+    """Return a customer's readings for local days [first_day, end_day) as a frame."""
+    rows = db.execute(
+        select(
+            ConsumptionDaily.day,
+            ConsumptionDaily.kwh,
+            ConsumptionDaily.price_eur_per_kwh,
+        )
+        .filter(
+            ConsumptionDaily.customer_id == customer_id,
+            ConsumptionDaily.day >= first_day,
+            ConsumptionDaily.day < end_day,
+        )
+        .order_by(ConsumptionDaily.day)
+    ).all()
+    return unpack_days([tuple(r) for r in rows])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain consumption_daily.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pack = sub.add_parser("pack", help="pack consumption_records into daily arrays")
+    pack.add_argument("--customer-id", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        with get_db() as db:
+            pack_all_days(db, args.customer_id)
+            db.commit()
+        print("consumption_daily packed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Monthly range partitions of consumption_records.
+
+Partitions cover one local month in config.TZ each and are named
+``consumption_records_YYYY_MM``. The loaders create missing ones for incoming data;
+``python -m app.db.partitions ensure --months-ahead N`` pre-creates upcoming months
+(e.g. from cron) so imports rarely have to take the DDL lock themselves.
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app import config
+from app.deps import get_db
+
+
+def ensure_partitions(db, lo: datetime, hi: datetime) -> int:
+    """Create any missing monthly partitions covering [lo, hi]; returns how many.
+
+    Calls the ensure_consumption_partitions() SQL function installed by migration
+    7a4c2e9d6b15, in the caller's transaction on `db`. Creating a partition locks
+    consumption_records until that transaction ends, so this only happens for months
+    that have no partition yet.
+    """
+    return db.execute(
+        text("SELECT ensure_consumption_partitions(:lo, :hi, :tz)"),
+        {"lo": lo, "hi": hi, "tz": config.TZ},
+    ).scalar_one()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Maintain consumption_records partitions."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    ensure = sub.add_parser(
+        "ensure", help="create partitions for at least the next N months"
+    )
+    ensure.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        now = datetime.now(timezone.utc)
+        hi = now + timedelta(days=31 * args.months_ahead)
+        with get_db() as db:
+            created = ensure_partitions(db, now, hi)
+            db.commit()
+        print(f"Created {created} consumption_records partitions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Maintenance of the consumption_monthly rollup (totals and peak demand).
+
+Run ``python -m app.db.rollup backfill [--customer-id ID]`` to rebuild the rollup
+from consumption_records, e.g. after loading data outside the import loaders.
+"""
+
+import argparse
+from datetime import date, datetime
+from typing import Iterable, Iterator
+
+from sqlalchemy import select, text
+
+from app import config
+from app.db.models import ConsumptionMonthly
+from app.deps import get_db
+
+# Aggregates raw rows per (customer, local month) in one pass, including peak
+# demand: 15-minute readings ranked by kWh within each month, where kW = kWh * 4.
+# Callers fill in a WHERE clause.
+_ROLLUP_SELECT = """
+INSERT INTO consumption_monthly
+    (customer_id, month, kwh, cost_eur, records, first_ts, last_ts,
+     peak_kw, peak_top3_kw, peak_ts)
+SELECT customer_id,
+       month,
+       sum(kwh),
+       sum(kwh * price_eur_per_kwh),
+       count(*),
+       min(ts),
+       max(ts),
+       max(kwh) * 4,
+       avg(kwh) FILTER (WHERE peak_rank <= 3) * 4,
+       min(ts) FILTER (WHERE peak_rank = 1)
+FROM (
+    SELECT customer_id,
+           date_trunc('month', timezone(:tz, ts))::date AS month,
+           ts,
+           kwh,
+           price_eur_per_kwh,
+           row_number() OVER (
+               PARTITION BY customer_id, date_trunc('month', timezone(:tz, ts))
+               ORDER BY kwh DESC, ts
+           ) AS peak_rank
+    FROM consumption_records
+    {where}
+) ranked
+GROUP BY customer_id, month
+ON CONFLICT (customer_id, month) DO UPDATE
+SET kwh = EXCLUDED.kwh,
+    cost_eur = EXCLUDED.cost_eur,
+    records = EXCLUDED.records,
+    first_ts = EXCLUDED.first_ts,
+    last_ts = EXCLUDED.last_ts,
+    peak_kw = EXCLUDED.peak_kw,
+    peak_top3_kw = EXCLUDED.peak_top3_kw,
+    peak_ts = EXCLUDED.peak_ts
+"""
+
+# Whole local months from the one containing :lo up to the one containing :hi.
+_SPAN_WHERE = """
+WHERE customer_id = :customer_id
+  AND ts >= timezone(:tz, date_trunc('month', timezone(:tz, :lo)))
+  AND ts < timezone(:tz, date_trunc('month', timezone(:tz, :hi)) + interval '1 month')
+"""
+
+
+def track_spans(
+    rows: Iterable[tuple], spans: dict[int, list[datetime]]
+) -> Iterator[tuple]:
+    """Pass loader tuples through, recording the [min, max] ts seen per customer."""
+    for row in rows:
+        customer_id, ts = row[0], row[1]
+        span = spans.get(customer_id)
+        if span is None:
+            spans[customer_id] = [ts, ts]
+        elif ts < span[0]:
+            span[0] = ts
+        elif ts > span[1]:
+            span[1] = ts
+        yield row
+
+
+def refresh_monthly_rollup(db, spans: dict[int, list[datetime]]) -> None:
+    """Recompute the rollup for every local month overlapping each customer's span.
+
+    Runs in the caller's transaction on `db`.
+    """
+    stmt = text(_ROLLUP_SELECT.format(where=_SPAN_WHERE))
+    for customer_id, (lo, hi) in spans.items():
+        db.execute(
+            stmt, {"tz": config.TZ, "customer_id": customer_id, "lo": lo, "hi": hi}
+        )
+
+
+def backfill_monthly_rollup(db, customer_id: int | None = None) -> None:
+    """Rebuild the rollup from all raw rows, optionally for a single customer."""
+    params: dict = {"tz": config.TZ}
+    where = ""
+    if customer_id is not None:
+        where = "WHERE customer_id = :customer_id"
+        params["customer_id"] = customer_id
+        db.execute(
+            text("DELETE FROM consumption_monthly WHERE customer_id = :customer_id"),
+            params,
+        )
+    else:
+        db.execute(text("DELETE FROM consumption_monthly"))
+    db.execute(text(_ROLLUP_SELECT.format(where=where)), params)
+
+
+def customer_month_query(customer_id: int, month: date):
+    """Select the rollup row for one customer and local month."""
+    return select(ConsumptionMonthly).filter_by(customer_id=customer_id, month=month)
+
+
+def get_customer_month(db, customer_id: int, month: date) -> ConsumptionMonthly | None:
+    """Return the rollup row for one customer and local month, if any."""
+    return db.execute(customer_month_query(customer_id, month)).scalar_one_or_none()
+
+
+async def get_customer_month_async(
+    db, customer_id: int, month: date
+) -> ConsumptionMonthly | None:
+    """`get_customer_month` on an AsyncSession."""
+    result = await db.execute(customer_month_query(customer_id, month))
+    return result.scalar_one_or_none()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain consumption_monthly.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    backfill = sub.add_parser("backfill", help="rebuild the rollup from raw rows")
+    backfill.add_argument("--customer-id", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        with get_db() as db:
+            backfill_monthly_rollup(db, args.customer_id)
+            db.commit()
+        print("consumption_monthly backfilled")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,54 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from app import config
+
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+
+
+def pool_options() -> dict:
+    """Engine keyword arguments for the pool settings in `app.config`."""
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+
+
+def async_connect_args() -> dict:
+    """asyncpg connect arguments applying DB_STATEMENT_TIMEOUT_MS to request sessions.
+
+    The sync engine gets no timeout: loaders, backfills and invoice runs may
+    legitimately run for longer.
+    """
+    if not config.DB_STATEMENT_TIMEOUT_MS:
+        return {}
+    timeout = str(config.DB_STATEMENT_TIMEOUT_MS)
+    return {"server_settings": {"statement_timeout": timeout}}
+
+
+engine = create_engine(DATABASE_URL, **pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def async_database_url(url: str) -> URL:
+    """Return DATABASE_URL with its sync driver swapped for asyncpg."""
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+# async engine for the FastAPI handlers; Alembic, CLIs and the bulk loaders
+# (COPY via psycopg2) keep using the sync engine above
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(
+    DATABASE_URL
+)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, connect_args=async_connect_args(), **pool_options()
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
@@ -1,11 +1,28 @@
 from app.db import models
+from app.db.partitions import ensure_partitions
+from app.db.packed import refresh_packed_days
+from app.db.rollup import refresh_monthly_rollup, track_spans
+import csv
+import hashlib
+import io
+from itertools import islice
+import numpy as np
 import pandas as pd
-from app.deps import get_db
-from datetime import datetime
-from typing import Optional
+from app.deps import use_db
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
 import pytz
-from app import config
+import psycopg2
+from psycopg2.extras import execute_values
+from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import config
+
+# Column order of the row tuples produced by `build_consumption_rows`.
+CONSUMPTION_COLUMNS = ("customer_id", "ts", "kwh", "price_eur_per_kwh")
+
+# Matches an explicit UTC offset ("Z", "+02:00", "+0200") at the end of a timestamp.
+_OFFSET_SUFFIX = r"(?:Z|[+-]\d{2}:?\d{2})$"
 
 
 def parse_timestamp(value: Optional[str]) -> datetime | None:
@@ -58,20 +75,423 @@ def ensure_utc(dt):
     return dt.astimezone(pytz.UTC)
 
 
-def insert_or_update_consumption_records(records: list[dict]):
-    """Insert or update consumption records in bulk."""
-    if not records:
-        return
+def to_utc_series(values: pd.Series) -> pd.Series:
+    """Columnar counterpart of `parse_timestamp` + `ensure_utc`.
+
+    Values carrying an explicit offset are converted to UTC directly; naive values are
+    localized to `app.config.TZ` the same way pytz ``localize`` does (ambiguous and
+    non-existent wall times resolve to standard time). Anything the vectorized parser
+    cannot handle falls back to `parse_timestamp` for that row only.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        if values.dt.tz is None:
+            return values.dt.tz_localize(
+                config.TZ,
+                ambiguous=np.zeros(len(values), dtype=bool),
+                nonexistent="NaT",
+            ).dt.tz_convert("UTC")
+        return values.dt.tz_convert("UTC")
+
+    strings = values.astype("string").str.strip()
+    has_offset = strings.str.contains(_OFFSET_SUFFIX, regex=True, na=False)
+
+    result = pd.to_datetime(
+        strings.where(has_offset), utc=True, format="ISO8601", errors="coerce"
+    )
+    naive = ~has_offset & strings.notna()
+    if naive.any():
+        local = pd.to_datetime(strings[naive], format="ISO8601", errors="coerce")
+        local = local.dt.tz_localize(
+            config.TZ,
+            ambiguous=np.zeros(int(naive.sum()), dtype=bool),
+            nonexistent="NaT",
+        )
+        result.loc[naive] = local.dt.tz_convert("UTC")
+
+    leftovers = result.isna() & values.notna()
+    if leftovers.any():
+        result.loc[leftovers] = [
+            ensure_utc(parse_timestamp(v)) for v in values[leftovers]
+        ]
+    return result
+
+
+def to_float_series(values: pd.Series) -> pd.Series:
+    """Coerce a column to float64; unparseable entries become 0.0 like the per-row path."""
+    numeric = pd.to_numeric(values, errors="coerce").astype("float64")
+    return numeric.mask(numeric.isna() & values.notna(), 0.0)
+
+
+def normalize_consumption_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Turn a parsed CSV DataFrame into a typed column batch ready for loading.
+
+    The result has columns ``ts`` (datetime64, UTC), ``kwh`` and ``price_eur_per_kwh``
+    (float64), matching `CONSUMPTION_COLUMNS` minus the customer id.
+    """
+    return pd.DataFrame(
+        {
+            "ts": to_utc_series(df["Časovna Značka (CEST/CET)"]),
+            "kwh": to_float_series(df["Poraba [kWh]"]),
+            "price_eur_per_kwh": to_float_series(df["Dinamične Cene [EUR/kWh]"]),
+        }
+    )
+
+
+def build_consumption_rows(batch: pd.DataFrame, customer_id: int) -> list[tuple]:
+    """Build insert payload tuples (see `CONSUMPTION_COLUMNS`) from a normalized batch.
+
+    `batch` is the output of `normalize_consumption_frame`.
+    """
+    return list(
+        zip(
+            [customer_id] * len(batch),
+            pd.DatetimeIndex(batch["ts"]).to_pydatetime(),
+            batch["kwh"].tolist(),
+            batch["price_eur_per_kwh"].tolist(),
+        )
+    )
+
+
+def iter_consumption_rows(
+    chunks: Iterable[pd.DataFrame], customer_id: int
+) -> Iterator[tuple]:
+    """Lazily normalize parsed CSV chunks into payload tuples for the bulk loaders.
 
-    with get_db() as db:
-        stmt = pg_insert(models.ConsumptionRecord).values(records)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["customer_id", "ts"],
-            set_={
-                "kwh": stmt.excluded.kwh,
-                "price_eur_per_kwh": stmt.excluded.price_eur_per_kwh,
-            },
+    Repeated timestamps within a chunk keep their last row; the loaders apply the
+    same rule across chunks.
+    """
+    for chunk in chunks:
+        batch = normalize_consumption_frame(chunk).drop_duplicates(
+            subset="ts", keep="last"
         )
-        db.execute(stmt)
-        db.commit()
-        print(f"Upserted {len(records)} consumption_records")
+        yield from build_consumption_rows(batch, customer_id)
+
+
+def content_hash(content: bytes) -> str:
+    """Return the SHA-256 hex digest identifying an uploaded file."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def find_import_batch(db, customer_id: int, digest: str) -> models.ImportBatch | None:
+    """Return the earlier import of the same file for this customer, if any."""
+    return db.execute(
+        select(models.ImportBatch).filter_by(customer_id=customer_id, content_hash=digest)
+    ).scalar_one_or_none()
+
+
+async def was_imported_async(db, customer_name: str, digest: str) -> bool:
+    """True if the file with `digest` was already loaded for the named customer."""
+    q = (
+        select(models.ImportBatch.id)
+        .join(models.Customer, models.Customer.id == models.ImportBatch.customer_id)
+        .filter(models.Customer.name == customer_name)
+        .filter(models.ImportBatch.content_hash == digest)
+        .limit(1)
+    )
+    return (await db.scalar(q)) is not None
+
+
+def record_import_batch(
+    db, customer_id: int, digest: str, rows: int, result: "UpsertResult"
+) -> None:
+    """Remember that the file with `digest` was loaded for this customer.
+
+    Runs in the caller's transaction on `db`; the caller commits.
+    """
+    stmt = pg_insert(models.ImportBatch).values(
+        customer_id=customer_id,
+        content_hash=digest,
+        rows=rows,
+        inserted=result.inserted,
+        updated=result.updated,
+    )
+    stmt = stmt.on_conflict_do_nothing(index_elements=["customer_id", "content_hash"])
+    db.execute(stmt)
+
+
+class UpsertResult(NamedTuple):
+    """Outcome of a bulk upsert into consumption_records.
+
+    `updated` counts rows whose kwh or price actually changed; rows re-sent with the
+    same values are `unchanged` and left untouched.
+    """
+
+    inserted: int
+    updated: int
+    unchanged: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+
+def local_month(ts: datetime) -> date:
+    """First day of the config.TZ month containing the aware timestamp `ts`."""
+    return ts.astimezone(pytz.timezone(config.TZ)).date().replace(day=1)
+
+
+def mark_dirty_months(db, buckets: Iterable[tuple[int, date]]) -> None:
+    """Record (customer_id, month) buckets whose readings changed, for re-pricing.
+
+    Runs in the caller's transaction on `db`.
+    """
+    rows = [{"customer_id": c, "month": m} for c, m in set(buckets)]
+    if rows:
+        db.execute(pg_insert(models.DirtyMonth).on_conflict_do_nothing(), rows)
+
+
+class _CopyStream(io.TextIOBase):
+    """Lazily renders row tuples as CSV for ``COPY ... FROM STDIN``.
+
+    Only about `batch_rows` rows are materialized as text at any time, so the whole
+    file never has to be held in memory as one statement or one string. psycopg2
+    replaces an exception raised from `read` with QueryCanceled, so the original is
+    kept in `error` for the caller to re-raise.
+    """
+
+    def __init__(self, rows: Iterable[tuple], batch_rows: int = 5000):
+        self._rows = iter(rows)
+        self._batch_rows = batch_rows
+        self._buf = ""
+        self.rows_sent = 0
+        self.error: Exception | None = None
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> bool:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        n = 0
+        for customer_id, ts, kwh, price in islice(self._rows, self._batch_rows):
+            writer.writerow((customer_id, ts.isoformat(), float(kwh), float(price)))
+            n += 1
+        self.rows_sent += n
+        self._buf += out.getvalue()
+        return n > 0
+
+    def read(self, size: int | None = -1) -> str:
+        try:
+            return self._read(size)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def _read(self, size: int | None) -> str:
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            chunk, self._buf = self._buf, ""
+            return chunk
+        while len(self._buf) < size and self._fill():
+            pass
+        chunk, self._buf = self._buf[:size], self._buf[size:]
+        return chunk
+
+
+_STAGING_DDL = """
+CREATE TEMP TABLE consumption_staging (
+    seq bigint GENERATED ALWAYS AS IDENTITY,
+    customer_id integer NOT NULL,
+    ts timestamptz NOT NULL,
+    kwh double precision NOT NULL,
+    price_eur_per_kwh double precision NOT NULL
+) ON COMMIT DROP
+"""
+
+_STAGING_COPY = (
+    "COPY consumption_staging (customer_id, ts, kwh, price_eur_per_kwh) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+# New rows are told apart from updates by probing consumption_records before the
+# merge: RETURNING cannot read xmax from a partitioned table. Rows whose values did
+# not change are skipped, so every returned row is a real change and its
+# (customer, local month) is marked dirty in the same statement. A (customer_id,
+# ts) staged more than once keeps its last row (highest seq), since ON CONFLICT
+# cannot affect the same row twice in one statement.
+_STAGING_MERGE = """
+WITH staged AS (
+    SELECT DISTINCT ON (s.customer_id, s.ts)
+           s.customer_id, s.ts, s.kwh, s.price_eur_per_kwh, r.ts IS NULL AS is_new
+    FROM consumption_staging s
+    LEFT JOIN consumption_records r ON r.customer_id = s.customer_id AND r.ts = s.ts
+    ORDER BY s.customer_id, s.ts, s.seq DESC
+),
+merged AS (
+    INSERT INTO consumption_records (customer_id, ts, kwh, price_eur_per_kwh)
+    SELECT customer_id, ts, kwh, price_eur_per_kwh FROM staged
+    ON CONFLICT (customer_id, ts) DO UPDATE
+    SET kwh = EXCLUDED.kwh,
+        price_eur_per_kwh = EXCLUDED.price_eur_per_kwh
+    WHERE (consumption_records.kwh, consumption_records.price_eur_per_kwh)
+          IS DISTINCT FROM (EXCLUDED.kwh, EXCLUDED.price_eur_per_kwh)
+    RETURNING customer_id, ts
+),
+dirty AS (
+    INSERT INTO dirty_months (customer_id, month)
+    SELECT DISTINCT customer_id, date_trunc('month', timezone(%(tz)s, ts))::date
+    FROM merged
+    ON CONFLICT DO NOTHING
+)
+SELECT count(*) FILTER (WHERE s.is_new), count(*) FILTER (WHERE NOT s.is_new)
+FROM merged m
+JOIN staged s USING (customer_id, ts)
+"""
+
+
+def refresh_derived_tables(db, spans: dict) -> None:
+    """Bring tables derived from consumption_records up to date for the given spans."""
+    refresh_monthly_rollup(db, spans)
+    if config.PACKED_STORAGE:
+        refresh_packed_days(db, spans)
+
+
+def copy_upsert_consumption_records(db, rows: Iterable[tuple]) -> UpsertResult:
+    """Stream rows into a temp staging table with COPY and merge them in one statement.
+
+    Runs inside the caller's transaction on `db` and refreshes the derived tables (see
+    `refresh_derived_tables`) for the span covered by `rows`.
+    """
+    spans: dict = {}
+    stream = _CopyStream(track_spans(rows, spans))
+    with db.connection().connection.cursor() as cur:
+        cur.execute(_STAGING_DDL)
+        try:
+            cur.copy_expert(_STAGING_COPY, stream)
+        except psycopg2.Error:
+            # e.g. a ValueError from CSV validation while the rows were streamed
+            if stream.error is not None:
+                raise stream.error
+            raise
+        if spans:
+            ensure_partitions(
+                db,
+                min(lo for lo, _ in spans.values()),
+                max(hi for _, hi in spans.values()),
+            )
+        cur.execute(_STAGING_MERGE, {"tz": config.TZ})
+        inserted, updated = cur.fetchone()
+        # drop now rather than on commit so several loads can share one transaction
+        cur.execute("DROP TABLE consumption_staging")
+    refresh_derived_tables(db, spans)
+    return UpsertResult(
+        inserted=inserted,
+        updated=updated,
+        unchanged=stream.rows_sent - inserted - updated,
+    )
+
+
+# Same probe-then-merge as _STAGING_MERGE, over one page of VALUES.
+_BATCH_UPSERT = """
+WITH page (customer_id, ts, kwh, price_eur_per_kwh) AS (VALUES %s),
+staged AS (
+    SELECT p.*, r.ts IS NULL AS is_new
+    FROM page p
+    LEFT JOIN consumption_records r ON r.customer_id = p.customer_id AND r.ts = p.ts
+),
+merged AS (
+    INSERT INTO consumption_records (customer_id, ts, kwh, price_eur_per_kwh)
+    SELECT customer_id, ts, kwh, price_eur_per_kwh FROM staged
+    ON CONFLICT (customer_id, ts) DO UPDATE
+    SET kwh = EXCLUDED.kwh,
+        price_eur_per_kwh = EXCLUDED.price_eur_per_kwh
+    WHERE (consumption_records.kwh, consumption_records.price_eur_per_kwh)
+          IS DISTINCT FROM (EXCLUDED.kwh, EXCLUDED.price_eur_per_kwh)
+    RETURNING customer_id, ts
+)
+SELECT m.customer_id, m.ts, s.is_new
+FROM merged m
+JOIN staged s USING (customer_id, ts)
+"""
+
+
+def batched_upsert_consumption_records(
+    db,
+    rows: Iterable[tuple],
+    batch_size: int,
+    commit_each_batch: bool = False,
+    progress: Callable[[int], None] | None = None,
+) -> UpsertResult:
+    """Upsert rows in pages of `batch_size` with ``execute_values``.
+
+    Only one page is held in memory at a time. With `commit_each_batch` every page is
+    committed on its own, together with the derived tables for its span, which keeps
+    row locks short at the cost of partial imports on failure. Otherwise the derived
+    tables are refreshed once after the last page. `progress` is called with the
+    running row count after each page. Months with changed readings are marked dirty
+    with each page.
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive")
+
+    spans: dict = {}
+    it = track_spans(rows, spans)
+    inserted = updated = unchanged = 0
+    while page := list(islice(it, batch_size)):
+        page_rows = len(page)
+        # last row per (customer_id, ts) within the page; later pages overwrite
+        page = list({(row[0], row[1]): row for row in page}.values())
+        page_ts = [row[1] for row in page]
+        ensure_partitions(db, min(page_ts), max(page_ts))
+        with db.connection().connection.cursor() as cur:
+            changed = execute_values(
+                cur, _BATCH_UPSERT, page, page_size=len(page), fetch=True
+            )
+        page_inserted = sum(1 for *_, was_inserted in changed if was_inserted)
+        inserted += page_inserted
+        updated += len(changed) - page_inserted
+        unchanged += page_rows - len(changed)
+        mark_dirty_months(db, ((c, local_month(ts)) for c, ts, _ in changed))
+        if commit_each_batch:
+            # a later failure must not leave committed pages without their rollup
+            refresh_derived_tables(db, spans)
+            spans.clear()
+            db.commit()
+        if progress is not None:
+            progress(inserted + updated + unchanged)
+    refresh_derived_tables(db, spans)
+    return UpsertResult(inserted=inserted, updated=updated, unchanged=unchanged)
+
+
+def insert_or_update_consumption_records(
+    rows: Iterable[tuple],
+    mode: str | None = None,
+    batch_size: int | None = None,
+    commit: str | None = None,
+    progress: Callable[[int], None] | None = None,
+    db=None,
+) -> UpsertResult:
+    """Insert or update consumption records in bulk.
+
+    `rows` are tuples in `CONSUMPTION_COLUMNS` order, as built by `build_consumption_rows`.
+    Existing (customer_id, ts) rows get their kwh and price overwritten, and every
+    (customer, local month) that actually changed is marked in dirty_months. `mode`,
+    `batch_size` and `commit` default to `IMPORT_LOADER`, `IMPORT_BATCH_SIZE` and
+    `IMPORT_COMMIT` from `app.config`. Given the caller's session `db`, the load
+    joins its transaction and the caller commits (chunk commits still happen).
+    """
+    mode = mode or config.IMPORT_LOADER
+    commit = commit or config.IMPORT_COMMIT
+    if mode not in ("copy", "batched"):
+        raise ValueError(f"Unknown import loader mode: {mode}")
+    if commit not in ("file", "chunk"):
+        raise ValueError(f"Unknown import commit mode: {commit}")
+
+    owns_session = db is None
+    with use_db(db) as db:
+        if mode == "copy":
+            result = copy_upsert_consumption_records(db, rows)
+            if progress is not None:
+                progress(result.total)
+        else:
+            result = batched_upsert_consumption_records(
+                db,
+                rows,
+                batch_size or config.IMPORT_BATCH_SIZE,
+                commit_each_batch=commit == "chunk",
+                progress=progress,
+            )
+        if owns_session:
+            db.commit()
+    return result
@@ -1,5 +1,7 @@
-from contextlib import contextmanager
-from app.db.session import SessionLocal
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import AsyncSessionLocal, SessionLocal
 
 
 @contextmanager
@@ -9,3 +11,34 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def use_db(db=None):
+    """Yield `db` when the caller already has a session, else a new one from get_db()."""
+    if db is not None:
+        yield db
+    else:
+        with get_db() as new_db:
+            yield new_db
+
+
+@asynccontextmanager
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def request_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency: one session, connection and transaction per request.
+
+    Helpers called with this session only flush; the transaction is committed
+    once the handler returns and rolled back if it raises.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
@@ -1,11 +1,26 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from starlette.staticfiles import StaticFiles
 
+from app.db.session import async_engine
 from app.routers import imports, customers, invoices
+from app.services.pdf import render_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # starting and stopping worker processes blocks; keep it off the event loop
+    await asyncio.to_thread(render_pool.start)
+    yield
+    await asyncio.to_thread(render_pool.shutdown)
+    await async_engine.dispose()
+
 
-app = FastAPI(title="Electricity Billing")
+app = FastAPI(title="Electricity Billing", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 templates = Jinja2Templates(directory="app/templates")
@@ -1,15 +1,19 @@
 """Customer-related routes and helper functions."""
 
-from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from app.deps import get_db
+from app import config
+from app.deps import get_async_db, request_db, use_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models import Customer
-from typing import cast
 from sqlalchemy import select, func
-from app.db.models import ConsumptionRecord
-from sqlalchemy import extract
-from app import config
+from app.db.models import ConsumptionMonthly
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy import literal_column
+from app.services.customer_cache import customer_ids, remember_after_commit
+from app.services import series
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -20,18 +24,11 @@ def is_hx(request: Request) -> bool:
 
 
 @router.get("", response_class=HTMLResponse)
-def list_customers(request: Request) -> HTMLResponse:
+async def list_customers(
+    request: Request, db: AsyncSession = Depends(request_db)
+) -> HTMLResponse:
     """List all customers with their consumption months."""
-    try:
-        with get_db() as db:
-            customers = db.execute(select(Customer)).scalars().all()
-            customers_data = []
-            for c in customers:
-                cid = cast(int, c.id)
-                months = get_customer_months(cid)
-                customers_data.append({"id": cid, "name": c.name, "months": months})
-    except Exception:
-        customers_data = []
+    customers_data = await get_customers_with_months_async(db)
 
     tmpl = "customers/_table.html" if is_hx(request) else "customers/list.html"
     return templates.TemplateResponse(
@@ -44,129 +41,229 @@ def list_customers(request: Request) -> HTMLResponse:
 
 
 @router.get("/count", response_class=PlainTextResponse)
-def customers_count() -> PlainTextResponse:
+async def customers_count(db: AsyncSession = Depends(request_db)) -> PlainTextResponse:
     """Return total number of customers as plain text."""
     try:
-        with get_db() as db:
-            total = db.scalar(select(func.count()).select_from(Customer)) or 0
+        total = await db.scalar(select(func.count()).select_from(Customer)) or 0
     except Exception:
         total = 0
     return PlainTextResponse(str(total))
 
 
-# Helper functions
+async def stream_series_rows(q, batch_rows: int = 1000):
+    """Yield lists of result rows of `q` from a server-side cursor.
 
+    Uses its own session: the request's session is closed before a streamed body
+    is sent.
+    """
+    async with get_async_db() as db:
+        result = await db.stream(q)
+        async for rows in result.partitions(batch_rows):
+            yield rows
 
-def customer_exists_by_name(customer_name: str) -> bool:
-    """Return True if a customer with the given name exists, else False."""
-    print(f"Checking if customer exists by name: {customer_name}")
+
+@router.get("/{customer_id}/series")
+async def customer_series(
+    customer_id: int,
+    start: datetime,
+    end: datetime,
+    resolution: str = "auto",
+    format: str = "json",
+    max_points: int | None = None,
+    db: AsyncSession = Depends(request_db),
+) -> StreamingResponse:
+    """kWh and cost of one customer over [start, end), bucketed in local time.
+
+    `resolution` is "15min", "hour", "day", "month" or "auto" (the finest one within
+    the point budget); naive `start`/`end` are local time. `max_points` may lower,
+    but not raise, SERIES_MAX_POINTS. `format` is "json" or "arrow" (IPC stream).
+    """
+    budget = min(max_points or config.SERIES_MAX_POINTS, config.SERIES_MAX_POINTS)
+    if budget <= 0:
+        raise HTTPException(status_code=400, detail="max_points must be positive")
+    if resolution != "auto" and resolution not in series.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    if format not in ("json", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'arrow'")
     try:
-        with get_db() as db:
-            exists = (
-                db.execute(select(Customer).filter_by(name=customer_name)).first()
-                is not None
+        start, end = series.local_bounds(start, end)
+        if resolution == "auto":
+            resolution = series.choose_resolution(start, end, budget)
+        elif series.estimate_points(start, end, resolution) > budget:
+            raise ValueError(
+                f"More than {budget} points at {resolution} resolution; "
+                "use a coarser resolution or a shorter range"
             )
-            print(f"Exists: {exists}")
-    except Exception as e:
-        print(f"Exception in customer_exists_by_name: {e}")
-        exists = False
-    return exists
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if await db.scalar(select(Customer.id).filter_by(id=customer_id)) is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    rows = stream_series_rows(
+        series.series_query(customer_id, start, end, resolution, budget)
+    )
+    if format == "arrow":
+        return StreamingResponse(
+            series.encode_arrow(rows),
+            media_type="application/vnd.apache.arrow.stream",
+            headers={"X-Series-Resolution": resolution},
+        )
+    meta = {
+        "customer_id": customer_id,
+        "resolution": resolution,
+        "tz": config.TZ,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+    }
+    return StreamingResponse(
+        series.encode_json(meta, rows), media_type="application/json"
+    )
 
 
-def get_customer_id_by_name(customer_name: str) -> int | None:
-    """Return customer id if found, else None."""
-    print(f"Getting customer by name: {customer_name}")
-    try:
-        with get_db() as db:
-            customer = db.execute(
-                select(Customer).filter_by(name=customer_name)
-            ).scalar_one_or_none()
-            print(f"Customer: {customer}")
-            return cast(int, customer.id) if customer else None
-    except Exception as e:
-        print(f"Exception in get_customer_id_by_name: {e}")
-        return None
+# Helper functions
 
 
-def create_customer(customer_name: str) -> int | None:
-    """Create a customer and return its id, or None on failure."""
-    print(f"Creating customer with name: {customer_name}")
-    try:
-        with get_db() as db:
-            customer = Customer(name=customer_name)
-            db.add(customer)
+# Each sync helper takes an optional `db`; pass the caller's session to run in its
+# connection and transaction instead of checking out a new one.
+
+
+def customer_upsert_query(customer_name: str):
+    """Get-or-create in one statement, returning (id, inserted).
+
+    The no-op DO UPDATE makes a conflicting insert return the existing row's id;
+    uq_customers_name keeps concurrent imports from creating duplicates.
+    """
+    stmt = pg_insert(Customer).values(name=customer_name)
+    return stmt.on_conflict_do_update(
+        index_elements=[Customer.name], set_={"name": stmt.excluded.name}
+    ).returning(Customer.id, literal_column("xmax = 0").label("inserted"))
+
+
+def get_or_create_customer_id(customer_name: str, db=None) -> int:
+    """Return the named customer's id, creating the customer if needed.
+
+    Served from the process-local cache when possible. Commits its own session;
+    with a caller's `db` it joins that transaction and the id is cached only once
+    the caller commits.
+    """
+    customer_id = customer_ids.get(customer_name)
+    if customer_id is not None:
+        return customer_id
+    owns_session = db is None
+    with use_db(db) as db:
+        customer_id, inserted = db.execute(customer_upsert_query(customer_name)).one()
+        # a row inserted inside a savepoint may still be rolled back with it
+        if not inserted or not db.in_nested_transaction():
+            remember_after_commit(db, customer_name, customer_id)
+        if owns_session:
             db.commit()
-            db.refresh(customer)
-            print(f"Created customer with id: {customer.id}")
-            return customer.id  # type: ignore
+    return customer_id
+
+
+def customers_with_months_query():
+    """Select (id, name, months) for every customer in a single query.
+
+    Months are sorted 'YYYY-MM' strings of local (config.TZ) wall time from the
+    consumption_monthly rollup; customers without records get NULL.
+    """
+    month = ConsumptionMonthly.month
+    return (
+        select(
+            Customer.id,
+            Customer.name,
+            func.array_agg(
+                aggregate_order_by(func.to_char(month, "YYYY-MM"), month)
+            )
+            .filter(month.is_not(None))
+            .label("months"),
+        )
+        .outerjoin(ConsumptionMonthly, ConsumptionMonthly.customer_id == Customer.id)
+        .group_by(Customer.id, Customer.name)
+        .order_by(Customer.id)
+    )
+
+
+# Async helpers for the request handlers. They run on the request's session
+# (see `request_db`) and leave committing to it; the sync ones above are for
+# import jobs and scripts that run outside the event loop.
+
+
+async def get_customers_with_months_async(db: AsyncSession) -> list[dict]:
+    """Return every customer as {"id", "name", "months"}."""
+    rows = (await db.execute(customers_with_months_query())).all()
+    return [{"id": cid, "name": name, "months": list(ms or [])} for cid, name, ms in rows]
+
+
+async def get_customer_id_by_name_async(
+    db: AsyncSession, customer_name: str
+) -> int | None:
+    """Return the named customer's id or None, served from the name -> id cache."""
+    customer_id = customer_ids.get(customer_name)
+    if customer_id is not None:
+        return customer_id
+    try:
+        customer_id = await db.scalar(select(Customer.id).filter_by(name=customer_name))
+        if customer_id is not None:
+            remember_after_commit(db.sync_session, customer_name, customer_id)
+        return customer_id
     except Exception as e:
-        print(f"Exception in create_customer: {e}")
+        print(f"Exception in get_customer_id_by_name_async: {e}")
         return None
 
 
-def get_customer_months(customer_id: int) -> list[str]:
-    """Return a sorted list of month strings 'YYYY-MM' for which the customer has consumption records.
-    Returns an empty list on error or if no records found.
+async def create_customer_async(db: AsyncSession, customer_name: str) -> int | None:
+    """Create a customer and return its id; None if the name is taken.
+
+    The request commits.
     """
+    stmt = (
+        pg_insert(Customer)
+        .values(name=customer_name)
+        .on_conflict_do_nothing(index_elements=[Customer.name])
+        .returning(Customer.id)
+    )
     try:
-        with get_db() as db:
-            # Extract year and month from ts adjusted to configured timezone so months
-            # reflect local wall time rather than UTC storage.
-            local_ts = func.timezone(config.TZ, ConsumptionRecord.ts)
-            q = (
-                select(
-                    extract("year", local_ts).label("y"),
-                    extract("month", local_ts).label("m"),
-                )
-                .filter(ConsumptionRecord.customer_id == customer_id)
-                .group_by("y", "m")
-                .order_by("y", "m")
-            )
-            rows = db.execute(q).all()
-            months = []
-            for y, m in rows:
-                # extract() may return Decimal/float depending on DB driver; convert to int
-                try:
-                    yi = int(y)
-                    mi = int(m)
-                except Exception:
-                    continue
-                months.append(f"{yi:04d}-{mi:02d}")
-            return months
+        return await db.scalar(stmt)
     except Exception as e:
-        print(f"Exception in get_customer_months: {e}")
-        return []
+        print(f"Exception in create_customer_async: {e}")
+        return None
 
 
 # Route wrappers for helper functions
 
 
 @router.get("/exists/{customer_name}", response_class=PlainTextResponse)
-def customer_exists_route(customer_name: str) -> PlainTextResponse:
-    """calls customer_exists_by_name"""
+async def customer_exists_route(
+    customer_name: str, db: AsyncSession = Depends(request_db)
+) -> PlainTextResponse:
+    """calls get_customer_id_by_name_async"""
     print(f"Route: check if customer exists: {customer_name}")
-    exists = customer_exists_by_name(customer_name)
+    exists = await get_customer_id_by_name_async(db, customer_name) is not None
     print(f"Route result: {exists}")
     return PlainTextResponse("1" if exists else "0")
 
 
 @router.get("/{customer_name}", response_class=PlainTextResponse)
-def get_customer_route(customer_name: str) -> PlainTextResponse:
-    """calls get_customer_id_by_name"""
+async def get_customer_route(
+    customer_name: str, db: AsyncSession = Depends(request_db)
+) -> PlainTextResponse:
+    """calls get_customer_id_by_name_async"""
     print(f"Route: get customer id by name: {customer_name}")
-    cid = get_customer_id_by_name(customer_name)
+    cid = await get_customer_id_by_name_async(db, customer_name)
     print(f"Route result: {cid}")
     return PlainTextResponse(str(cid) if cid is not None else "")
 
 
 @router.post("/create", response_class=PlainTextResponse)
-def create_customer_route(name: str) -> PlainTextResponse:
-    """calls create_customer"""
+async def create_customer_route(
+    name: str, db: AsyncSession = Depends(request_db)
+) -> PlainTextResponse:
+    """calls create_customer_async"""
     print(f"Route: create customer with name: {name}")
-    if customer_exists_by_name(name):
+    if await get_customer_id_by_name_async(db, name) is not None:
         print("Customer already exists.")
         return PlainTextResponse("exists")
-    cid = create_customer(name)
+    cid = await create_customer_async(db, name)
     if cid is None:
         print("Failed to create customer.")
         return PlainTextResponse("")
@@ -1,28 +1,39 @@
 """Routes for importing consumption data from CSV files."""
 
-from fastapi import APIRouter, Request, UploadFile, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, Request, UploadFile, Form, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from app.services import billing
+from app.services.uploads import create_upload_store
+from app.services.jobs import ImportJob, import_jobs
+from app.services.batch_import import run_batch_import
+from dataclasses import asdict
 import os
+import zipfile
 import pandas as pd
-import uuid
+from typing import BinaryIO, Callable
+from app import config
 from app.db.utils import (
     insert_or_update_consumption_records,
-    parse_timestamp,
-    ensure_utc,
-)
-from app.routers.customers import (
-    customer_exists_by_name,
-    create_customer,
-    get_customer_id_by_name,
+    build_consumption_rows,
+    iter_consumption_rows,
+    normalize_consumption_frame,
+    content_hash,
+    find_import_batch,
+    was_imported_async,
+    record_import_batch,
+    UpsertResult,
 )
+from app.deps import get_db, request_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.routers.customers import get_or_create_customer_id
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
-# in-memory store to hold uploaded file bytes between preview -> commit
-TEMP_UPLOADS = {}
+# staged, already-parsed uploads between preview -> commit
+upload_store = create_upload_store()
 
 
 def is_hx(request: Request) -> bool:
@@ -40,7 +51,7 @@ async def preview(request: Request, file: UploadFile):
     """Handle uploaded CSV file, parse and validate it, and show a preview."""
     content = await file.read()
     try:
-        df = billing.parse_csv(content)
+        df = await run_in_threadpool(billing.parse_csv, content)
     except Exception as e:
         frag = (
             f'<div class="p-3 bg-red-50 border border-red-300 rounded">Error: {e}</div>'
@@ -51,9 +62,18 @@ async def preview(request: Request, file: UploadFile):
     end = df["Časovna Značka (CEST/CET)"].max()
     customer = os.path.splitext(file.filename)[0]  # type: ignore
 
-    # persist raw bytes in-memory and return a token the client will send to commit()
-    token = str(uuid.uuid4())
-    TEMP_UPLOADS[token] = content
+    # normalize once here so commit can load the typed batch directly
+    batch = await run_in_threadpool(normalize_consumption_frame, df)
+    batch.attrs["content_hash"] = content_hash(content)
+
+    # stage the batch and return a token the client will send to commit()
+    try:
+        token = await run_in_threadpool(upload_store.put, batch)
+    except ValueError as e:
+        frag = (
+            f'<div class="p-3 bg-red-50 border border-red-300 rounded">Error: {e}</div>'
+        )
+        return HTMLResponse(frag, status_code=413)
 
     ctx = {
         "request": request,
@@ -68,8 +88,8 @@ async def preview(request: Request, file: UploadFile):
 
 
 @router.post("/commit", response_class=HTMLResponse)
-async def commit(request: Request):
-    """Commit the previously previewed upload to the database."""
+async def commit(request: Request, db: AsyncSession = Depends(request_db)):
+    """Queue the previously previewed upload for loading and return its job fragment."""
     try:
         body = await request.json()
     except Exception:
@@ -81,59 +101,135 @@ async def commit(request: Request):
     if not token or not customer:
         raise HTTPException(status_code=400, detail="Missing upload token or customer")
 
-    # Look up the previously uploaded bytes by token (in-memory)
-    if token not in TEMP_UPLOADS:
+    # Look up the batch parsed, validated and normalized during preview
+    batch = await run_in_threadpool(upload_store.pop, token)
+    if batch is None:
         raise HTTPException(status_code=400, detail="Upload token not found or expired")
-    content = TEMP_UPLOADS.pop(token)
-
-    # already validated, no need to try/except
-    df = billing.parse_csv(content)
-
-    save_df_to_db(df, customer)
 
-    return HTMLResponse(
-        '<div class="p-3 bg-green-50 border border-green-300 rounded">Import complete.</div>'
+    digest = batch.attrs.get("content_hash")
+    if digest:
+        if await was_imported_async(db, customer, digest):
+            # nothing to load; answer without occupying an import worker
+            job = ImportJob(
+                id="", customer=customer, total_rows=len(batch), status="done"
+            )
+            return templates.TemplateResponse(
+                "imports/_job.html", {"request": request, "job": job}
+            )
+
+    job = import_jobs.submit(
+        customer,
+        len(batch),
+        lambda progress: save_df_to_db(batch, customer, progress, digest),
     )
+    return templates.TemplateResponse(
+        "imports/_job.html", {"request": request, "job": job}, status_code=202
+    )
+
 
+@router.post("/batch")
+async def batch_import(files: list[UploadFile]) -> JSONResponse:
+    """Import many CSVs and/or ZIP archives of CSVs at once.
 
-def save_df_to_db(df: pd.DataFrame, customer_name: str):
-    """Save the given DataFrame to the database, creating the customer if needed."""
-    customer_id = None
-    if customer_exists_by_name(customer_name):
-        customer_id = get_customer_id_by_name(customer_name)
-    else:
-        customer_id = create_customer(customer_name)
-
-    if customer_id is None:
-        raise RuntimeError("Failed to get or create customer")
-
-    # add customer_id to each record
-    records = df.to_dict(orient="records")
-
-    rows_to_insert = []
-    for record in records:
-        ts_raw = record.get("Časovna Značka (CEST/CET)")
-        ts = parse_timestamp(ts_raw)
-        ts = ensure_utc(ts)
-        kwh = record.get("Poraba [kWh]")
-        price = record.get("Dinamične Cene [EUR/kWh]")
-
-        # ensure numeric
-        try:
-            kwh = float(kwh) if kwh is not None and kwh != "" else 0.0
-        except Exception:
-            kwh = 0.0
-        try:
-            price = float(price) if price is not None and price != "" else 0.0
-        except Exception:
-            price = 0.0
-
-        row = {
-            "customer_id": customer_id,
-            "ts": ts,
-            "kwh": kwh,
-            "price_eur_per_kwh": price,
+    Each CSV's customer is derived from its file name, as in `preview`.
+    """
+    uploads = [(f.filename or "", await f.read()) for f in files]
+    try:
+        summaries = await run_in_threadpool(run_batch_import, uploads)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ZIP archive: {e}")
+    return JSONResponse({"files": [asdict(s) for s in summaries]})
+
+
+@router.post("/stream")
+async def stream_import(file: UploadFile, customer: str | None = Form(None)):
+    """Import a (possibly very large) CSV without preview, parsing it in chunks.
+
+    The upload is read incrementally from its spool file, so memory use does not grow
+    with file size. The customer defaults to the file's base name, as in `preview`.
+    """
+    customer = customer or os.path.splitext(file.filename or "")[0]
+    if not customer:
+        raise HTTPException(status_code=400, detail="Missing customer")
+    try:
+        result = await run_in_threadpool(save_stream_to_db, file.file, customer)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(
+        {
+            "customer": customer,
+            "inserted": result.inserted,
+            "updated": result.updated,
+            "unchanged": result.unchanged,
         }
-        rows_to_insert.append(row)
+    )
+
 
-    insert_or_update_consumption_records(rows_to_insert)
+@router.get("/jobs/{job_id}")
+def job_status(request: Request, job_id: str):
+    """Report progress of a background import; HTMX gets a self-polling fragment."""
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if is_hx(request):
+        return templates.TemplateResponse(
+            "imports/_job.html", {"request": request, "job": job}
+        )
+    return JSONResponse(job.to_dict())
+
+
+def save_df_to_db(
+    batch: pd.DataFrame,
+    customer_name: str,
+    progress: Callable[[int], None] | None = None,
+    digest: str | None = None,
+) -> UpsertResult | None:
+    """Save a normalized batch to the database, creating the customer if needed.
+
+    `batch` comes from `normalize_consumption_frame`; like `run_batch_import`, the
+    last occurrence of a repeated timestamp wins. `progress` is called with the
+    number of rows written so far. When `digest` (see `content_hash`) matches a file
+    already imported for this customer nothing is loaded and None is returned.
+    """
+    with get_db() as db:
+        customer_id = resolve_customer_id(customer_name, db)
+        if digest and find_import_batch(db, customer_id, digest) is not None:
+            return None
+
+        deduped = batch.drop_duplicates(subset="ts", keep="last")
+        rows_to_insert = build_consumption_rows(deduped, customer_id)
+        result = insert_or_update_consumption_records(
+            rows_to_insert, progress=progress, db=db
+        )
+        if digest:
+            record_import_batch(db, customer_id, digest, len(batch), result)
+        db.commit()
+    return result
+
+
+def save_stream_to_db(
+    source: BinaryIO,
+    customer_name: str,
+    progress: Callable[[int], None] | None = None,
+) -> UpsertResult:
+    """Parse a CSV file object chunk by chunk and feed the rows straight to the loader.
+
+    Peak memory is bounded by `IMPORT_STREAM_CHUNK_ROWS` rather than by file size.
+    The last occurrence of a repeated timestamp wins, also across chunks. A chunk that fails validation aborts the import; with ``IMPORT_COMMIT=chunk``
+    earlier pages stay committed.
+    """
+    with get_db() as db:
+        customer_id = resolve_customer_id(customer_name, db)
+        chunks = billing.iter_csv_chunks(source, config.IMPORT_STREAM_CHUNK_ROWS)
+        rows = iter_consumption_rows(chunks, customer_id)
+        result = insert_or_update_consumption_records(rows, progress=progress, db=db)
+        db.commit()
+    return result
+
+
+def resolve_customer_id(customer_name: str, db=None) -> int:
+    """Return the id of the named customer, creating the customer if needed.
+
+    With `db` the upsert runs in the caller's transaction.
+    """
+    return get_or_create_customer_id(customer_name, db)
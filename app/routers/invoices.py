@@ -1,175 +1,380 @@
 """Invoice-related endpoints."""
 
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import APIRouter, Depends, Request, Form
+from fastapi import HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from app.services.pdf import render_invoice_pdf_bytes
+from app.services.pdf import RenderQueueFull, render_pool
+from app.services.pdf_cache import get_pdf_cache, pdf_cache_key
+from app.services.invoice_run import (
+    invoice_context,
+    month_period,
+    run_monthly_invoices,
+)
 import io
-from app.deps import get_db
+from app.deps import request_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from app.db.models import ConsumptionRecord, Invoice, Customer
-from sqlalchemy import select, func
-from datetime import datetime, timezone
+from sqlalchemy import select, func, update
+from datetime import date, datetime
+import pytz
+from app.db.rollup import get_customer_month_async
+from typing import NamedTuple
+import math
+from app import config
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
-def parse_year_month(year_month: str) -> tuple[str, str]:
-    """Parse a "YYYY-MM" string into (period_start, period_end) ISO 8601 strings."""
-    try:
-        y_str, m_str = year_month.split("-")
-        y = int(y_str)
-        m = int(m_str)
-        from datetime import datetime
-
-        period_start_dt = datetime(y, m, 1)
-        # compute first day of next month
-        if m == 12:
-            period_end_dt = datetime(y + 1, 1, 1)
-        else:
-            period_end_dt = datetime(y, m + 1, 1)
-        return period_start_dt.isoformat(), period_end_dt.isoformat()
-    except Exception:
-        return "", ""
-
+async def save_invoice_async(db, customer_id, ps, pe, total) -> int:
+    """Add an invoice for the naive local period [ps, pe) and return its ID.
 
-def attach_timezone_to_period(
-    period_start, period_end
-) -> tuple[datetime | None, datetime | None]:
-    """Attach local (system) timezone info to the period_start and period_end"""
-    try:
-        # interpret the YYYY-MM timestamps as local (system) timezone-aware datetimes
-        if period_start:
-            naive_ps = datetime.fromisoformat(period_start)
-        else:
-            naive_ps = None
-        if period_end:
-            naive_pe = datetime.fromisoformat(period_end)
-        else:
-            naive_pe = None
-
-        if naive_ps or naive_pe:
-            local_tz = datetime.now().astimezone().tzinfo
-        ps = naive_ps.replace(tzinfo=local_tz) if naive_ps else None
-        pe = naive_pe.replace(tzinfo=local_tz) if naive_pe else None
-    except Exception as e:
-        print(f"failed to parse/attach tz to period start/end: {e}")
-        ps = pe = None
-    return ps, pe
-
-
-def save_invoice(db, customer_id, ps, pe, total) -> int:
-    """Save an invoice record to the DB and return its ID."""
+    Flushes only; the request commits.
+    """
     invoice = Invoice(
-        customer_id=customer_id,
-        period_start=ps or datetime.now(timezone.utc),
-        period_end=pe or datetime.now(timezone.utc),
-        total_eur=total,
+        customer_id=customer_id, period_start=ps, period_end=pe, total_eur=total
     )
     db.add(invoice)
-    db.commit()
-    db.refresh(invoice)
+    await db.flush()
     return invoice.id  # type: ignore
 
 
+async def find_identical_invoice_async(
+    db, customer_id, period_start: datetime, period_end: datetime, total: float
+) -> tuple[int, str] | None:
+    """Return (id, pdf_key) of the latest rendered invoice that matches, if any.
+
+    A match has the same customer and period and the same total to the cent.
+    """
+    q = (
+        select(Invoice.id, Invoice.pdf_key)
+        .filter(
+            Invoice.customer_id == customer_id,
+            Invoice.period_start == period_start,
+            Invoice.period_end == period_end,
+            func.abs(Invoice.total_eur - total) < 0.005,
+            Invoice.pdf_key.is_not(None),
+        )
+        .order_by(Invoice.id.desc())
+        .limit(1)
+    )
+    row = (await db.execute(q)).first()
+    return (row.id, row.pdf_key) if row else None
+
+
+def pdf_response(invoice_id: int, pdf_bytes: bytes) -> StreamingResponse:
+    return StreamingResponse(
+        io.BytesIO(pdf_bytes),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="invoice_{invoice_id}.pdf"'},
+    )
+
+
+class InvoiceTotals(NamedTuple):
+    """Aggregates of a customer's consumption over one billing period.
+
+    Peak demand is in kW of a 15-minute reading (kWh * 4): the period's maximum and
+    the average of its three highest readings.
+    """
+
+    total_eur: float
+    records: int
+    total_kwh: float
+    first_ts: datetime | None
+    last_ts: datetime | None
+    peak_kw: float | None = None
+    peak_top3_kw: float | None = None
+
+
+def _optional_float(value) -> float | None:
+    return None if value is None else float(value)
+
+
+def local_period_bounds_utc(
+    period_start: datetime, period_end: datetime
+) -> tuple[datetime, datetime]:
+    """Interpret naive period boundaries as config.TZ wall time and convert to UTC."""
+    tz = pytz.timezone(config.TZ)
+    return (
+        tz.localize(period_start).astimezone(pytz.UTC),
+        tz.localize(period_end).astimezone(pytz.UTC),
+    )
+
+
+def _rollup_row_totals(row) -> InvoiceTotals | None:
+    if row is None:
+        return None
+    return InvoiceTotals(
+        float(row.cost_eur),
+        int(row.records),
+        float(row.kwh),
+        row.first_ts,
+        row.last_ts,
+        _optional_float(row.peak_kw),
+        _optional_float(row.peak_top3_kw),
+    )
+
+
+async def rollup_invoice_totals_async(
+    db, customer_id, month: date
+) -> InvoiceTotals | None:
+    """Read a full local month's totals from consumption_monthly, if present."""
+    return _rollup_row_totals(await get_customer_month_async(db, customer_id, month))
+
+
+def invoice_totals_query(customer_id, ps_utc, pe_utc):
+    """Select the `InvoiceTotals` columns for one period."""
+    in_period = (
+        ConsumptionRecord.customer_id == customer_id,
+        ConsumptionRecord.ts >= ps_utc,
+        ConsumptionRecord.ts < pe_utc,
+    )
+    top3 = (
+        select(ConsumptionRecord.kwh)
+        .filter(*in_period)
+        .order_by(ConsumptionRecord.kwh.desc())
+        .limit(3)
+        .subquery()
+    )
+    return select(
+        func.coalesce(
+            func.sum(ConsumptionRecord.kwh * ConsumptionRecord.price_eur_per_kwh), 0.0
+        ),
+        func.count(),
+        func.coalesce(func.sum(ConsumptionRecord.kwh), 0.0),
+        func.min(ConsumptionRecord.ts),
+        func.max(ConsumptionRecord.ts),
+        func.max(ConsumptionRecord.kwh) * 4,
+        select(func.avg(top3.c.kwh) * 4).scalar_subquery(),
+    ).filter(*in_period)
+
+
+def _totals_from_row(row) -> InvoiceTotals:
+    total, records, kwh, first_ts, last_ts, peak, peak_top3 = row
+    return InvoiceTotals(
+        float(total),
+        int(records),
+        float(kwh),
+        first_ts,
+        last_ts,
+        _optional_float(peak),
+        _optional_float(peak_top3),
+    )
+
+
+async def compute_invoice_totals_async(
+    db, customer_id, ps_utc, pe_utc
+) -> InvoiceTotals:
+    """Aggregate the period in one SQL query over ix_consumption_customer_ts."""
+    q = invoice_totals_query(customer_id, ps_utc, pe_utc)
+    return _totals_from_row((await db.execute(q)).one())
+
+
+def compute_invoice_totals_python(db, customer_id, ps_utc, pe_utc) -> InvoiceTotals:
+    """Reference implementation: fetch every row and add them up in Python."""
+    q = select(
+        ConsumptionRecord.kwh,
+        ConsumptionRecord.price_eur_per_kwh,
+        ConsumptionRecord.ts,
+    ).filter(
+        ConsumptionRecord.customer_id == customer_id,
+        ConsumptionRecord.ts >= ps_utc,
+        ConsumptionRecord.ts < pe_utc,
+    )
+    total = 0.0
+    total_kwh = 0.0
+    records = 0
+    timestamps = []
+    readings = []
+    for kwh, price, ts in db.execute(q).all():
+        try:
+            kwh_f = float(kwh)
+            price_f = float(price)
+        except Exception:
+            continue
+        total += kwh_f * price_f
+        total_kwh += kwh_f
+        records += 1
+        timestamps.append(ts)
+        readings.append(kwh_f)
+    top3 = sorted(readings, reverse=True)[:3]
+    return InvoiceTotals(
+        total,
+        records,
+        total_kwh,
+        min(timestamps) if timestamps else None,
+        max(timestamps) if timestamps else None,
+        top3[0] * 4 if top3 else None,
+        sum(top3) / len(top3) * 4 if top3 else None,
+    )
+
+
+def _peaks_close(a: float | None, b: float | None) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def verify_invoice_totals(sql: InvoiceTotals, python: InvoiceTotals) -> bool:
+    """Compare SQL and Python aggregates; report and return False on mismatch."""
+    ok = (
+        sql.records == python.records
+        and sql.first_ts == python.first_ts
+        and sql.last_ts == python.last_ts
+        and math.isclose(sql.total_eur, python.total_eur, rel_tol=1e-9, abs_tol=1e-9)
+        and math.isclose(sql.total_kwh, python.total_kwh, rel_tol=1e-9, abs_tol=1e-9)
+        and _peaks_close(sql.peak_kw, python.peak_kw)
+        and _peaks_close(sql.peak_top3_kw, python.peak_top3_kw)
+    )
+    if not ok:
+        print(f"Invoice totals mismatch: sql={sql} python={python}")
+    return ok
+
+
+@router.post("/run")
+async def run_invoices(
+    year_month: str = Form(...),
+    output: str = Form("zip"),
+    rebill: bool = Form(False),
+) -> JSONResponse:
+    """Invoice every customer for year_month (YYYY-MM) into INVOICES_DIR.
+
+    `output` is "zip" for one archive or "dir" for a directory of PDFs. Returns
+    the run report with throughput and per-customer failures.
+    """
+    if output not in ("zip", "dir"):
+        raise HTTPException(status_code=400, detail="output must be 'zip' or 'dir'")
+    try:
+        report = await run_in_threadpool(
+            run_monthly_invoices,
+            year_month,
+            as_zip=output == "zip",
+            skip_invoiced=not rebill,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(report.to_dict())
+
+
 @router.post("/{customer_id}", response_class=HTMLResponse)
 async def create_invoice(
     request: Request,
     customer_id: int,
     year_month: str = Form(...),
+    db: AsyncSession = Depends(request_db),
 ) -> StreamingResponse:
     """Create an invoice for the given customer ID and year_month (YYYY-MM)."""
-    period_start, period_end = parse_year_month(year_month)
-    ps, pe = attach_timezone_to_period(period_start, period_end)
+    try:
+        # naive local month bounds, as stored on invoices by every writer
+        period_start, period_end = month_period(year_month)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    total = 0.0
     customer_name = f"Customer {customer_id}"
-    with get_db() as db:
-        cust = db.execute(
-            select(Customer).filter_by(id=customer_id)
-        ).scalar_one_or_none()
-        if cust:
-            customer_name = cust.name
-
-        if ps and pe:
-            # convert local-aware period boundaries to UTC for DB comparisons
-            try:
-                ps_utc = ps.astimezone(timezone.utc)
-                pe_utc = pe.astimezone(timezone.utc)
-            except Exception:
-                ps_utc = ps
-                pe_utc = pe
-
-            q = select(
-                ConsumptionRecord.kwh,
-                ConsumptionRecord.price_eur_per_kwh,
-                ConsumptionRecord.ts,
-            ).filter(
-                ConsumptionRecord.customer_id == customer_id,
-                ConsumptionRecord.ts >= ps_utc,
-                ConsumptionRecord.ts < pe_utc,
-            )
-            rows = db.execute(q).all()
-            for kwh, price, ts in rows:
-                try:
-                    kwh_f = float(kwh)
-                    price_f = float(price)
-                    line_amount = kwh_f * price_f
-                    total += line_amount
-                except Exception:
-                    continue
-
-            invoice_id = save_invoice(db, customer_id, ps, pe, total)
-
-    # render PDF bytes and stream them back to the user
-    context = {
-        "invoice_number": invoice_id,
-        "customer_name": customer_name,
-        "period_start": period_start,
-        "period_end": period_end,
-        "total": round(total, 2),
-    }
-    pdf_bytes = render_invoice_pdf_bytes(context)
-    return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename="invoice_{invoice_id}.pdf"'},
+    name = await db.scalar(select(Customer.name).filter_by(id=customer_id))
+    if name:
+        customer_name = name
+
+    # month boundaries in config.TZ, converted to UTC for DB comparisons
+    ps_utc, pe_utc = local_period_bounds_utc(period_start, period_end)
+
+    totals = await rollup_invoice_totals_async(db, customer_id, period_start.date())
+    if totals is None:
+        totals = await compute_invoice_totals_async(db, customer_id, ps_utc, pe_utc)
+    if config.INVOICE_VERIFY_TOTALS:
+        python_totals = await db.run_sync(
+            compute_invoice_totals_python, customer_id, ps_utc, pe_utc
+        )
+        verify_invoice_totals(totals, python_totals)
+    total = totals.total_eur
+    peak_kw, peak_top3_kw = totals.peak_kw, totals.peak_top3_kw
+
+    # an identical earlier invoice is served from the PDF cache, not re-rendered
+    identical = await find_identical_invoice_async(
+        db, customer_id, period_start, period_end, total
+    )
+    if identical is not None:
+        cached = await run_in_threadpool(get_pdf_cache().get, identical[1])
+        if cached is not None:
+            return pdf_response(identical[0], cached)
+
+    invoice_id = await save_invoice_async(
+        db, customer_id, period_start, period_end, total
+    )
+
+    # a new invoice number means a new PDF: render it, cache it for
+    # GET /invoices/{id}/pdf and later identical requests, and stream it back
+    context = invoice_context(
+        invoice_id,
+        customer_name,
+        period_start,
+        period_end,
+        total,
+        peak_kw,
+        peak_top3_kw,
     )
+    try:
+        pdf_bytes = await render_pool.render(context)
+    except RenderQueueFull as e:
+        # raising rolls the request transaction back, so no invoice is left behind
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "5"}
+        )
+    pdf_key = pdf_cache_key(context)
+    await run_in_threadpool(get_pdf_cache().put, pdf_key, pdf_bytes)
+    await db.execute(update(Invoice).filter_by(id=invoice_id).values(pdf_key=pdf_key))
+    return pdf_response(invoice_id, pdf_bytes)
+
+
+@router.get("/{invoice_id}/pdf")
+async def invoice_pdf(
+    invoice_id: int, db: AsyncSession = Depends(request_db)
+) -> StreamingResponse:
+    """Serve an invoice's PDF from the PDF cache; never re-renders."""
+    pdf_key = await db.scalar(select(Invoice.pdf_key).filter_by(id=invoice_id))
+    pdf_bytes = None
+    if pdf_key:
+        pdf_bytes = await run_in_threadpool(get_pdf_cache().get, pdf_key)
+    if pdf_bytes is None:
+        raise HTTPException(status_code=404, detail="Invoice PDF not available")
+    return pdf_response(invoice_id, pdf_bytes)
 
 
 @router.get("/revenue", response_class=HTMLResponse)
-def invoices_revenue(request: Request) -> HTMLResponse:
+async def invoices_revenue(
+    request: Request, db: AsyncSession = Depends(request_db)
+) -> HTMLResponse:
     """Return total revenue from all invoices as plain text."""
     total_revenue = 0.0
-    with get_db() as db:
-        grp = (
-            select(
-                Invoice.customer_id,
-                Invoice.period_start,
-                Invoice.period_end,
-                func.sum(Invoice.total_eur).label("grp_total"),
-            )
-            .group_by(Invoice.customer_id, Invoice.period_start, Invoice.period_end)
-            .subquery()
+    grp = (
+        select(
+            Invoice.customer_id,
+            Invoice.period_start,
+            Invoice.period_end,
+            func.sum(Invoice.total_eur).label("grp_total"),
         )
+        .group_by(Invoice.customer_id, Invoice.period_start, Invoice.period_end)
+        .subquery()
+    )
 
-        q = select(func.coalesce(func.sum(grp.c.grp_total), 0.0))
-        row = db.execute(q).scalar_one_or_none()
-        try:
-            total_revenue = float(row or 0.0)
-        except Exception:
-            total_revenue = 0.0
+    q = select(func.coalesce(func.sum(grp.c.grp_total), 0.0))
+    row = (await db.execute(q)).scalar_one_or_none()
+    try:
+        total_revenue = float(row or 0.0)
+    except Exception:
+        total_revenue = 0.0
 
     return HTMLResponse(f"{round(total_revenue, 2)} €")
 
 
 @router.get("/count", response_class=HTMLResponse)
-def invoices_count():
+async def invoices_count(db: AsyncSession = Depends(request_db)):
     """Return total number of invoices as plain text."""
     try:
-        with get_db() as db:
-            total = db.scalar(select(func.count()).select_from(Invoice)) or 0
+        total = await db.scalar(select(func.count()).select_from(Invoice)) or 0
     except Exception:
         total = 0
     # return plain text number
@@ -0,0 +1,127 @@
+"""Batch import of many meter CSVs (or ZIP archives of them) in one go."""
+
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+from app import config
+from app.db.utils import (
+    build_consumption_rows,
+    content_hash,
+    copy_upsert_consumption_records,
+    find_import_batch,
+    normalize_consumption_frame,
+    record_import_batch,
+)
+from app.deps import get_db
+from app.routers.customers import get_or_create_customer_id
+from app.services import billing
+
+_parse_pool: ProcessPoolExecutor | None = None
+
+
+@dataclass
+class FileSummary:
+    """Outcome of one file in a batch import."""
+
+    filename: str
+    customer: str
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    status: str = "pending"  # loaded | skipped | failed
+    error: str | None = None
+
+
+def customer_name_from_filename(filename: str) -> str:
+    """Derive the customer name like /imports/preview does: the file's base name."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def expand_uploads(files: list[tuple[str, bytes]]) -> list[tuple[str, bytes]]:
+    """Flatten uploaded files into (filename, bytes) CSVs, unpacking ZIP archives."""
+    out = []
+    for filename, content in files:
+        if not filename.lower().endswith(".zip"):
+            out.append((filename, content))
+            continue
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/"):
+                    continue
+                if name.lower().endswith(".csv"):
+                    out.append((name, zf.read(info)))
+    return out
+
+
+def parse_upload(content: bytes) -> pd.DataFrame:
+    """Parse, validate and normalize one CSV; runs inside the parse process pool."""
+    return normalize_consumption_frame(billing.parse_csv(content))
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=config.IMPORT_PARSE_PROCESSES)
+    return _parse_pool
+
+
+def run_batch_import(files: list[tuple[str, bytes]]) -> list[FileSummary]:
+    """Parse files in parallel, then load them all over one connection and transaction.
+
+    Files are loaded in filename order, so when several files carry the same
+    (customer, timestamp) the row from the file sorting last wins. Within a file the
+    last occurrence of a timestamp wins. Files already imported for their customer
+    (same content hash) are skipped.
+    """
+    files = sorted(expand_uploads(files), key=lambda f: f[0])
+    summaries = [
+        FileSummary(filename=name, customer=customer_name_from_filename(name))
+        for name, _ in files
+    ]
+
+    pool = _get_parse_pool()
+    futures = [pool.submit(parse_upload, content) for _, content in files]
+    batches: list[pd.DataFrame | None] = []
+    for summary, future in zip(summaries, futures):
+        try:
+            batches.append(future.result())
+        except Exception as e:
+            summary.status = "failed"
+            summary.error = str(e)
+            batches.append(None)
+
+    with get_db() as db:
+        for (_, content), summary, batch in zip(files, summaries, batches):
+            if batch is None:
+                continue
+            summary.rows = len(batch)
+            digest = content_hash(content)
+            try:
+                # a savepoint per file keeps one bad file from aborting the rest
+                with db.begin_nested():
+                    customer_id = get_or_create_customer_id(summary.customer, db)
+                    if find_import_batch(db, customer_id, digest) is not None:
+                        summary.status = "skipped"
+                        continue
+                    deduped = batch.drop_duplicates(subset="ts", keep="last")
+                    summary.duplicates = len(batch) - len(deduped)
+                    result = copy_upsert_consumption_records(
+                        db, build_consumption_rows(deduped, customer_id)
+                    )
+                    record_import_batch(db, customer_id, digest, len(batch), result)
+            except Exception as e:
+                summary.status = "failed"
+                summary.error = str(e)
+                continue
+            summary.inserted, summary.updated = result.inserted, result.updated
+            summary.unchanged = result.unchanged
+            summary.status = "loaded"
+        db.commit()
+    return summaries
@@ -2,7 +2,10 @@
 
 from datetime import datetime
 import io
+from typing import BinaryIO, Iterator, NamedTuple
+import numpy as np
 import pandas as pd
+from app import config
 
 
 def validate_csv(df: pd.DataFrame) -> bool:
@@ -24,20 +27,202 @@ def validate_csv(df: pd.DataFrame) -> bool:
     return True
 
 
-def parse_csv(file_bytes: bytes) -> pd.DataFrame:
-    """Parse the uploaded CSV file and return a DataFrame."""
-    df = pd.read_csv(io.BytesIO(file_bytes), sep=";", decimal=",", encoding="utf-8")
+def _read_csv_pyarrow(file_bytes: bytes) -> pd.DataFrame:
+    """Read the CSV with pyarrow using explicit column types.
+
+    Timestamps with a UTC offset are parsed natively into tz-aware UTC values; files
+    with naive local timestamps keep that column as strings for later localization.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    ts_col = "Časovna Značka (CEST/CET)"
+    column_types = {
+        ts_col: pa.timestamp("ns", tz="UTC"),
+        "Poraba [kWh]": pa.float64(),
+        "Dinamične Cene [EUR/kWh]": pa.float64(),
+    }
+    parse_options = pa_csv.ParseOptions(delimiter=";")
+    try:
+        table = pa_csv.read_csv(
+            io.BytesIO(file_bytes),
+            parse_options=parse_options,
+            convert_options=pa_csv.ConvertOptions(
+                decimal_point=",", column_types=column_types
+            ),
+        )
+    except pa.ArrowInvalid:
+        column_types[ts_col] = pa.string()
+        table = pa_csv.read_csv(
+            io.BytesIO(file_bytes),
+            parse_options=parse_options,
+            convert_options=pa_csv.ConvertOptions(
+                decimal_point=",", column_types=column_types
+            ),
+        )
+    return table.to_pandas()
+
+
+def parse_csv(file_bytes: bytes, engine: str | None = None) -> pd.DataFrame:
+    """Parse the uploaded CSV file and return a DataFrame.
+
+    `engine` is "pandas" (default C parser) or "pyarrow"; defaults to
+    `app.config.CSV_ENGINE`.
+    """
+    engine = engine or config.CSV_ENGINE
+    if engine == "pyarrow":
+        df = _read_csv_pyarrow(file_bytes)
+    elif engine == "pandas":
+        df = pd.read_csv(
+            io.BytesIO(file_bytes), sep=";", decimal=",", encoding="utf-8"
+        )
+    else:
+        raise ValueError(f"Unknown CSV engine: {engine}")
     is_valid = validate_csv(df)
     if not is_valid:
         raise ValueError("CSV validation failed")
     return df
 
 
+def iter_csv_chunks(source: BinaryIO, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Parse a CSV file object incrementally, validating each chunk of `chunksize` rows.
+
+    Raises ValueError as soon as a chunk fails validation or if the file has no rows.
+    """
+    with pd.read_csv(
+        source, sep=";", decimal=",", encoding="utf-8", chunksize=chunksize
+    ) as reader:
+        seen_rows = False
+        for chunk in reader:
+            if not validate_csv(chunk):
+                raise ValueError("CSV validation failed")
+            seen_rows = True
+            yield chunk
+    if not seen_rows:
+        raise ValueError("CSV validation failed")
+
+
+class PeriodTotals(NamedTuple):
+    """Per-period aggregates, one array element per requested period."""
+
+    cost: np.ndarray
+    kwh: np.ndarray
+    records: np.ndarray
+
+
+def _as_ns(values) -> tuple[np.ndarray, object]:
+    """Timestamps as int64 ns since the epoch (UTC if tz-aware) plus their tz."""
+    idx = pd.DatetimeIndex(values)
+    return idx.asi8, idx.tz
+
+
+def _check_tz(data_tz, *bounds_tz) -> None:
+    if any((tz is None) != (data_tz is None) for tz in bounds_tz):
+        raise TypeError("Cannot compare tz-naive and tz-aware timestamps")
+
+
+def _cumulative(kwh: np.ndarray, price: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # prefix sums with a leading 0, so a period's total is cum[hi] - cum[lo];
+    # NaN readings count as 0 like pandas' skipna sums
+    n = len(kwh)
+    cost_cum = np.zeros(n + 1)
+    kwh_cum = np.zeros(n + 1)
+    np.nancumsum(kwh * price, out=cost_cum[1:])
+    np.nancumsum(kwh, out=kwh_cum[1:])
+    return cost_cum, kwh_cum
+
+
+def _totals(cost_cum, kwh_cum, lo: np.ndarray, hi: np.ndarray) -> PeriodTotals:
+    hi = np.maximum(hi, lo)  # empty for periods with end < start
+    return PeriodTotals(cost_cum[hi] - cost_cum[lo], kwh_cum[hi] - kwh_cum[lo], hi - lo)
+
+
+def period_totals(
+    ts, kwh, price, starts, ends, inclusive_end: bool = False
+) -> PeriodTotals:
+    """Cost, kWh and record count of every period [starts[i], ends[i]) of one series.
+
+    `ts` should be sorted ascending (it is sorted once otherwise). Each period costs
+    two binary searches into prefix sums, so k periods over n readings take
+    O(n + k log n) with no per-period filtering or copying. With `inclusive_end`
+    readings at exactly ends[i] are included.
+    """
+    t, tz = _as_ns(ts)
+    s, s_tz = _as_ns(starts)
+    e, e_tz = _as_ns(ends)
+    _check_tz(tz, s_tz, e_tz)
+    kwh = np.asarray(kwh, dtype="float64")
+    price = np.asarray(price, dtype="float64")
+    if len(t) > 1 and not (t[1:] >= t[:-1]).all():
+        order = np.argsort(t, kind="stable")
+        t, kwh, price = t[order], kwh[order], price[order]
+
+    cost_cum, kwh_cum = _cumulative(kwh, price)
+    lo = np.searchsorted(t, s, side="left")
+    hi = np.searchsorted(t, e, side="right" if inclusive_end else "left")
+    return _totals(cost_cum, kwh_cum, lo, hi)
+
+
+def customer_period_totals(
+    customer_ids,
+    ts,
+    kwh,
+    price,
+    period_customers,
+    starts,
+    ends,
+    inclusive_end: bool = False,
+) -> PeriodTotals:
+    """`period_totals` over many customers' series stacked in one set of arrays.
+
+    Rows should be sorted by (customer_id, ts) (they are sorted once otherwise);
+    period i covers customer period_customers[i]. Prefix sums are shared by all
+    customers and each customer's rows are a contiguous slice, so the binary
+    searches run on views of that slice.
+    """
+    cust = np.asarray(customer_ids)
+    t, tz = _as_ns(ts)
+    s, s_tz = _as_ns(starts)
+    e, e_tz = _as_ns(ends)
+    _check_tz(tz, s_tz, e_tz)
+    pc = np.asarray(period_customers)
+    if len(pc) == 0:
+        none = np.zeros(0, dtype=np.int64)
+        return _totals(np.zeros(1), np.zeros(1), none, none)
+    kwh = np.asarray(kwh, dtype="float64")
+    price = np.asarray(price, dtype="float64")
+    if len(t) > 1:
+        dc = np.diff(cust)
+        if not ((dc > 0) | ((dc == 0) & (t[1:] >= t[:-1]))).all():
+            order = np.lexsort((t, cust))
+            cust, t, kwh, price = cust[order], t[order], kwh[order], price[order]
+
+    cost_cum, kwh_cum = _cumulative(kwh, price)
+    seg_lo = np.searchsorted(cust, pc, side="left")
+    seg_hi = np.searchsorted(cust, pc, side="right")
+    lo = np.empty(len(pc), dtype=np.int64)
+    hi = np.empty(len(pc), dtype=np.int64)
+    # one pass per distinct customer, over that customer's periods
+    by_customer = np.argsort(pc, kind="stable")
+    _, group_starts = np.unique(pc[by_customer], return_index=True)
+    for sel in np.split(by_customer, group_starts[1:]):
+        first, last = seg_lo[sel[0]], seg_hi[sel[0]]
+        seg = t[first:last]
+        lo[sel] = first + np.searchsorted(seg, s[sel], side="left")
+        hi[sel] = first + np.searchsorted(
+            seg, e[sel], side="right" if inclusive_end else "left"
+        )
+    return _totals(cost_cum, kwh_cum, lo, hi)
+
+
 def compute_total(df, start: datetime, end: datetime) -> tuple[float, int]:
     """Compute the total cost and number of records in the given date range."""
-    mask = (df["timestamp"] >= pd.to_datetime(start)) & (
-        df["timestamp"] <= pd.to_datetime(end)
+    totals = period_totals(
+        df["timestamp"],
+        df["Poraba [kWh]"],
+        df["Dinamične Cene [EUR/kWh]"],
+        pd.to_datetime([start]),
+        pd.to_datetime([end]),
+        inclusive_end=True,
     )
-    sel = df.loc[mask].copy()
-    sel["cost"] = sel["Poraba [kWh]"] * sel["Dinamične Cene [EUR/kWh]"]
-    return float(sel["cost"].sum()), len(sel)
+    return float(totals.cost[0]), int(totals.records[0])
@@ -0,0 +1,60 @@
+"""Process-local cache of customer name -> id lookups."""
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import config
+
+
+class CustomerIdCache:
+    """Bounded LRU map of customer names to ids.
+
+    Customers are never renamed or deleted by the app, so entries do not expire.
+    Only committed ids may be cached (see `remember_after_commit`): an id inserted
+    by a transaction that later rolls back must never be handed out.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> int | None:
+        with self._lock:
+            customer_id = self._entries.get(name)
+            if customer_id is not None:
+                self._entries.move_to_end(name)
+            return customer_id
+
+    def put(self, name: str, customer_id: int) -> None:
+        with self._lock:
+            self._entries[name] = customer_id
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+customer_ids = CustomerIdCache(config.CUSTOMER_ID_CACHE_SIZE)
+
+
+def remember_after_commit(db: Session, name: str, customer_id: int) -> None:
+    """Cache `name` -> `customer_id` once `db`'s transaction commits."""
+    db.info.setdefault("pending_customer_ids", {})[name] = customer_id
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_ids(db: Session) -> None:
+    for name, customer_id in db.info.pop("pending_customer_ids", {}).items():
+        customer_ids.put(name, customer_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_ids(db: Session) -> None:
+    db.info.pop("pending_customer_ids", None)
@@ -0,0 +1,161 @@
+"""Re-price invoices whose month changed after it was invoiced.
+
+The import loaders mark every (customer, local month) whose readings an import
+inserted or changed in dirty_months. ``python -m app.services.invoice_recompute``
+claims those marks, re-prices the affected monthly invoices from the
+consumption_monthly rollup and re-renders only the invoices whose PDF would change;
+every other invoice and its cached PDF is left alone.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date
+
+from sqlalchemy import Date, and_, cast, delete, select, tuple_, update
+
+from app import config
+from app.db.models import ConsumptionMonthly, Customer, DirtyMonth, Invoice
+from app.db.utils import mark_dirty_months
+from app.deps import get_db
+from app.services.invoice_run import InvoiceRunFailure, invoice_context, month_period
+from app.services.pdf import render_invoice_pdf_bytes
+from app.services.pdf_cache import get_pdf_cache, pdf_cache_key
+
+
+@dataclass
+class InvoiceRecomputeReport:
+    """Outcome of one recompute pass over the dirty months."""
+
+    months: int = 0
+    invoices: int = 0
+    repriced: int = 0
+    unchanged: int = 0
+    failures: list[InvoiceRunFailure] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def dirty_invoices_query(months: list[tuple[int, date]]):
+    """Select the monthly invoices of the given (customer_id, month) buckets.
+
+    Each row carries the invoice, the customer name and the month's current rollup
+    figures (cost_eur, peak_kw, peak_top3_kw).
+    """
+    periods = []
+    for customer_id, month in months:
+        period_start, period_end = month_period(f"{month:%Y-%m}")
+        periods.append((customer_id, period_start, period_end))
+    return (
+        select(
+            Invoice.id,
+            Invoice.customer_id,
+            Invoice.period_start,
+            Invoice.period_end,
+            Invoice.total_eur,
+            Invoice.pdf_key,
+            Customer.name,
+            ConsumptionMonthly.cost_eur,
+            ConsumptionMonthly.peak_kw,
+            ConsumptionMonthly.peak_top3_kw,
+        )
+        .join(Customer, Customer.id == Invoice.customer_id)
+        .join(
+            ConsumptionMonthly,
+            and_(
+                ConsumptionMonthly.customer_id == Invoice.customer_id,
+                ConsumptionMonthly.month == cast(Invoice.period_start, Date),
+            ),
+        )
+        .filter(
+            tuple_(Invoice.customer_id, Invoice.period_start, Invoice.period_end).in_(
+                periods
+            )
+        )
+        .order_by(Invoice.id)
+    )
+
+
+def recompute_dirty_invoices(processes: int | None = None) -> InvoiceRecomputeReport:
+    """Re-price and re-render the invoices of every dirty month, then clear the marks.
+
+    An invoice is only touched when the PDF it would get now (same number, current
+    totals, peaks and template) has a different cache key than the one it has. A
+    month whose re-render fails stays dirty for the next run.
+    """
+    started = time.perf_counter()
+    report = InvoiceRecomputeReport()
+    with get_db() as db:
+        # claiming by deleting keeps concurrent imports' new marks for the next run
+        months = db.execute(
+            delete(DirtyMonth).returning(DirtyMonth.customer_id, DirtyMonth.month)
+        ).all()
+        report.months = len(months)
+        rows = db.execute(dirty_invoices_query(months)).all() if months else []
+        report.invoices = len(rows)
+
+        stale = []
+        for row in rows:
+            context = invoice_context(
+                row.id,
+                row.name,
+                row.period_start,
+                row.period_end,
+                row.cost_eur,
+                row.peak_kw,
+                row.peak_top3_kw,
+            )
+            pdf_key = pdf_cache_key(context)
+            same_total = abs(row.total_eur - row.cost_eur) < 0.005
+            if pdf_key == row.pdf_key or (row.pdf_key is None and same_total):
+                report.unchanged += 1
+            else:
+                stale.append((row, context, pdf_key))
+
+        repriced, rendered, failed_months = [], {}, []
+        if stale:
+            with ProcessPoolExecutor(
+                max_workers=processes or config.INVOICE_RENDER_PROCESSES
+            ) as pool:
+                futures = [
+                    pool.submit(render_invoice_pdf_bytes, context)
+                    for _, context, _ in stale
+                ]
+                for (row, _, pdf_key), future in zip(stale, futures):
+                    try:
+                        rendered[pdf_key] = future.result()
+                    except Exception as e:
+                        report.failures.append(
+                            InvoiceRunFailure(row.customer_id, row.name, str(e))
+                        )
+                        failed_months.append((row.customer_id, row.period_start.date()))
+                        continue
+                    repriced.append(
+                        {"id": row.id, "total_eur": row.cost_eur, "pdf_key": pdf_key}
+                    )
+        mark_dirty_months(db, failed_months)
+        if repriced:
+            get_pdf_cache().put_many(rendered)
+            db.execute(update(Invoice), repriced)
+        db.commit()
+
+    report.repriced = len(repriced)
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Re-price invoices of months changed by later imports."
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+    print(json.dumps(recompute_dirty_invoices(args.processes).to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
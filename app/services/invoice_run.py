@@ -0,0 +1,322 @@
+"""Month-end billing: invoice every customer for one local month in a single run.
+
+``python -m app.services.invoice_run YYYY-MM [--zip PATH | --dir PATH]`` or
+``POST /invoices/run``. Totals and peak demand come from the consumption_monthly
+rollup, so re-running a month never rescans consumption_records; PDFs are rendered
+in parallel worker processes and the invoices of all successfully rendered PDFs are
+inserted in one batch.
+"""
+
+import argparse
+import json
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import and_, func, insert, select, text
+
+from app import config
+from app.db.models import ConsumptionMonthly, Customer, Invoice
+from app.deps import get_db
+from app.services.pdf import render_invoice_pdf_bytes
+from app.services.pdf_cache import get_pdf_cache, pdf_cache_key
+
+
+@dataclass
+class InvoiceRunFailure:
+    customer_id: int
+    customer: str
+    error: str
+
+
+@dataclass
+class InvoiceRunReport:
+    """Outcome and timings of one bulk invoice run."""
+
+    year_month: str
+    output: str
+    customers: int = 0
+    invoiced: int = 0
+    skipped: int = 0
+    failures: list[InvoiceRunFailure] = field(default_factory=list)
+    totals_seconds: float = 0.0
+    render_seconds: float = 0.0
+    insert_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def invoices_per_second(self) -> float:
+        return self.invoiced / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {"invoices_per_second": round(self.invoices_per_second, 1)}
+
+
+def month_period(year_month: str) -> tuple[datetime, datetime]:
+    """Naive local [start, end) of a "YYYY-MM" month, as stored on invoices."""
+    try:
+        y, m = (int(part) for part in year_month.split("-"))
+        start = datetime(y, m, 1)
+    except ValueError:
+        raise ValueError(f"Invalid month {year_month!r}, expected YYYY-MM")
+    end = datetime(y + 1, 1, 1) if m == 12 else datetime(y, m + 1, 1)
+    return start, end
+
+
+def month_totals_query(
+    period_start: datetime, period_end: datetime, skip_invoiced: bool
+):
+    """Select (customer_id, name, total_eur, peak_kw, peak_top3_kw) per customer.
+
+    Reads the month's consumption_monthly rows, one per customer with data.
+    """
+    q = (
+        select(
+            Customer.id,
+            Customer.name,
+            ConsumptionMonthly.cost_eur,
+            ConsumptionMonthly.peak_kw,
+            ConsumptionMonthly.peak_top3_kw,
+        )
+        .join(ConsumptionMonthly, ConsumptionMonthly.customer_id == Customer.id)
+        .filter(ConsumptionMonthly.month == period_start.date())
+        .order_by(Customer.id)
+    )
+    if skip_invoiced:
+        q = q.filter(
+            ~select(Invoice.id)
+            .filter(
+                and_(
+                    Invoice.customer_id == Customer.id,
+                    Invoice.period_start == period_start,
+                    Invoice.period_end == period_end,
+                )
+            )
+            .exists()
+        )
+    return q
+
+
+def _round_peak(kw) -> float | None:
+    return None if kw is None else round(float(kw), 2)
+
+
+def invoice_context(
+    invoice_number: int,
+    customer_name: str,
+    period_start: datetime,
+    period_end: datetime,
+    total,
+    peak_kw=None,
+    peak_top3_kw=None,
+) -> dict:
+    """Render context of a monthly invoice, as hashed by `pdf_cache_key`."""
+    return {
+        "invoice_number": invoice_number,
+        "customer_name": customer_name,
+        "period_start": period_start.isoformat(),
+        "period_end": period_end.isoformat(),
+        "total": round(float(total or 0.0), 2),
+        "peak_kw": _round_peak(peak_kw),
+        "peak_top3_kw": _round_peak(peak_top3_kw),
+    }
+
+
+def _reserve_invoice_ids(db, n: int) -> list[int]:
+    # ids are drawn up front so each PDF can carry its invoice number before the
+    # row exists; ids of failed renders are simply never used
+    return list(
+        db.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence('invoices', 'id')) "
+                "FROM generate_series(1, :n)"
+            ),
+            {"n": n},
+        ).scalars()
+    )
+
+
+def _render_in_order(
+    pool: ProcessPoolExecutor, contexts: list[dict], ahead: int
+) -> Iterator[Future]:
+    """Yield a render future per context, in order, with at most `ahead` in flight.
+
+    Only the PDFs of that window are held at once, however many invoices a run has.
+    """
+    pending: deque[Future] = deque()
+    for context in contexts:
+        pending.append(pool.submit(render_invoice_pdf_bytes, context))
+        if len(pending) >= ahead:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+class _Output:
+    """Adds rendered PDFs to a ZIP archive or a directory.
+
+    An existing archive is appended to, so a re-run that skips invoiced customers
+    keeps the month's earlier PDFs; a file that is already there is never replaced.
+    """
+
+    def __init__(self, path: Path, as_zip: bool):
+        self.path = path
+        if as_zip:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # PDFs are already compressed
+            self._zip = zipfile.ZipFile(path, "a", compression=zipfile.ZIP_STORED)
+            self._names = set(self._zip.namelist())
+        else:
+            path.mkdir(parents=True, exist_ok=True)
+            self._zip = None
+
+    def write(self, filename: str, data: bytes) -> None:
+        if self._zip is not None:
+            if filename in self._names:
+                raise FileExistsError(f"{filename} is already in {self.path}")
+            self._zip.writestr(filename, data)
+            self._names.add(filename)
+        else:
+            with open(self.path / filename, "xb") as f:
+                f.write(data)
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+
+
+def run_monthly_invoices(
+    year_month: str,
+    output: str | Path | None = None,
+    as_zip: bool = True,
+    skip_invoiced: bool = True,
+    processes: int | None = None,
+) -> InvoiceRunReport:
+    """Invoice every customer with consumption in `year_month` and write the PDFs.
+
+    `output` defaults to ``INVOICES_DIR/invoices_YYYY-MM.zip`` (or the directory
+    ``INVOICES_DIR/YYYY-MM``); PDFs are added to what is already there. Customers
+    already invoiced for the same period are skipped unless `skip_invoiced` is
+    False. A customer whose PDF fails to render or cannot be written gets no
+    invoice row and is listed in the report's failures.
+
+    Each PDF goes to the PDF cache as soon as it is rendered and the invoice rows are
+    inserted at the end in one short transaction. The cache keeps at most
+    PDF_CACHE_MAX_BYTES: PDFs it evicts are not re-rendered, so
+    ``GET /invoices/{id}/pdf`` answers 404 for them and the run's output is the only
+    copy. Size the cache for at least one month's run.
+    """
+    started = time.perf_counter()
+    period_start, period_end = month_period(year_month)
+    if output is None:
+        name = f"invoices_{year_month}.zip" if as_zip else year_month
+        output = config.INVOICES_DIR / name
+    report = InvoiceRunReport(year_month=year_month, output=str(output))
+
+    with get_db() as db:
+        t0 = time.perf_counter()
+        rows = db.execute(
+            month_totals_query(period_start, period_end, skip_invoiced)
+        ).all()
+        if skip_invoiced:
+            report.skipped = (
+                db.scalar(
+                    select(func.count(func.distinct(Invoice.customer_id)))
+                    .filter_by(period_start=period_start, period_end=period_end)
+                )
+                or 0
+            )
+        report.customers = len(rows)
+        invoice_ids = _reserve_invoice_ids(db, len(rows)) if rows else []
+        # no transaction is held open while rendering
+        db.commit()
+    report.totals_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    contexts = [
+        invoice_context(
+            invoice_id,
+            row.name,
+            period_start,
+            period_end,
+            row.cost_eur,
+            row.peak_kw,
+            row.peak_top3_kw,
+        )
+        for invoice_id, row in zip(invoice_ids, rows)
+    ]
+    invoices = []
+    pdf_cache = get_pdf_cache()
+    workers = processes or config.INVOICE_RENDER_PROCESSES
+    out = _Output(Path(output), as_zip)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = _render_in_order(pool, contexts, ahead=2 * workers)
+            for invoice_id, context, row, future in zip(
+                invoice_ids, contexts, rows, futures
+            ):
+                try:
+                    pdf_bytes = future.result()
+                    out.write(f"invoice_{invoice_id}.pdf", pdf_bytes)
+                except Exception as e:
+                    report.failures.append(InvoiceRunFailure(row.id, row.name, str(e)))
+                    continue
+                pdf_key = pdf_cache_key(context)
+                pdf_cache.put(pdf_key, pdf_bytes)
+                invoices.append(
+                    {
+                        "id": invoice_id,
+                        "customer_id": row.id,
+                        "period_start": period_start,
+                        "period_end": period_end,
+                        "total_eur": float(row.cost_eur or 0.0),
+                        "pdf_key": pdf_key,
+                    }
+                )
+    finally:
+        out.close()
+    report.render_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if invoices:
+        with get_db() as db:
+            db.execute(insert(Invoice), invoices)
+            db.commit()
+    report.insert_seconds = time.perf_counter() - t0
+
+    report.invoiced = len(invoices)
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Invoice all customers for a month.")
+    parser.add_argument("year_month", help="local month to bill, YYYY-MM")
+    dest = parser.add_mutually_exclusive_group()
+    dest.add_argument("--zip", type=Path, help="write PDFs into this ZIP archive")
+    dest.add_argument("--dir", type=Path, help="write PDFs into this directory")
+    parser.add_argument(
+        "--rebill",
+        action="store_true",
+        help="also invoice customers already invoiced for this month",
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    report = run_monthly_invoices(
+        args.year_month,
+        output=args.dir or args.zip,
+        as_zip=args.dir is None,
+        skip_invoiced=not args.rebill,
+        processes=args.processes,
+    )
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
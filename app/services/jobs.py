@@ -0,0 +1,114 @@
+"""Background import jobs run on a worker pool, off the event loop."""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from app import config
+
+
+@dataclass
+class ImportJob:
+    """Progress and outcome of one background import."""
+
+    id: str
+    customer: str
+    total_rows: int
+    status: str = "queued"  # queued -> running -> done | failed
+    rows_processed: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    result: Any = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.rows_processed / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "customer": self.customer,
+            "status": self.status,
+            "total_rows": self.total_rows,
+            "rows_processed": self.rows_processed,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Runs import callables on a thread pool and keeps their state for polling.
+
+    Job state lives in this process, so status polls must reach the worker that
+    accepted the job. Finished jobs are forgotten after `retention_seconds`.
+    """
+
+    def __init__(self, max_workers: int, retention_seconds: float):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="import-job"
+        )
+        self._jobs: dict[str, ImportJob] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [
+            j.id
+            for j in self._jobs.values()
+            if j.finished and (j.finished_at or 0) < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    def submit(
+        self,
+        customer: str,
+        total_rows: int,
+        fn: Callable[[Callable[[int], None]], Any],
+    ) -> ImportJob:
+        """Queue `fn(progress)` and return its job; `fn` reports rows via `progress`."""
+        job = ImportJob(id=uuid.uuid4().hex, customer=customer, total_rows=total_rows)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> ImportJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: ImportJob, fn: Callable[[Callable[[int], None]], Any]) -> None:
+        def progress(rows: int) -> None:
+            job.rows_processed = rows
+
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(progress)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+
+import_jobs = JobQueue(config.IMPORT_WORKERS, config.IMPORT_JOB_RETENTION_SECONDS)
@@ -1,15 +1,119 @@
 """PDF generation services."""
 
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from weasyprint import HTML
+
+from app import config
 
 env = Environment(
-    loader=FileSystemLoader("app/templates"), autoescape=select_autoescape()
+    loader=FileSystemLoader(Path(__file__).resolve().parent.parent / "templates"),
+    autoescape=select_autoescape(),
 )
 
 
 def render_invoice_pdf_bytes(context: dict) -> bytes | None:
     """Render invoice template to PDF bytes (no file I/O)."""
+    # imported here so the app and CLIs load without WeasyPrint's native libraries;
+    # render workers pay for it once, in `warm_renderer`
+    from weasyprint import HTML
+
     template = env.get_template("invoices/invoice.html")
     html = template.render(**context)
     return HTML(string=html).write_pdf()
+
+
+def warm_renderer() -> None:
+    """Pay WeasyPrint's one-off costs (fontconfig, default CSS, template) up front."""
+    render_invoice_pdf_bytes(
+        {
+            "invoice_number": 0,
+            "customer_name": "warm-up",
+            "period_start": "",
+            "period_end": "",
+            "total": 0.0,
+        }
+    )
+
+
+WARM_UP_TIMEOUT = 120
+
+
+def _ready(barrier) -> None:
+    # returns only once every worker holds one of these tasks, i.e. has finished
+    # its initializer
+    barrier.wait(timeout=WARM_UP_TIMEOUT)
+
+
+class RenderQueueFull(Exception):
+    """No render slot became free within the caller's wait limit."""
+
+
+class PdfRenderPool:
+    """Renders invoices in pre-warmed worker processes, off the event loop.
+
+    At most `workers + queue_depth` renders are in flight; further callers wait up
+    to `wait_seconds` for a slot and then get `RenderQueueFull`, so overload turns
+    into fast 503s instead of an unbounded backlog.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, wait_seconds: float):
+        self.workers = workers
+        self.wait_seconds = wait_seconds
+        self._slots = asyncio.Semaphore(workers + queue_depth)
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start and warm every worker process; blocking, called once at app startup.
+
+        Each worker runs `warm_renderer` as its initializer. One `_ready` task per
+        worker, all waiting on a shared barrier, makes the executor spawn every
+        worker and returns only after all of them are warm.
+        """
+        with self._lock:
+            if self._executor is None:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=warm_renderer
+                )
+                with multiprocessing.Manager() as manager:
+                    barrier = manager.Barrier(self.workers)
+                    futures = [
+                        executor.submit(_ready, barrier) for _ in range(self.workers)
+                    ]
+                    for future in futures:
+                        future.result()
+                self._executor = executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    async def render(self, context: dict) -> bytes:
+        """Render an invoice PDF in a worker, waiting for a free slot if needed."""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.wait_seconds)
+        except asyncio.TimeoutError:
+            raise RenderQueueFull("PDF rendering is at capacity, try again shortly")
+        try:
+            if self._executor is None:
+                await asyncio.to_thread(self.start)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, render_invoice_pdf_bytes, context
+            )
+        finally:
+            self._slots.release()
+
+
+render_pool = PdfRenderPool(
+    config.PDF_RENDER_WORKERS,
+    config.PDF_RENDER_QUEUE_DEPTH,
+    config.PDF_RENDER_WAIT_SECONDS,
+)
@@ -0,0 +1,192 @@
+"""Content-addressed cache of rendered invoice PDFs.
+
+A PDF is stored under the SHA-256 of its render context plus the invoice
+template's version, so identical invoices are rendered once and a template change
+invalidates every entry. Invoices remember their key in ``invoices.pdf_key``.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import config
+from app.db.models import InvoicePdf
+from app.deps import get_db
+
+INVOICE_TEMPLATE = (
+    Path(__file__).resolve().parent.parent / "templates" / "invoices" / "invoice.html"
+)
+
+
+@functools.cache
+def template_version(path: Path = INVOICE_TEMPLATE) -> str:
+    """Short hash of the invoice template source, read once per process."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+
+
+def pdf_cache_key(context: dict) -> str:
+    """Cache key of the PDF rendered from `context` with the current template.
+
+    The context includes the invoice number printed on the PDF, so a new invoice
+    never shares a key with an earlier one; re-requesting an identical invoice
+    reuses the earlier invoice and its key instead (see
+    `app.routers.invoices.find_identical_invoice_async`).
+    """
+    payload = json.dumps(
+        {"template": template_version(), "context": context},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class PdfCache(ABC):
+    """Interface for PDF cache backends, keyed by `pdf_cache_key`."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Return the cached PDF and mark it recently used, or None."""
+
+    @abstractmethod
+    def put_many(self, items: dict[str, bytes]) -> None:
+        """Store PDFs by key, then evict least recently used entries past the limit."""
+
+    def put(self, key: str, data: bytes) -> None:
+        self.put_many({key: data})
+
+
+class DiskPdfCache(PdfCache):
+    """Stores each PDF as ``<key[:2]>/<key>.pdf``; file mtime tracks last use.
+
+    The directory's total size is scanned on the first put and then kept up to date
+    per write; the directory is only listed again when an eviction is due, which
+    also corrects for entries written or removed by other processes.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._total: int | None = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put_many(self, items: dict[str, bytes]) -> None:
+        added = 0
+        for key, data in items.items():
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                added -= path.stat().st_size
+            except FileNotFoundError:
+                pass
+            tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            added += len(data)
+        with self._lock:
+            if self._total is None:
+                self._evict()
+            else:
+                self._total += added
+                if self._total > self.max_bytes:
+                    self._evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.directory.glob("*/*.pdf"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._total = total
+
+
+class DbPdfCache(PdfCache):
+    """Stores PDFs as bytea rows in invoice_pdfs, shared by every app instance."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> bytes | None:
+        with get_db() as db:
+            data = db.scalar(
+                update(InvoicePdf)
+                .filter_by(key=key)
+                .values(last_used=func.now())
+                .returning(InvoicePdf.data)
+            )
+            db.commit()
+        return data
+
+    def put_many(self, items: dict[str, bytes]) -> None:
+        if not items:
+            return
+        rows = [{"key": k, "data": v, "size": len(v)} for k, v in items.items()]
+        stmt = pg_insert(InvoicePdf)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[InvoicePdf.key], set_={"last_used": func.now()}
+        )
+        # running total from the most recently used entry; drop what spills over
+        running = (
+            select(
+                InvoicePdf.key,
+                func.sum(InvoicePdf.size)
+                .over(order_by=(InvoicePdf.last_used.desc(), InvoicePdf.key))
+                .label("running"),
+            )
+        ).subquery()
+        with get_db() as db:
+            db.execute(stmt, rows)
+            db.execute(
+                delete(InvoicePdf).filter(
+                    InvoicePdf.key.in_(
+                        select(running.c.key).filter(running.c.running > self.max_bytes)
+                    )
+                )
+            )
+            db.commit()
+
+
+def create_pdf_cache() -> PdfCache:
+    """Build the PDF cache selected by `app.config.PDF_CACHE`."""
+    if config.PDF_CACHE == "disk":
+        return DiskPdfCache(config.PDF_CACHE_DIR, config.PDF_CACHE_MAX_BYTES)
+    if config.PDF_CACHE == "db":
+        return DbPdfCache(config.PDF_CACHE_MAX_BYTES)
+    raise ValueError(f"Unknown PDF cache: {config.PDF_CACHE}")
+
+
+@functools.cache
+def get_pdf_cache() -> PdfCache:
+    """The process's PDF cache, built on first use."""
+    return create_pdf_cache()
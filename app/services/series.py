@@ -0,0 +1,233 @@
+"""Downsampled consumption series for charts.
+
+Buckets are local (config.TZ) 15-minute slots, hours, days or months, always
+covering only readings in [start, end). Everything is aggregated in SQL
+(``date_bin`` / zoned ``date_trunc``); months wholly inside the range come from the
+consumption_monthly rollup, and the number of buckets is capped by a point budget
+so only that many rows ever leave the database.
+"""
+
+import io
+import json
+import math
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator
+
+import pytz
+from sqlalchemy import (
+    DateTime,
+    and_,
+    cast,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    union_all,
+)
+
+from app import config
+from app.db.models import ConsumptionMonthly, ConsumptionRecord
+
+# Finest first; months are counted separately in `estimate_points`.
+RESOLUTIONS = {
+    "15min": timedelta(minutes=15),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "month": None,
+}
+
+COLUMNS = ("ts", "kwh", "cost_eur")
+
+
+def local_bounds(start: datetime, end: datetime) -> tuple[datetime, datetime]:
+    """Return [start, end) as aware config.TZ datetimes; naive input is local time."""
+    tz = pytz.timezone(config.TZ)
+    bounds = []
+    for dt in (start, end):
+        bounds.append(tz.localize(dt) if dt.tzinfo is None else dt.astimezone(tz))
+    if bounds[0] >= bounds[1]:
+        raise ValueError("start must be before end")
+    return bounds[0], bounds[1]
+
+
+def _month_span(start: datetime, end: datetime) -> tuple[date, date]:
+    # first and last local month overlapping [start, end)
+    last = (end - timedelta(microseconds=1)).date()
+    return start.date().replace(day=1), last.replace(day=1)
+
+
+def estimate_points(start: datetime, end: datetime, resolution: str) -> int:
+    """Upper bound on the buckets in [start, end) at `resolution` (local bounds)."""
+    step = RESOLUTIONS[resolution]
+    if step is None:
+        first, last = _month_span(start, end)
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    # whole-day buckets may start before `start`; DST adds at most one hour
+    span = end - start + timedelta(hours=1)
+    return math.ceil(span / step) + (resolution == "day")
+
+
+def choose_resolution(start: datetime, end: datetime, max_points: int) -> str:
+    """Finest resolution whose bucket count fits in `max_points`."""
+    for resolution in RESOLUTIONS:
+        if estimate_points(start, end, resolution) <= max_points:
+            return resolution
+    raise ValueError(f"Range needs more than {max_points} points even at month level")
+
+
+def _zoned_trunc(field: str, ts):
+    # arguments are rendered inline so the SELECT and GROUP BY expressions match
+    return func.date_trunc(
+        literal(field, literal_execute=True),
+        ts,
+        literal(config.TZ, literal_execute=True),
+    )
+
+
+def _records_query(customer_id: int, bucket, *ranges: tuple[datetime, datetime]):
+    ts = ConsumptionRecord.ts
+    bucket = bucket.label("bucket")
+    cost = ConsumptionRecord.kwh * ConsumptionRecord.price_eur_per_kwh
+    return (
+        select(
+            bucket,
+            func.sum(ConsumptionRecord.kwh).label("kwh"),
+            func.sum(cost).label("cost_eur"),
+        )
+        .filter(
+            ConsumptionRecord.customer_id == customer_id,
+            or_(
+                *(
+                    and_(ts >= lo.astimezone(pytz.UTC), ts < hi.astimezone(pytz.UTC))
+                    for lo, hi in ranges
+                )
+            ),
+        )
+        .group_by(bucket)
+    )
+
+
+def _local_month_start(day: date) -> datetime:
+    # local midnight starting the month of `day`
+    return pytz.timezone(config.TZ).localize(datetime(day.year, day.month, 1))
+
+
+def _month_series_query(customer_id: int, start: datetime, end: datetime, limit: int):
+    # months wholly inside [start, end) are read from the rollup; the partial
+    # months at either edge are summed from the readings inside the range
+    first_full = start.date().replace(day=1)
+    if _local_month_start(first_full) != start:
+        first_full = (first_full + timedelta(days=31)).replace(day=1)
+    end_month = end.date().replace(day=1)
+    edges = _records_query(
+        customer_id,
+        _zoned_trunc("month", ConsumptionRecord.ts),
+        *(
+            [
+                (start, _local_month_start(first_full)),
+                (_local_month_start(end_month), end),
+            ]
+            if first_full < end_month
+            else [(start, end)]
+        ),
+    )
+    month_start = func.timezone(config.TZ, cast(ConsumptionMonthly.month, DateTime))
+    full = select(
+        month_start.label("bucket"),
+        ConsumptionMonthly.kwh,
+        ConsumptionMonthly.cost_eur,
+    ).filter(
+        ConsumptionMonthly.customer_id == customer_id,
+        ConsumptionMonthly.month >= first_full,
+        ConsumptionMonthly.month < end_month,
+    )
+    months = union_all(full, edges).subquery()
+    return (
+        select(months.c.bucket, months.c.kwh, months.c.cost_eur)
+        .order_by(months.c.bucket)
+        .limit(limit)
+    )
+
+
+def series_query(
+    customer_id: int, start: datetime, end: datetime, resolution: str, limit: int
+):
+    """Select (bucket, kwh, cost_eur) ordered by bucket, at most `limit` rows.
+
+    Buckets are timestamptz starts of local slots; only readings in [start, end)
+    are counted, also in the first and last bucket.
+    """
+    if resolution == "month":
+        return _month_series_query(customer_id, start, end, limit)
+    if resolution == "15min":
+        bucket = func.date_bin(
+            literal_column("interval '15 minutes'"),
+            ConsumptionRecord.ts,
+            literal_column("timestamptz '2000-01-01 00:00+00'"),
+        )
+    else:
+        # zoned date_trunc keeps both hours of a DST fall-back apart
+        bucket = _zoned_trunc(resolution, ConsumptionRecord.ts)
+    q = _records_query(customer_id, bucket, (start, end))
+    return q.order_by(q.selected_columns.bucket).limit(limit)
+
+
+def local_bucket(value) -> datetime:
+    """Bucket value from `series_query` as an aware config.TZ datetime."""
+    tz = pytz.timezone(config.TZ)
+    if isinstance(value, datetime):
+        return value.astimezone(tz)
+    return tz.localize(datetime(value.year, value.month, value.day))
+
+
+async def encode_json(meta: dict, batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Stream ``{...meta, "columns": [...], "points": [[ts, kwh, cost], ...]}``."""
+    head = json.dumps(meta | {"columns": COLUMNS}, separators=(",", ":"))
+    yield head[:-1].encode() + b',"points":['
+    first = True
+    async for rows in batches:
+        points = ",".join(
+            json.dumps(
+                [local_bucket(b).isoformat(), float(k), float(c)],
+                separators=(",", ":"),
+            )
+            for b, k, c in rows
+        )
+        if points:
+            yield (points if first else "," + points).encode()
+            first = False
+    yield b"]}"
+
+
+async def encode_arrow(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Stream the rows as an Arrow IPC stream, one record batch per fetched batch."""
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [
+            ("ts", pa.timestamp("ms", tz=config.TZ)),
+            ("kwh", pa.float64()),
+            ("cost_eur", pa.float64()),
+        ]
+    )
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for rows in batches:
+            if not rows:
+                continue
+            buckets, kwh, cost = zip(*rows)
+            writer.write_batch(
+                pa.record_batch(
+                    [
+                        pa.array([local_bucket(b) for b in buckets], schema[0].type),
+                        pa.array(kwh, pa.float64()),
+                        pa.array(cost, pa.float64()),
+                    ],
+                    schema=schema,
+                )
+            )
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
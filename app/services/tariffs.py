@@ -0,0 +1,247 @@
+"""Time-of-use tariffs compiled into per-month 15-minute price calendars.
+
+A tariff's rules (daily blocks, seasons, weekends and holidays in config.TZ) are
+evaluated once per month over that month's slot grid, giving a read-only array
+with one EUR/kWh price per 15-minute slot. Billing a series then only needs a
+gather (slot index -> price) and a dot product with kWh, whatever the tariff.
+Dynamic (per-interval) pricing keeps using the price column of the meter data.
+"""
+
+import functools
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app import config
+
+SLOT = pd.Timedelta(minutes=15)
+SLOT_NS = SLOT.value
+
+
+def easter_sunday(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7  # noqa: E741
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+@functools.lru_cache(maxsize=64)
+def slovenian_holidays(year: int) -> frozenset[date]:
+    """Work-free public holidays in Slovenia."""
+    fixed = [
+        (1, 1),
+        (1, 2),
+        (2, 8),
+        (4, 27),
+        (5, 1),
+        (5, 2),
+        (6, 25),
+        (8, 15),
+        (10, 31),
+        (11, 1),
+        (12, 25),
+        (12, 26),
+    ]
+    easter = easter_sunday(year)
+    moveable = [easter, easter + timedelta(days=1), easter + timedelta(days=49)]
+    return frozenset([date(year, m, d) for m, d in fixed] + moveable)
+
+
+def non_working_days(slots: pd.DatetimeIndex) -> np.ndarray:
+    """True for slots on a Saturday, Sunday or Slovenian public holiday."""
+    days = slots.tz_localize(None).normalize()
+    holidays = pd.DatetimeIndex(
+        sorted(d for y in set(days.year) for d in slovenian_holidays(y))
+    )
+    return (days.dayofweek >= 5) | days.isin(holidays)
+
+
+class Tariff(ABC):
+    """Interface for tariffs; subclasses are frozen dataclasses (hashable)."""
+
+    @abstractmethod
+    def prices(self, slots: pd.DatetimeIndex) -> np.ndarray:
+        """EUR/kWh for each slot start, given in config.TZ local time."""
+
+
+@dataclass(frozen=True)
+class FlatTariff(Tariff):
+    price: float
+
+    def prices(self, slots: pd.DatetimeIndex) -> np.ndarray:
+        return np.full(len(slots), self.price)
+
+
+@dataclass(frozen=True)
+class TwoBlockTariff(Tariff):
+    """High (VT) / low (MT) tariff: high on working days within the high hours."""
+
+    high: float
+    low: float
+    high_from_hour: int = 6
+    high_to_hour: int = 22
+
+    def prices(self, slots: pd.DatetimeIndex) -> np.ndarray:
+        hour = slots.hour
+        high = (hour >= self.high_from_hour) & (hour < self.high_to_hour)
+        high &= ~non_working_days(slots)
+        return np.where(high, self.high, self.low)
+
+
+# Slovenian network tariff time bands by local hour: 0 = low, 1 = mid, 2 = high.
+_BAND_BY_HOUR = np.array(
+    [0] * 6 + [1] + [2] * 7 + [1] * 2 + [2] * 4 + [1] * 2 + [0] * 2, dtype=np.int8
+)
+# Block (1-5) by [higher season, working day, band].
+_NETWORK_BLOCKS = np.array(
+    [
+        [[5, 4, 3], [4, 3, 2]],  # lower season (Mar-Oct): non-working, working
+        [[4, 3, 2], [3, 2, 1]],  # higher season (Nov-Feb): non-working, working
+    ],
+    dtype=np.int8,
+)
+
+
+def network_blocks(slots: pd.DatetimeIndex) -> np.ndarray:
+    """Slovenian five-block network tariff block (1-5) of each local slot."""
+    higher_season = np.isin(slots.month, (11, 12, 1, 2)).astype(np.int8)
+    working = (~non_working_days(slots)).astype(np.int8)
+    band = _BAND_BY_HOUR[slots.hour]
+    return _NETWORK_BLOCKS[higher_season, working, band]
+
+
+@dataclass(frozen=True)
+class NetworkBlockTariff(Tariff):
+    """Five-block network tariff; `block_prices[i]` is the EUR/kWh of block i + 1."""
+
+    block_prices: tuple[float, float, float, float, float]
+
+    def prices(self, slots: pd.DatetimeIndex) -> np.ndarray:
+        return np.asarray(self.block_prices, dtype="float64")[network_blocks(slots) - 1]
+
+
+@dataclass(frozen=True)
+class CombinedTariff(Tariff):
+    """Sum of several tariffs, e.g. an energy tariff plus the network tariff."""
+
+    parts: tuple[Tariff, ...]
+
+    def prices(self, slots: pd.DatetimeIndex) -> np.ndarray:
+        return sum(part.prices(slots) for part in self.parts)
+
+
+def tariff_from_dict(spec: dict) -> Tariff:
+    """Build a tariff from its JSON-style definition.
+
+    {"type": "flat", "price": p} | {"type": "two_block", "high": p, "low": p}
+    | {"type": "network", "block_prices": [p1, ..., p5]}
+    | {"type": "combined", "parts": [spec, ...]}
+    """
+    kind = spec.get("type")
+    if kind == "flat":
+        return FlatTariff(float(spec["price"]))
+    if kind == "two_block":
+        return TwoBlockTariff(
+            float(spec["high"]),
+            float(spec["low"]),
+            int(spec.get("high_from_hour", 6)),
+            int(spec.get("high_to_hour", 22)),
+        )
+    if kind == "network":
+        block_prices = tuple(float(p) for p in spec["block_prices"])
+        if len(block_prices) != 5:
+            raise ValueError("network tariff needs exactly 5 block prices")
+        return NetworkBlockTariff(block_prices)  # type: ignore[arg-type]
+    if kind == "combined":
+        return CombinedTariff(tuple(tariff_from_dict(p) for p in spec["parts"]))
+    raise ValueError(f"Unknown tariff type: {kind}")
+
+
+def month_slots(year: int, month: int) -> pd.DatetimeIndex:
+    """Local 15-minute slot starts of a month (2972/2980 slots in DST months)."""
+    start = pd.Timestamp(year=year, month=month, day=1, tz=config.TZ)
+    end = start + pd.offsets.MonthBegin(1)
+    return pd.date_range(start, end, freq=SLOT, inclusive="left")
+
+
+@functools.lru_cache(maxsize=512)
+def compile_month(tariff: Tariff, year: int, month: int) -> np.ndarray:
+    """Read-only price per slot of `month_slots(year, month)`."""
+    prices = np.ascontiguousarray(tariff.prices(month_slots(year, month)), "float64")
+    prices.flags.writeable = False
+    return prices
+
+
+@dataclass(frozen=True)
+class TariffCalendar:
+    """Prices of consecutive 15-minute slots starting at `origin_ns` (UTC ns)."""
+
+    origin_ns: int
+    prices: np.ndarray
+
+    def slot_index(self, ts) -> np.ndarray:
+        t = pd.DatetimeIndex(ts)
+        if t.tz is None:
+            raise TypeError("tariff billing needs tz-aware timestamps")
+        idx = (t.asi8 - self.origin_ns) // SLOT_NS
+        if len(idx) and (idx.min() < 0 or idx.max() >= len(self.prices)):
+            raise ValueError("timestamps fall outside the tariff calendar")
+        return idx
+
+    def prices_at(self, ts) -> np.ndarray:
+        """Price of the slot containing each timestamp (one gather)."""
+        return self.prices[self.slot_index(ts)]
+
+
+def compile_calendar(tariff: Tariff, first, last) -> TariffCalendar:
+    """Calendar of whole local months covering instants `first` through `last`."""
+    tz = config.TZ
+    first = pd.Timestamp(first).tz_convert(tz)
+    last = pd.Timestamp(last).tz_convert(tz)
+    months = pd.period_range(first.tz_localize(None), last.tz_localize(None), freq="M")
+    origin = pd.Timestamp(year=months[0].year, month=months[0].month, day=1, tz=tz)
+    prices = np.concatenate([compile_month(tariff, m.year, m.month) for m in months])
+    return TariffCalendar(origin.value, prices)
+
+
+def bill(tariff: Tariff, ts, kwh, customer_ids=None, n_customers=None):
+    """Energy cost of `kwh` readings at `ts` under `tariff`.
+
+    Returns one total, or with `customer_ids` (ints in [0, n_customers)) an array of
+    per-customer totals for many series stacked together.
+    """
+    t = pd.DatetimeIndex(ts)
+    kwh = np.asarray(kwh, dtype="float64")
+    if len(t) == 0:
+        return 0.0 if customer_ids is None else np.zeros(n_customers or 0)
+    calendar = compile_calendar(tariff, t.min(), t.max())
+    prices = calendar.prices_at(t)
+    if customer_ids is None:
+        return float(np.dot(kwh, prices))
+    return np.bincount(
+        np.asarray(customer_ids), weights=kwh * prices, minlength=n_customers or 0
+    )
+
+
+def bill_grid(tariff: Tariff, first_slot, kwh_matrix: np.ndarray) -> np.ndarray:
+    """Per-customer cost for series sharing one 15-minute grid.
+
+    `kwh_matrix` is customers x slots with column 0 at `first_slot`; the whole bill
+    is a single matrix-vector product with the calendar's prices.
+    """
+    first = pd.Timestamp(first_slot)
+    n_slots = kwh_matrix.shape[1]
+    calendar = compile_calendar(tariff, first, first + (n_slots - 1) * SLOT)
+    offset = calendar.slot_index([first])[0]
+    return kwh_matrix @ calendar.prices[offset : offset + n_slots]
@@ -0,0 +1,163 @@
+"""Staging store for parsed uploads between /imports/preview and /imports/commit."""
+
+import io
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from app import config
+
+
+def frame_to_parquet(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to Parquet bytes."""
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+def frame_from_parquet(data: bytes) -> pd.DataFrame:
+    """Deserialize Parquet bytes produced by `frame_to_parquet`."""
+    return pd.read_parquet(io.BytesIO(data))
+
+
+class UploadStore(ABC):
+    """Interface for upload staging backends, keyed by an opaque token.
+
+    Frames round-trip through Parquet, which keeps dtypes and ``DataFrame.attrs``.
+    """
+
+    @abstractmethod
+    def put(self, df: pd.DataFrame) -> str:
+        """Stage a parsed upload and return the token to commit it with."""
+
+    @abstractmethod
+    def pop(self, token: str) -> pd.DataFrame | None:
+        """Remove and return a staged upload, or None if missing or expired."""
+
+
+class MemoryUploadStore(UploadStore):
+    """Process-local LRU store bounded by entry age and total Parquet bytes.
+
+    Only safe with a single worker process; use `DiskUploadStore` otherwise.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            token, (created, data) = next(iter(self._entries.items()))
+            if now - created <= self.ttl_seconds and self._bytes <= self.max_bytes:
+                break
+            del self._entries[token]
+            self._bytes -= len(data)
+
+    def put(self, df: pd.DataFrame) -> str:
+        data = frame_to_parquet(df)
+        if len(data) > self.max_bytes:
+            raise ValueError("Upload is too large to stage")
+        token = str(uuid.uuid4())
+        with self._lock:
+            self._entries[token] = (time.monotonic(), data)
+            self._bytes += len(data)
+            self._evict(time.monotonic())
+        return token
+
+    def pop(self, token: str) -> pd.DataFrame | None:
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._entries.pop(token, None)
+            if entry is None:
+                return None
+            self._bytes -= len(entry[1])
+        return frame_from_parquet(entry[1])
+
+
+class DiskUploadStore(UploadStore):
+    """Stores each staged upload as ``<token>.parquet`` in a directory shared by all workers.
+
+    Expired files and, past `max_bytes`, the oldest files are removed on every `put`.
+    """
+
+    def __init__(self, directory: str | Path, ttl_seconds: float, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    def _path(self, token: str) -> Path | None:
+        try:
+            token = str(uuid.UUID(token))
+        except (ValueError, TypeError):
+            return None
+        return self.directory / f"{token}.parquet"
+
+    def _evict(self) -> None:
+        now = time.time()
+        files = []
+        for path in self.directory.glob("*.parquet"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if now - mtime <= self.ttl_seconds and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def put(self, df: pd.DataFrame) -> str:
+        data = frame_to_parquet(df)
+        if len(data) > self.max_bytes:
+            raise ValueError("Upload is too large to stage")
+        token = str(uuid.uuid4())
+        path = self._path(token)
+        # write-then-rename so other workers never see a partial file
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._evict()
+        return token
+
+    def pop(self, token: str) -> pd.DataFrame | None:
+        path = self._path(token)
+        if path is None:
+            return None
+        # claim the file with an atomic rename so only one worker can commit it
+        claimed = path.with_suffix(f".{uuid.uuid4().hex}.claimed")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            return None
+        try:
+            expired = time.time() - claimed.stat().st_mtime > self.ttl_seconds
+            data = claimed.read_bytes()
+        finally:
+            claimed.unlink(missing_ok=True)
+        if expired:
+            return None
+        return frame_from_parquet(data)
+
+
+def create_upload_store() -> UploadStore:
+    """Build the upload store selected by `app.config.UPLOAD_STORE`."""
+    if config.UPLOAD_STORE == "memory":
+        return MemoryUploadStore(config.UPLOAD_TTL_SECONDS, config.UPLOAD_MAX_BYTES)
+    if config.UPLOAD_STORE == "disk":
+        return DiskUploadStore(
+            config.UPLOADS_DIR, config.UPLOAD_TTL_SECONDS, config.UPLOAD_MAX_BYTES
+        )
+    raise ValueError(f"Unknown upload store: {config.UPLOAD_STORE}")
@@ -0,0 +1,80 @@
+"""Compare billing.parse_csv engines on the bundled meter export scaled up in time.
+
+Usage: python -m benchmarks.bench_csv_engines [--repeat N]
+
+The bundled `naloga-lokacija-1.csv` (one month of 15-minute data) is tiled onto a
+continuous 15-minute grid in `config.TZ` covering one and ten years, keeping the
+original "+02:00"/"+01:00" offset notation and comma decimals.
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://bench@localhost/bench")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app import config  # noqa: E402
+from app.db.utils import normalize_consumption_frame  # noqa: E402
+from app.services import billing  # noqa: E402
+
+SOURCE = "naloga-lokacija-1.csv"
+ENGINES = ("pandas", "pyarrow")
+
+
+def scaled_csv(years: int) -> bytes:
+    """Return CSV bytes with `years` of 15-minute rows built from the bundled file."""
+    base = billing.parse_csv(open(SOURCE, "rb").read(), engine="pandas")
+    ts = pd.date_range("2020-01-01", periods=years * 365 * 96, freq="15min", tz=config.TZ)
+    reps = int(np.ceil(len(ts) / len(base)))
+    kwh = np.tile(base["Poraba [kWh]"].to_numpy(), reps)[: len(ts)]
+    price = np.tile(base["Dinamične Cene [EUR/kWh]"].to_numpy(), reps)[: len(ts)]
+    stamps = ts.strftime("%Y-%m-%dT%H:%M:%S%z").str.replace(
+        r"(\d{2})(\d{2})$", r"\1:\2", regex=True
+    )
+    out = pd.DataFrame(
+        {
+            "Časovna Značka (CEST/CET)": stamps,
+            "Poraba [kWh]": kwh,
+            "Dinamične Cene [EUR/kWh]": price,
+        }
+    )
+    return out.to_csv(sep=";", decimal=",", index=False).encode("utf-8")
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = {"1 month": open(SOURCE, "rb").read()}
+    inputs["1 year"] = scaled_csv(1)
+    inputs["10 years"] = scaled_csv(10)
+
+    print(f"{'input':<10} {'rows':>9} {'engine':<8} {'parse s':>8} {'+normalize s':>13}")
+    for label, data in inputs.items():
+        for engine in ENGINES:
+            df = billing.parse_csv(data, engine=engine)
+            parse = best_of(lambda: billing.parse_csv(data, engine=engine), args.repeat)
+            total = best_of(
+                lambda: normalize_consumption_frame(
+                    billing.parse_csv(data, engine=engine)
+                ),
+                args.repeat,
+            )
+            print(f"{label:<10} {len(df):>9} {engine:<8} {parse:>8.3f} {total:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
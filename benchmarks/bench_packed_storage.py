@@ -0,0 +1,125 @@
+"""Compare row-per-reading storage with packed consumption_daily arrays.
+
+Usage: DATABASE_URL=... python -m benchmarks.bench_packed_storage [--customers N]
+       [--years Y] [--keep]
+
+Loads synthetic 15-minute data for N "bench-packed-*" customers through the normal
+COPY loader, packs it, then reports on-disk size of both layouts and the time to
+compute every customer-month invoice total from each. Run it against a scratch
+database: sizes are whole-table sizes. Bench data is deleted afterwards unless
+--keep is given.
+"""
+
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from app import config
+from app.db.packed import PACKED_TOTALS, pack_all_days
+from app.db.utils import copy_upsert_consumption_records
+from app.deps import get_db
+
+RAW_TOTALS = """
+SELECT coalesce(sum(kwh * price_eur_per_kwh), 0), count(*), coalesce(sum(kwh), 0)
+FROM consumption_records
+WHERE customer_id = :customer_id
+  AND ts >= timezone(:tz, CAST(:d0 AS timestamp))
+  AND ts < timezone(:tz, CAST(:d1 AS timestamp))
+"""
+
+RAW_SIZE = """
+SELECT coalesce(sum(pg_total_relation_size(inhrelid)), 0)
+FROM pg_inherits WHERE inhparent = 'consumption_records'::regclass
+"""
+
+
+def synthetic_rows(customer_id: int, years: int, seed: int):
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range(
+        "2023-01-01", periods=years * 365 * 96, freq="15min", tz=config.TZ
+    ).tz_convert("UTC")
+    kwh = rng.gamma(2.0, 2.0, len(ts)).round(3)
+    price = rng.uniform(0.05, 0.25, len(ts)).round(5)
+    return zip(
+        [customer_id] * len(ts), ts.to_pydatetime(), kwh.tolist(), price.tolist()
+    )
+
+
+def month_starts(years: int) -> list[date]:
+    starts = pd.date_range("2023-01-01", periods=years * 12 + 1, freq="MS")
+    return [d.date() for d in starts]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=20)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    with get_db() as db:
+        ids = [
+            db.execute(
+                text("INSERT INTO customers (name) VALUES (:n) RETURNING id"),
+                {"n": f"bench-packed-{i}"},
+            ).scalar_one()
+            for i in range(args.customers)
+        ]
+        start = time.perf_counter()
+        for seed, cid in enumerate(ids):
+            copy_upsert_consumption_records(db, synthetic_rows(cid, args.years, seed))
+        db.commit()
+        print(f"loaded rows:   {time.perf_counter() - start:8.2f} s")
+
+        start = time.perf_counter()
+        for cid in ids:
+            pack_all_days(db, cid)
+        db.commit()
+        print(f"packed days:   {time.perf_counter() - start:8.2f} s")
+
+        raw_size = db.execute(text(RAW_SIZE)).scalar_one()
+        packed_size = db.execute(
+            text("SELECT pg_total_relation_size('consumption_daily')")
+        ).scalar_one()
+        print(f"rows size:     {raw_size / 2**20:8.1f} MiB")
+        print(f"packed size:   {packed_size / 2**20:8.1f} MiB")
+
+        months = month_starts(args.years)
+        for label, sql in (("rows", RAW_TOTALS), ("packed", PACKED_TOTALS)):
+            stmt = text(sql)
+            start = time.perf_counter()
+            for cid in ids:
+                for d0, d1 in zip(months, months[1:]):
+                    db.execute(
+                        stmt,
+                        {"customer_id": cid, "d0": d0, "d1": d1, "tz": config.TZ},
+                    ).one()
+            elapsed = time.perf_counter() - start
+            n = len(ids) * (len(months) - 1)
+            per_invoice_ms = elapsed / n * 1000
+            print(
+                f"{label + ' invoices:':<15}{elapsed:8.2f} s ({per_invoice_ms:.2f} ms each)"
+            )
+
+        if not args.keep:
+            for table in (
+                "consumption_daily",
+                "consumption_monthly",
+                "consumption_records",
+                "dirty_months",
+                "customers",
+            ):
+                column = "id" if table == "customers" else "customer_id"
+                db.execute(
+                    text(f"DELETE FROM {table} WHERE {column} = ANY(:ids)"),
+                    {"ids": ids},
+                )
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
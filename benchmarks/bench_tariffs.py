@@ -0,0 +1,108 @@
+"""Time-of-use billing: per-row rule evaluation vs compiled tariff calendars.
+
+Usage: python -m benchmarks.bench_tariffs [--customers N] [--years Y] [--repeat R]
+
+Synthetic 15-minute kWh for N customers over Y years in config.TZ, billed on a
+two-block energy tariff plus the five-block network tariff. The per-row baseline
+evaluates the rules for every reading of one customer and is extrapolated to N;
+the compiled paths bill all customers, both as stacked (customer_id, ts, kwh)
+arrays and as a customers x slots matrix on a shared grid.
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://bench@localhost/bench")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app import config  # noqa: E402
+from app.services import tariffs  # noqa: E402
+
+TARIFF = tariffs.CombinedTariff(
+    (
+        tariffs.TwoBlockTariff(high=0.1480, low=0.0970),
+        tariffs.NetworkBlockTariff((0.01998, 0.01833, 0.01809, 0.01855, 0.01873)),
+    )
+)
+
+
+def per_row_bill(ts: pd.DatetimeIndex, kwh: np.ndarray) -> float:
+    """Evaluate the tariff rules reading by reading, as a rule engine would."""
+    two_block, network = TARIFF.parts
+    holidays = {}
+    total = 0.0
+    for t, k in zip(ts, kwh):
+        day = t.date()
+        if day.year not in holidays:
+            holidays[day.year] = tariffs.slovenian_holidays(day.year)
+        working = t.dayofweek < 5 and day not in holidays[day.year]
+        energy = (
+            two_block.high
+            if working and two_block.high_from_hour <= t.hour < two_block.high_to_hour
+            else two_block.low
+        )
+        band = tariffs._BAND_BY_HOUR[t.hour]
+        season = int(t.month in (11, 12, 1, 2))
+        block = tariffs._NETWORK_BLOCKS[season, int(working), band]
+        total += k * (energy + network.block_prices[block - 1])
+    return total
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ts = pd.date_range(
+        "2024-01-01",
+        f"{2024 + args.years}-01-01",
+        freq="15min",
+        tz=config.TZ,
+        inclusive="left",
+    )
+    rng = np.random.default_rng(0)
+    grid = rng.gamma(2.0, 0.05, (args.customers, len(ts))).astype("float64")
+    print(f"{args.customers} customers x {len(ts)} slots = {grid.size:,} readings")
+
+    start = time.perf_counter()
+    reference = per_row_bill(ts, grid[0])
+    per_row = (time.perf_counter() - start) * args.customers
+    print(f"per-row rules (extrapolated): {per_row:10.2f} s")
+
+    tariffs.compile_month.cache_clear()
+    start = time.perf_counter()
+    tariffs.compile_calendar(TARIFF, ts[0], ts[-1])
+    print(f"compile calendar:             {time.perf_counter() - start:10.4f} s")
+
+    stacked_ts = np.tile(ts.asi8, args.customers).view("M8[ns]")
+    stacked_ts = pd.DatetimeIndex(stacked_ts).tz_localize("UTC")
+    ids = np.repeat(np.arange(args.customers), len(ts))
+    kwh = grid.ravel()
+    elapsed = best_of(
+        lambda: tariffs.bill(TARIFF, stacked_ts, kwh, ids, args.customers), args.repeat
+    )
+    print(f"stacked gather + bincount:    {elapsed:10.4f} s")
+
+    elapsed = best_of(lambda: tariffs.bill_grid(TARIFF, ts[0], grid), args.repeat)
+    print(f"shared grid matrix @ prices:  {elapsed:10.4f} s")
+
+    totals = tariffs.bill_grid(TARIFF, ts[0], grid)
+    assert np.isclose(totals[0], reference), (totals[0], reference)
+
+
+if __name__ == "__main__":
+    main()
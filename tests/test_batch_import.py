@@ -0,0 +1,131 @@
+import io
+import zipfile
+
+from sqlalchemy import select
+
+from app.db.models import ConsumptionRecord, Customer, ImportBatch
+from app.services import batch_import
+from app.services.batch_import import (
+    customer_name_from_filename,
+    expand_uploads,
+    run_batch_import,
+)
+
+HEADER = "Časovna Značka (CEST/CET);Poraba [kWh];Dinamične Cene [EUR/kWh]\n"
+
+
+def csv_bytes(*rows: tuple[str, str]) -> bytes:
+    return (HEADER + "".join(f"{ts};{kwh};0,1\n" for ts, kwh in rows)).encode()
+
+
+def zip_bytes(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return buf.getvalue()
+
+
+def stored_kwh(db) -> dict[str, list[float]]:
+    q = (
+        select(Customer.name, ConsumptionRecord.kwh)
+        .join(Customer, Customer.id == ConsumptionRecord.customer_id)
+        .order_by(Customer.name, ConsumptionRecord.ts)
+    )
+    out: dict[str, list[float]] = {}
+    for name, kwh in db.execute(q):
+        out.setdefault(name, []).append(kwh)
+    return out
+
+
+def test_expand_uploads_unpacks_zip_members():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("export/naloga-lokacija-2.csv", b"b")
+        zf.writestr("__MACOSX/export/._naloga-lokacija-2.csv", b"junk")
+        zf.writestr("readme.txt", b"ignored")
+    files = expand_uploads(
+        [("naloga-lokacija-1.csv", b"a"), ("exports.zip", buf.getvalue())]
+    )
+    assert files == [
+        ("naloga-lokacija-1.csv", b"a"),
+        ("export/naloga-lokacija-2.csv", b"b"),
+    ]
+    assert [customer_name_from_filename(n) for n, _ in files] == [
+        "naloga-lokacija-1",
+        "naloga-lokacija-2",
+    ]
+
+
+def test_batch_import_last_file_by_name_wins(pg):
+    # both members load into customer "alice"; b/ sorts after a/ whatever the upload
+    # order, and within a file the later row of a repeated timestamp wins
+    archive = zip_bytes(
+        {
+            "b/alice.csv": csv_bytes(("2024-07-01 00:15:00", "3,0")),
+            "a/alice.csv": csv_bytes(
+                ("2024-07-01 00:00:00", "1,0"),
+                ("2024-07-01 00:15:00", "2,0"),
+                ("2024-07-01 00:15:00", "2,5"),
+            ),
+        }
+    )
+    summaries = run_batch_import([("exports.zip", archive)])
+    assert [(s.filename, s.status) for s in summaries] == [
+        ("a/alice.csv", "loaded"),
+        ("b/alice.csv", "loaded"),
+    ]
+    assert (summaries[0].inserted, summaries[0].duplicates) == (2, 1)
+    assert (summaries[1].inserted, summaries[1].updated) == (0, 1)
+    assert stored_kwh(pg) == {"alice": [1.0, 3.0]}
+
+
+def test_batch_import_rolls_back_only_the_failing_file(pg, monkeypatch):
+    copy_upsert = batch_import.copy_upsert_consumption_records
+
+    def fail_for_bob(db, rows):
+        rows = list(rows)
+        result = copy_upsert(db, rows)
+        if rows[0][0] == db.scalar(select(Customer.id).filter_by(name="bob")):
+            raise RuntimeError("disk full")
+        return result
+
+    monkeypatch.setattr(batch_import, "copy_upsert_consumption_records", fail_for_bob)
+    reading = csv_bytes(("2024-07-01 00:00:00", "1,0"))
+    summaries = run_batch_import(
+        [
+            ("alice.csv", reading),
+            ("bob.csv", reading),
+            ("carol.csv", b"not a meter export"),
+            ("dave.csv", reading),
+        ]
+    )
+    assert [(s.customer, s.status, s.error) for s in summaries] == [
+        ("alice", "loaded", None),
+        ("bob", "failed", "disk full"),
+        ("carol", "failed", "CSV validation failed"),
+        ("dave", "loaded", None),
+    ]
+    # bob's savepoint took his customer row, readings and import batch with it
+    assert stored_kwh(pg) == {"alice": [1.0], "dave": [1.0]}
+    assert list(pg.scalars(select(Customer.name).order_by(Customer.name))) == [
+        "alice",
+        "dave",
+    ]
+    batches = select(Customer.name).join(ImportBatch).order_by(Customer.name)
+    assert list(pg.scalars(batches)) == ["alice", "dave"]
+
+
+def test_batch_import_skips_a_file_already_imported(pg):
+    reading = csv_bytes(("2024-07-01 00:00:00", "1,0"))
+    first = run_batch_import([("alice.csv", reading)])
+    again = run_batch_import(
+        [("alice.csv", reading), ("bob.csv", reading), ("old/alice.csv", reading)]
+    )
+    assert first[0].status == "loaded"
+    assert [(s.filename, s.status, s.inserted) for s in again] == [
+        ("alice.csv", "skipped", 0),
+        ("bob.csv", "loaded", 1),
+        ("old/alice.csv", "skipped", 0),
+    ]
+    assert pg.scalar(select(ImportBatch.id).order_by(ImportBatch.id.desc())) == 2
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.billing import compute_total, customer_period_totals, period_totals
+
+KWH = "Poraba [kWh]"
+PRICE = "Dinamične Cene [EUR/kWh]"
+
+
+def masked_total(df, start, end):
+    ts = df["timestamp"]
+    mask = (ts >= pd.Timestamp(start)) & (ts <= pd.Timestamp(end))
+    sel = df.loc[mask]
+    return float((sel[KWH] * sel[PRICE]).sum()), len(sel)
+
+
+def frame(n=2000, seed=0, tz=None, shuffle=False):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "timestamp": pd.date_range("2024-01-01", periods=n, freq="15min", tz=tz),
+            KWH: rng.gamma(2.0, 0.5, n),
+            PRICE: rng.uniform(0.05, 0.25, n),
+        }
+    )
+    return df.sample(frac=1, random_state=seed) if shuffle else df
+
+
+@pytest.mark.parametrize("tz,shuffle", [(None, False), ("UTC", False), (None, True)])
+def test_compute_total_matches_masked_sum(tz, shuffle):
+    df = frame(tz=tz, shuffle=shuffle)
+    for start, end in [
+        ("2024-01-02", "2024-01-05 12:00"),
+        ("2024-01-01", "2024-01-01"),  # single reading, inclusive end
+        ("2023-01-01", "2023-12-31"),  # no readings
+        ("2024-01-10", "2024-01-02"),  # end before start
+    ]:
+        start, end = pd.Timestamp(start, tz=tz), pd.Timestamp(end, tz=tz)
+        total, records = compute_total(df, start, end)
+        expected_total, expected_records = masked_total(df, start, end)
+        assert records == expected_records
+        assert total == pytest.approx(expected_total, abs=1e-9)
+
+
+def test_period_totals_many_periods():
+    df = frame(n=96 * 60)
+    starts = pd.date_range("2024-01-01", periods=59, freq="D")
+    ends = starts + pd.Timedelta("1D")
+    totals = period_totals(df["timestamp"], df[KWH], df[PRICE], starts, ends)
+    assert totals.records.tolist() == [96] * 59
+    by_day = df.groupby(df["timestamp"].dt.floor("D"))
+    expected = by_day.apply(lambda g: (g[KWH] * g[PRICE]).sum()).iloc[:59].to_numpy()
+    np.testing.assert_allclose(totals.cost, expected, atol=1e-9)
+    expected_kwh = by_day[KWH].sum().iloc[:59].to_numpy()
+    np.testing.assert_allclose(totals.kwh, expected_kwh, atol=1e-9)
+
+
+def test_customer_period_totals_matches_per_customer():
+    parts = [frame(n=500, seed=cid).assign(customer_id=cid) for cid in (3, 1, 2)]
+    stacked = pd.concat(parts).sample(frac=1, random_state=1)
+    period_customers = [1, 2, 3, 1, 7]
+    starts = pd.to_datetime(
+        ["2024-01-02", "2024-01-01", "2024-01-03", "2024-01-01", "2024-01-01"]
+    )
+    ends = starts + pd.Timedelta("1D")
+    totals = customer_period_totals(
+        stacked["customer_id"],
+        stacked["timestamp"],
+        stacked[KWH],
+        stacked[PRICE],
+        period_customers,
+        starts,
+        ends,
+    )
+    for i, cid in enumerate(period_customers):
+        sub = stacked[stacked["customer_id"] == cid]
+        mask = (sub["timestamp"] >= starts[i]) & (sub["timestamp"] < ends[i])
+        assert totals.records[i] == mask.sum()
+        expected = (sub[KWH] * sub[PRICE])[mask].sum()
+        assert totals.cost[i] == pytest.approx(expected, abs=1e-9)
+
+
+def test_customer_period_totals_without_periods_is_empty():
+    df = frame(n=10).assign(customer_id=1)
+    no_periods = pd.to_datetime([])
+    totals = customer_period_totals(
+        df["customer_id"],
+        df["timestamp"],
+        df[KWH],
+        df[PRICE],
+        [],
+        no_periods,
+        no_periods,
+    )
+    assert [len(a) for a in totals] == [0, 0, 0]
+
+
+def test_naive_and_aware_timestamps_do_not_mix():
+    df = frame(n=10, tz="UTC")
+    with pytest.raises(TypeError):
+        compute_total(df, pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-02"))
@@ -0,0 +1,32 @@
+from sqlalchemy.orm import Session
+
+from app.services.customer_cache import (
+    CustomerIdCache,
+    customer_ids,
+    remember_after_commit,
+)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = CustomerIdCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_ids_are_cached_only_after_commit():
+    customer_ids.clear()
+    db = Session()
+    db.begin()
+    remember_after_commit(db, "rolled-back", 1)
+    db.rollback()
+    db.begin()
+    remember_after_commit(db, "committed", 2)
+    assert customer_ids.get("committed") is None
+    db.commit()
+    assert customer_ids.get("rolled-back") is None
+    assert customer_ids.get("committed") == 2
+    customer_ids.clear()
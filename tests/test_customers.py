@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+from app.db.session import async_engine
+from app.db.utils import insert_or_update_consumption_records
+from app.deps import get_async_db
+from app.routers.customers import (
+    get_customers_with_months_async,
+    get_or_create_customer_id,
+)
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_customer_listing_reads_every_customer_in_one_query(pg, run_async):
+    alice = get_or_create_customer_id("alice", pg)
+    bob = get_or_create_customer_id("bob", pg)
+    carol = get_or_create_customer_id("carol", pg)
+    # months are local: 22:30 UTC on 31 August is September in Ljubljana
+    rows = [
+        (carol, utc(2024, 8, 31, 22, 30), 1.0, 0.1),
+        (alice, utc(2024, 8, 1, 12), 1.0, 0.1),
+        (alice, utc(2024, 6, 15, 12), 1.0, 0.1),
+    ]
+    insert_or_update_consumption_records(rows, mode="copy", db=pg)
+    pg.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    async def listing():
+        async with get_async_db() as db:
+            return await get_customers_with_months_async(db)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        customers = run_async(listing())
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+
+    assert customers == [
+        {"id": alice, "name": "alice", "months": ["2024-06", "2024-08"]},
+        {"id": bob, "name": "bob", "months": []},
+        {"id": carol, "name": "carol", "months": ["2024-09"]},
+    ]
+    assert len(statements) == 1
@@ -0,0 +1,184 @@
+import io
+from datetime import date, datetime, timezone
+
+import pandas as pd
+import pytest
+from sqlalchemy import select, text
+
+from app.db.models import ConsumptionMonthly
+from app.db.session import SessionLocal
+from app.db.utils import (
+    UpsertResult,
+    _CopyStream,
+    batched_upsert_consumption_records,
+    build_consumption_rows,
+    ensure_utc,
+    insert_or_update_consumption_records,
+    iter_consumption_rows,
+    local_month,
+    normalize_consumption_frame,
+    parse_timestamp,
+    to_float_series,
+    to_utc_series,
+)
+from app.services import billing
+from app.services.uploads import MemoryUploadStore
+
+
+def test_to_utc_series_matches_per_row_parse():
+    values = pd.Series(
+        [
+            "2024-10-27T02:00:00+02:00",  # CEST -> CET transition, first 02:00
+            "2024-10-27T02:00:00+01:00",  # second 02:00
+            "2024-03-31T01:45:00+01:00",
+            "2024-03-31T03:00:00+02:00",
+            "2024-10-27 02:30:00",  # ambiguous local wall time
+            "2024-03-31 02:30:00",  # non-existent local wall time
+            "2024-07-01 00:00:00",
+            "2024-07-01 00:00:00 CEST",
+        ]
+    )
+    expected = [ensure_utc(parse_timestamp(v)) for v in values]
+    assert list(to_utc_series(values)) == expected
+
+
+def test_build_consumption_rows_matches_bundled_csv():
+    with open("naloga-lokacija-1.csv", "rb") as f:
+        df = billing.parse_csv(f.read())
+    rows = build_consumption_rows(normalize_consumption_frame(df), 7)
+    assert len(rows) == len(df)
+    for (cid, ts, kwh, price), record in zip(rows, df.to_dict(orient="records")):
+        assert cid == 7
+        assert ts == ensure_utc(parse_timestamp(record["Časovna Značka (CEST/CET)"]))
+        assert kwh == float(record["Poraba [kWh]"])
+        assert price == float(record["Dinamične Cene [EUR/kWh]"])
+
+
+def test_to_float_series_coerces_garbage_to_zero():
+    out = to_float_series(pd.Series(["1.5", "", "abc", 2]))
+    assert out.tolist() == [1.5, 0.0, 0.0, 2.0]
+
+
+def test_copy_stream_renders_csv_in_pieces():
+    ts = datetime(2024, 7, 1, tzinfo=timezone.utc)
+    rows = [(1, ts, 0.5, 0.1)] * 5
+    stream = _CopyStream(rows, batch_rows=2)
+    pieces = []
+    while chunk := stream.read(16):
+        pieces.append(chunk)
+    text = "".join(pieces)
+    assert text.splitlines() == ["1,2024-07-01T00:00:00+00:00,0.5,0.1"] * 5
+    assert stream.rows_sent == 5
+
+
+def test_insert_or_update_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        insert_or_update_consumption_records([], mode="bogus")
+    with pytest.raises(ValueError):
+        insert_or_update_consumption_records([], mode="batched", commit="never")
+
+
+def test_batched_upsert_rejects_empty_pages():
+    with pytest.raises(ValueError):
+        batched_upsert_consumption_records(None, [], batch_size=0)
+
+
+def readings(n: int, kwh: float = 1.0) -> list[tuple]:
+    start = datetime(2024, 7, 31, 21, 30, tzinfo=timezone.utc)
+    return [(1, start + pd.Timedelta(minutes=15 * i), kwh, 0.1) for i in range(n)]
+
+
+def test_batched_upsert_pages_and_reports_progress(pg):
+    pg.execute(text("INSERT INTO customers (id, name) VALUES (1, 'a')"))
+    seen = []
+    result = batched_upsert_consumption_records(
+        pg, readings(5), batch_size=2, progress=seen.append
+    )
+    assert seen == [2, 4, 5]
+    assert result == UpsertResult(inserted=5, updated=0)
+    # re-sent rows count towards progress even when nothing changes
+    seen.clear()
+    result = batched_upsert_consumption_records(
+        pg, readings(5), batch_size=3, progress=seen.append
+    )
+    assert seen == [3, 5]
+    assert result == UpsertResult(inserted=0, updated=0, unchanged=5)
+
+
+def test_chunk_commits_keep_rollup_in_step_with_committed_pages(pg):
+    pg.execute(text("INSERT INTO customers (id, name) VALUES (1, 'a')"))
+    pg.commit()
+
+    def failing_rows():
+        # 21:30 UTC is still July in Ljubljana, 22:00 is August
+        yield from readings(3)
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        insert_or_update_consumption_records(
+            failing_rows(), mode="batched", batch_size=2, commit="chunk"
+        )
+    with SessionLocal() as db:
+        months = db.execute(
+            select(ConsumptionMonthly.month, ConsumptionMonthly.records).order_by(
+                ConsumptionMonthly.month
+            )
+        ).all()
+    assert months == [(date(2024, 7, 1), 2)]
+
+
+def test_local_month_buckets_by_configured_timezone():
+    # 23:30 UTC on Jan 31 is already February in Ljubljana
+    assert local_month(datetime(2024, 1, 31, 23, 30, tzinfo=timezone.utc)) == date(
+        2024, 2, 1
+    )
+    assert local_month(datetime(2024, 1, 31, 22, 45, tzinfo=timezone.utc)) == date(
+        2024, 1, 1
+    )
+    assert UpsertResult(inserted=2, updated=1, unchanged=4).total == 7
+
+
+def test_normalized_batch_survives_staging_with_types():
+    with open("naloga-lokacija-1.csv", "rb") as f:
+        batch = normalize_consumption_frame(billing.parse_csv(f.read()))
+    batch.attrs["content_hash"] = "abc"
+    store = MemoryUploadStore(ttl_seconds=60, max_bytes=10_000_000)
+    staged = store.pop(store.put(batch))
+    assert str(staged["ts"].dtype) == "datetime64[ns, UTC]"
+    assert staged["kwh"].dtype == "float64"
+    assert staged.attrs["content_hash"] == "abc"
+
+
+def test_streamed_chunks_match_whole_file_parse():
+    with open("naloga-lokacija-1.csv", "rb") as f:
+        whole = build_consumption_rows(
+            normalize_consumption_frame(billing.parse_csv(f.read())), 3
+        )
+    with open("naloga-lokacija-1.csv", "rb") as f:
+        streamed = list(iter_consumption_rows(billing.iter_csv_chunks(f, 500), 3))
+    assert streamed == whole
+
+
+def test_iter_csv_chunks_rejects_invalid_chunk():
+    data = "Časovna Značka (CEST/CET);Poraba [kWh];Dinamične Cene [EUR/kWh]\n"
+    data += "2024-07-01T00:00:00+02:00;1,0;0,1\n"
+    data += "2024-07-01T00:15:00+02:00;;0,1\n"
+    with pytest.raises(ValueError):
+        list(billing.iter_csv_chunks(io.BytesIO(data.encode()), 1))
+
+
+def test_pyarrow_engine_matches_pandas_engine():
+    with open("naloga-lokacija-1.csv", "rb") as f:
+        data = f.read()
+    by_pandas = normalize_consumption_frame(billing.parse_csv(data, engine="pandas"))
+    by_arrow = normalize_consumption_frame(billing.parse_csv(data, engine="pyarrow"))
+    assert str(billing.parse_csv(data, engine="pyarrow").dtypes.iloc[0]).endswith("UTC]")
+    pd.testing.assert_frame_equal(by_pandas, by_arrow)
+
+
+def test_pyarrow_engine_localizes_naive_timestamps():
+    data = "Časovna Značka (CEST/CET);Poraba [kWh];Dinamične Cene [EUR/kWh]\n"
+    data += "2024-10-27 02:30:00;1,5;0,1\n"
+    by_pandas = normalize_consumption_frame(billing.parse_csv(data.encode(), "pandas"))
+    by_arrow = normalize_consumption_frame(billing.parse_csv(data.encode(), "pyarrow"))
+    pd.testing.assert_frame_equal(by_pandas, by_arrow)
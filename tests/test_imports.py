@@ -0,0 +1,70 @@
+import io
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import ConsumptionMonthly, ConsumptionRecord
+from app.db.utils import normalize_consumption_frame
+from app.routers.imports import save_df_to_db, save_stream_to_db
+from app.services import billing
+
+HEADER = "Časovna Značka (CEST/CET);Poraba [kWh];Dinamične Cene [EUR/kWh]\n"
+
+
+def csv_bytes(*rows: tuple[str, str]) -> bytes:
+    return (HEADER + "".join(f"{ts};{kwh};0,1\n" for ts, kwh in rows)).encode()
+
+
+# 02:00-02:59 local happens twice on 2024-10-27; naive exports repeat those stamps
+DST_REPEAT = csv_bytes(
+    ("2024-10-27 02:00:00", "1,0"),
+    ("2024-10-27 02:15:00", "2,0"),
+    ("2024-10-27 02:00:00", "3,0"),
+    ("2024-10-27 02:15:00", "4,0"),
+)
+
+
+def stored_kwh(db) -> list[float]:
+    q = select(ConsumptionRecord.kwh).order_by(ConsumptionRecord.ts)
+    return list(db.execute(q).scalars())
+
+
+def test_save_df_keeps_last_of_repeated_timestamps(pg):
+    batch = normalize_consumption_frame(billing.parse_csv(DST_REPEAT))
+    result = save_df_to_db(batch, "dst")
+    assert (result.inserted, result.updated) == (2, 0)
+    assert stored_kwh(pg) == [3.0, 4.0]
+    assert pg.scalar(select(ConsumptionMonthly.kwh)) == 7.0
+
+
+@pytest.mark.parametrize("loader", ["copy", "batched"])
+def test_save_stream_keeps_last_across_chunks(pg, monkeypatch, loader):
+    from app import config
+
+    monkeypatch.setattr(config, "IMPORT_LOADER", loader)
+    monkeypatch.setattr(config, "IMPORT_BATCH_SIZE", 3)
+    monkeypatch.setattr(config, "IMPORT_STREAM_CHUNK_ROWS", 2)
+    result = save_stream_to_db(io.BytesIO(DST_REPEAT), "dst")
+    assert result.inserted == 2 and result.total == 4
+    assert stored_kwh(pg) == [3.0, 4.0]
+
+
+def test_stream_route_rejects_invalid_csv_with_400(pg):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.routers import imports
+
+    app = FastAPI()
+    app.include_router(imports.router, prefix="/imports")
+    bad = csv_bytes(
+        ("2024-07-01T00:00:00+02:00", "1,0"), ("2024-07-01T00:15:00+02:00", "")
+    )
+    with TestClient(app) as client:
+        response = client.post(
+            "/imports/stream",
+            files={"file": ("bad.csv", bad, "text/csv")},
+            data={"customer": "bad"},
+        )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "CSV validation failed"
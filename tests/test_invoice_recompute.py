@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select
+
+from app.db.models import DirtyMonth, Invoice
+from app.db.utils import insert_or_update_consumption_records
+from app.deps import get_async_db
+from app.routers.customers import get_or_create_customer_id
+from app.routers.invoices import save_invoice_async
+from app.services import invoice_recompute
+from app.services.invoice_run import month_period
+from app.services.pdf_cache import DiskPdfCache
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def fake_render(context: dict) -> bytes:
+    return f"{context['invoice_number']}:{context['total']}".encode()
+
+
+def test_recompute_reprices_only_invoices_of_changed_local_months(
+    pg, run_async, monkeypatch, tmp_path
+):
+    alice = get_or_create_customer_id("alice", pg)
+    bob = get_or_create_customer_id("bob", pg)
+    pg.commit()
+    # 22:30 UTC on 31 July is already August in Ljubljana
+    insert_or_update_consumption_records(
+        [
+            (alice, utc(2024, 7, 31, 21, 45), 1.0, 0.1),
+            (alice, utc(2024, 7, 31, 22, 30), 1.0, 0.1),
+            (alice, utc(2024, 8, 1, 10), 2.0, 0.1),
+            (bob, utc(2024, 7, 15, 10), 4.0, 0.1),
+        ],
+        mode="copy",
+    )
+    pg.execute(delete(DirtyMonth))
+    pg.commit()
+
+    async def invoice_all():
+        async with get_async_db() as db:
+            ids = [
+                await save_invoice_async(db, c, *month_period(m), total)
+                for c, m, total in [
+                    (alice, "2024-07", 0.1),
+                    (alice, "2024-08", 0.3),
+                    (bob, "2024-07", 0.4),
+                ]
+            ]
+            await db.commit()
+            return ids
+
+    alice_july, alice_august, bob_july = run_async(invoice_all())
+    insert_or_update_consumption_records(
+        [(alice, utc(2024, 7, 31, 22, 30), 5.0, 0.1)], mode="copy"
+    )
+
+    cache = DiskPdfCache(tmp_path, max_bytes=1024)
+    monkeypatch.setattr(invoice_recompute, "render_invoice_pdf_bytes", fake_render)
+    monkeypatch.setattr(invoice_recompute, "get_pdf_cache", lambda: cache)
+    report = invoice_recompute.recompute_dirty_invoices(processes=1)
+
+    assert (report.months, report.invoices, report.repriced) == (1, 1, 1)
+    assert report.failures == []
+    invoices = {inv.id: inv for inv in pg.execute(select(Invoice)).scalars()}
+    assert round(invoices[alice_august].total_eur, 2) == 0.7
+    assert cache.get(invoices[alice_august].pdf_key) == f"{alice_august}:0.7".encode()
+    assert invoices[alice_july].total_eur == 0.1
+    assert invoices[alice_july].pdf_key is None
+    assert invoices[bob_july].total_eur == 0.4
+    assert pg.scalar(select(DirtyMonth.month)) is None
@@ -0,0 +1,236 @@
+import json
+import sys
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from sqlalchemy import select, text
+
+from app import config
+from app.db.models import Invoice
+from app.db.session import SessionLocal
+from app.db.utils import insert_or_update_consumption_records
+from app.routers.customers import get_or_create_customer_id
+from app.services import invoice_run
+from app.services.invoice_run import InvoiceRunReport, month_period
+from app.services.pdf_cache import DiskPdfCache
+
+
+def fake_render(context: dict) -> bytes:
+    return f"{context['customer_name']}:{context['total']}".encode()
+
+
+def test_run_skips_customers_already_invoiced_for_the_month(pg, monkeypatch, tmp_path):
+    alice = get_or_create_customer_id("alice", pg)
+    bob = get_or_create_customer_id("bob", pg)
+    rows = [
+        (alice, datetime(2024, 7, 10, tzinfo=timezone.utc), 1.0, 0.1),
+        (bob, datetime(2024, 7, 10, tzinfo=timezone.utc), 2.0, 0.1),
+    ]
+    insert_or_update_consumption_records(rows, mode="copy", db=pg)
+    period_start, period_end = month_period("2024-07")
+    pg.add(
+        Invoice(
+            customer_id=alice,
+            period_start=period_start,
+            period_end=period_end,
+            total_eur=0.1,
+        )
+    )
+    # an invoice for another month does not count
+    pg.add(
+        Invoice(
+            customer_id=bob,
+            period_start=datetime(2024, 6, 1),
+            period_end=period_start,
+            total_eur=0.0,
+        )
+    )
+    pg.commit()
+    monkeypatch.setattr(invoice_run, "render_invoice_pdf_bytes", fake_render)
+    monkeypatch.setattr(
+        invoice_run, "get_pdf_cache", lambda: DiskPdfCache(tmp_path / "cache", 10**6)
+    )
+
+    report = invoice_run.run_monthly_invoices(
+        "2024-07", output=tmp_path / "july.zip", processes=1
+    )
+    assert (report.customers, report.invoiced, report.skipped) == (1, 1, 1)
+    with zipfile.ZipFile(tmp_path / "july.zip") as zf:
+        assert [zf.read(name) for name in zf.namelist()] == [b"bob:0.2"]
+
+    report = invoice_run.run_monthly_invoices(
+        "2024-07", output=tmp_path / "july.zip", processes=1
+    )
+    assert (report.customers, report.invoiced, report.skipped) == (0, 0, 2)
+    with zipfile.ZipFile(tmp_path / "july.zip") as zf:
+        assert [zf.read(name) for name in zf.namelist()] == [b"bob:0.2"]
+
+    report = invoice_run.run_monthly_invoices(
+        "2024-07",
+        output=tmp_path / "rebill",
+        as_zip=False,
+        skip_invoiced=False,
+        processes=1,
+    )
+    assert (report.customers, report.invoiced, report.skipped) == (2, 2, 0)
+    july = select(Invoice.customer_id).filter_by(period_start=period_start)
+    assert sorted(pg.execute(july).scalars()) == [alice, alice, bob, bob]
+
+
+class RecordingCache(DiskPdfCache):
+    """Notes, at every put, how many other sessions sit idle in a transaction."""
+
+    def __init__(self, directory):
+        super().__init__(directory, 10**6)
+        self.idle_in_transaction = []
+
+    def put_many(self, items: dict[str, bytes]) -> None:
+        with SessionLocal() as db:
+            self.idle_in_transaction.append(
+                db.scalar(
+                    text(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE state = 'idle in transaction' "
+                        "AND pid <> pg_backend_pid()"
+                    )
+                )
+            )
+        super().put_many(items)
+
+
+def test_run_caches_each_pdf_without_holding_a_transaction(
+    pg, monkeypatch, tmp_path
+):
+    july = datetime(2024, 7, 10, tzinfo=timezone.utc)
+    rows = [
+        (get_or_create_customer_id(name, pg), july, 1.0, 0.1)
+        for name in ("alice", "bob", "carol")
+    ]
+    insert_or_update_consumption_records(rows, db=pg)
+    pg.commit()
+    cache = RecordingCache(tmp_path / "cache")
+    monkeypatch.setattr(invoice_run, "render_invoice_pdf_bytes", fake_render)
+    monkeypatch.setattr(invoice_run, "get_pdf_cache", lambda: cache)
+
+    report = invoice_run.run_monthly_invoices(
+        "2024-07", output=tmp_path / "july.zip", processes=1
+    )
+    assert report.invoiced == 3
+    assert cache.idle_in_transaction == [0, 0, 0]
+    for invoice in pg.execute(select(Invoice)).scalars():
+        assert cache.get(invoice.pdf_key) is not None
+
+
+def test_render_in_order_bounds_work_in_flight():
+    class Pool:
+        submitted = 0
+
+        def submit(self, fn, context):
+            self.submitted += 1
+            return context
+
+    pool = Pool()
+    futures = invoice_run._render_in_order(pool, list(range(10)), ahead=3)
+    for i, future in enumerate(futures):
+        assert future == i
+        assert pool.submitted <= i + 3
+    assert pool.submitted == 10
+
+
+def test_rerun_adds_to_the_default_archive(pg, monkeypatch, tmp_path):
+    alice = get_or_create_customer_id("alice", pg)
+    bob = get_or_create_customer_id("bob", pg)
+    july = datetime(2024, 7, 10, tzinfo=timezone.utc)
+    insert_or_update_consumption_records([(alice, july, 1.0, 0.1)], db=pg)
+    pg.commit()
+    monkeypatch.setattr(config, "INVOICES_DIR", tmp_path)
+    monkeypatch.setattr(invoice_run, "render_invoice_pdf_bytes", fake_render)
+    monkeypatch.setattr(
+        invoice_run, "get_pdf_cache", lambda: DiskPdfCache(tmp_path / "cache", 10**6)
+    )
+
+    first = invoice_run.run_monthly_invoices("2024-07", processes=1)
+    # bob's readings arrive late and he is billed by a second default run
+    insert_or_update_consumption_records([(bob, july, 2.0, 0.1)], db=pg)
+    pg.commit()
+    second = invoice_run.run_monthly_invoices("2024-07", processes=1)
+
+    assert first.output == second.output == str(tmp_path / "invoices_2024-07.zip")
+    assert (second.invoiced, second.skipped) == (1, 1)
+    with zipfile.ZipFile(first.output) as zf:
+        assert {name: zf.read(name) for name in zf.namelist()} == {
+            "invoice_1.pdf": b"alice:0.1",
+            "invoice_2.pdf": b"bob:0.2",
+        }
+
+
+def test_run_never_replaces_a_pdf_in_the_output(pg, monkeypatch, tmp_path):
+    alice = get_or_create_customer_id("alice", pg)
+    july = datetime(2024, 7, 10, tzinfo=timezone.utc)
+    insert_or_update_consumption_records([(alice, july, 1.0, 0.1)], db=pg)
+    pg.commit()
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "invoice_1.pdf").write_bytes(b"old")
+    monkeypatch.setattr(invoice_run, "render_invoice_pdf_bytes", fake_render)
+    monkeypatch.setattr(
+        invoice_run, "get_pdf_cache", lambda: DiskPdfCache(tmp_path / "cache", 10**6)
+    )
+
+    report = invoice_run.run_monthly_invoices(
+        "2024-07", output=tmp_path / "out", as_zip=False, processes=1
+    )
+    assert report.invoiced == 0
+    assert [f.customer_id for f in report.failures] == [alice]
+    assert (tmp_path / "out" / "invoice_1.pdf").read_bytes() == b"old"
+    assert pg.scalar(select(Invoice.id)) is None
+
+
+def test_run_rejects_malformed_month():
+    with pytest.raises(ValueError, match="2024-7x"):
+        invoice_run.run_monthly_invoices("2024-7x")
+
+
+@pytest.mark.parametrize(
+    "argv, expected",
+    [
+        (
+            ["2024-07"],
+            {"output": None, "as_zip": True, "skip_invoiced": True, "processes": None},
+        ),
+        (
+            ["2024-07", "--dir", "out", "--rebill", "--processes", "2"],
+            {
+                "output": Path("out"),
+                "as_zip": False,
+                "skip_invoiced": False,
+                "processes": 2,
+            },
+        ),
+        (["2024-07", "--zip", "out.zip"], {"output": Path("out.zip"), "as_zip": True}),
+    ],
+)
+def test_cli_maps_arguments_to_the_run(monkeypatch, capsys, argv, expected):
+    calls = []
+
+    def run(year_month, **kwargs):
+        calls.append((year_month, kwargs))
+        return InvoiceRunReport(year_month=year_month, output="out", invoiced=3)
+
+    monkeypatch.setattr(invoice_run, "run_monthly_invoices", run)
+    monkeypatch.setattr(sys, "argv", ["invoice_run", *argv])
+    invoice_run.main()
+
+    [(year_month, kwargs)] = calls
+    assert year_month == "2024-07"
+    assert kwargs.items() >= expected.items()
+    assert json.loads(capsys.readouterr().out)["invoiced"] == 3
+
+
+def test_cli_rejects_both_zip_and_dir(monkeypatch):
+    monkeypatch.setattr(
+        sys, "argv", ["invoice_run", "2024-07", "--zip", "a.zip", "--dir", "b"]
+    )
+    with pytest.raises(SystemExit):
+        invoice_run.main()
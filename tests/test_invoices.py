@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from app.db.models import Invoice
+from app.db.utils import insert_or_update_consumption_records
+from app.deps import get_async_db
+from app.routers import invoices
+from app.routers.customers import get_or_create_customer_id
+from app.services.invoice_run import month_period
+from app.services.pdf_cache import DiskPdfCache, pdf_cache_key
+
+
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(invoices.router, prefix="/invoices")
+    return TestClient(app)
+
+
+def test_create_invoice_rejects_invalid_month_with_400():
+    response = client().post("/invoices/1", data={"year_month": "2024-13"})
+    assert response.status_code == 400
+    assert "2024-13" in response.json()["detail"]
+
+
+def test_invoices_store_naive_local_month_bounds(pg, run_async):
+    customer_id = get_or_create_customer_id("alice", pg)
+    pg.commit()
+    period_start, period_end = month_period("2024-07")
+
+    async def save():
+        async with get_async_db() as db:
+            invoice_id = await invoices.save_invoice_async(
+                db, customer_id, period_start, period_end, 12.5
+            )
+            await db.commit()
+            return invoice_id
+
+    invoice = pg.get(Invoice, run_async(save()))
+    assert invoice.period_start == datetime(2024, 7, 1)
+    assert invoice.period_end == datetime(2024, 8, 1)
+    assert invoice.total_eur == 12.5
+
+
+def test_identical_invoice_is_found_by_the_bounds_it_was_saved_with(pg, run_async):
+    customer_id = get_or_create_customer_id("alice", pg)
+    pg.commit()
+    period_start, period_end = month_period("2024-07")
+
+    async def save_then_find():
+        async with get_async_db() as db:
+            invoice_id = await invoices.save_invoice_async(
+                db, customer_id, period_start, period_end, 12.5
+            )
+            await db.execute(
+                update(Invoice).filter_by(id=invoice_id).values(pdf_key="k1")
+            )
+            find = invoices.find_identical_invoice_async
+            return invoice_id, [
+                await find(db, customer_id, period_start, period_end, 12.501),
+                await find(db, customer_id, period_start, period_end, 12.51),
+                await find(db, customer_id, *month_period("2024-08"), 12.5),
+            ]
+
+    invoice_id, found = run_async(save_then_find())
+    assert found == [(invoice_id, "k1"), None, None]
+
+
+def test_sql_invoice_totals_match_python_reference(pg, run_async):
+    customer_id = get_or_create_customer_id("alice", pg)
+    # 22:00 UTC on 30 June is the first local reading of July, 22:00 on 31 July
+    # already belongs to August
+    start = datetime(2024, 6, 30, 22, tzinfo=timezone.utc)
+    rows = [
+        (customer_id, start + timedelta(minutes=15 * i), (i % 7) * 0.25, 0.1 + i / 1e4)
+        for i in range(31 * 96 + 4)
+    ]
+    insert_or_update_consumption_records(rows, mode="copy", db=pg)
+    pg.commit()
+    ps_utc, pe_utc = invoices.local_period_bounds_utc(*month_period("2024-07"))
+
+    async def sql_totals():
+        async with get_async_db() as db:
+            return await invoices.compute_invoice_totals_async(
+                db, customer_id, ps_utc, pe_utc
+            )
+
+    sql = run_async(sql_totals())
+    python = invoices.compute_invoice_totals_python(pg, customer_id, ps_utc, pe_utc)
+    assert invoices.verify_invoice_totals(sql, python)
+    assert (sql.records, sql.first_ts, sql.peak_kw) == (31 * 96, start, 6.0)
+    assert sql.last_ts == start + timedelta(days=31, minutes=-15)
+
+
+def test_verify_invoice_totals_reports_mismatch(capsys):
+    ts = datetime(2024, 7, 1, tzinfo=timezone.utc)
+    totals = invoices.InvoiceTotals(12.5, 96, 40.0, ts, ts, 6.0, 5.0)
+    assert invoices.verify_invoice_totals(totals, totals)
+    assert capsys.readouterr().out == ""
+    for mismatch in (
+        totals._replace(total_eur=12.51),
+        totals._replace(records=95),
+        totals._replace(peak_top3_kw=None),
+    ):
+        assert not invoices.verify_invoice_totals(totals, mismatch)
+        assert "Invoice totals mismatch" in capsys.readouterr().out
+
+
+class FakeRenderPool:
+    def __init__(self):
+        self.contexts = []
+
+    async def render(self, context: dict) -> bytes:
+        self.contexts.append(context)
+        return f"pdf {context['invoice_number']}".encode()
+
+
+@pytest.fixture
+def pdf_cache(monkeypatch, tmp_path) -> DiskPdfCache:
+    cache = DiskPdfCache(tmp_path, max_bytes=10**6)
+    monkeypatch.setattr(invoices, "get_pdf_cache", lambda: cache)
+    return cache
+
+
+def test_invoice_pdf_is_served_from_the_cache_only(pg, api, pdf_cache):
+    customer_id = get_or_create_customer_id("alice", pg)
+    period_start, period_end = month_period("2024-07")
+    for pdf_key in ("k1", None, "evicted"):
+        pg.add(
+            Invoice(
+                customer_id=customer_id,
+                period_start=period_start,
+                period_end=period_end,
+                total_eur=1.0,
+                pdf_key=pdf_key,
+            )
+        )
+    pg.commit()
+    pdf_cache.put("k1", b"%PDF one")
+
+    with api(invoices.router, "/invoices") as client:
+        hit = client.get("/invoices/1/pdf")
+        misses = [client.get(f"/invoices/{i}/pdf").status_code for i in (2, 3, 99)]
+    assert hit.status_code == 200
+    assert hit.headers["content-type"] == "application/pdf"
+    assert hit.content == b"%PDF one"
+    assert misses == [404, 404, 404]
+
+
+def test_create_invoice_reuses_an_identical_invoice_pdf(
+    pg, api, pdf_cache, monkeypatch
+):
+    customer_id = get_or_create_customer_id("alice", pg)
+    july = datetime(2024, 7, 10, tzinfo=timezone.utc)
+    rows = [(customer_id, july + timedelta(hours=h), h + 1.0, 0.1) for h in range(2)]
+    insert_or_update_consumption_records(rows, db=pg)
+    pg.commit()
+    pool = FakeRenderPool()
+    monkeypatch.setattr(invoices, "render_pool", pool)
+
+    def create():
+        response = http.post(f"/invoices/{customer_id}", data={"year_month": "2024-07"})
+        assert response.status_code == 200
+        return response.headers["content-disposition"], response.content
+
+    with api(invoices.router, "/invoices") as http:
+        first = create()
+        second = create()
+        # once its PDF is evicted, the identical invoice can no longer be reused
+        pdf_cache._path(pdf_cache_key(pool.contexts[0])).unlink()
+        third = create()
+
+    assert first == second == ('inline; filename="invoice_1.pdf"', b"pdf 1")
+    assert third == ('inline; filename="invoice_2.pdf"', b"pdf 2")
+    assert [c["invoice_number"] for c in pool.contexts] == [1, 2]
+    stored = pg.execute(select(Invoice.id, Invoice.pdf_key).order_by(Invoice.id))
+    assert stored.all() == [
+        (number, pdf_cache_key(context))
+        for number, context in enumerate(pool.contexts, start=1)
+    ]
+    assert pool.contexts[0]["total"] == pytest.approx(0.3)
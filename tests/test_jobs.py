@@ -0,0 +1,38 @@
+import time
+
+from app.services.jobs import JobQueue
+
+
+def _wait(job):
+    deadline = time.time() + 5
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_job_reports_progress_and_result():
+    queue = JobQueue(max_workers=1, retention_seconds=60)
+
+    def work(progress):
+        progress(5)
+        progress(10)
+        return "ok"
+
+    job = queue.submit("acme", 10, work)
+    _wait(job)
+    assert queue.get(job.id) is job
+    assert job.status == "done"
+    assert job.rows_processed == 10
+    assert job.result == "ok"
+    assert job.to_dict()["rows_per_second"] >= 0
+
+
+def test_job_failure_is_captured():
+    queue = JobQueue(max_workers=1, retention_seconds=60)
+
+    def work(progress):
+        raise RuntimeError("boom")
+
+    job = queue.submit("acme", 1, work)
+    _wait(job)
+    assert job.status == "failed"
+    assert job.error == "boom"
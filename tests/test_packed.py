@@ -0,0 +1,20 @@
+from datetime import date
+
+from app.db.packed import day_slot_starts, unpack_days
+
+
+def test_day_slot_starts_follow_dst_transitions():
+    spring = day_slot_starts(date(2024, 3, 31), 92)
+    autumn = day_slot_starts(date(2024, 10, 27), 100)
+    assert str(spring[0]) == "2024-03-30 23:00:00+00:00"
+    assert str(spring[-1].tz_convert("Europe/Ljubljana")) == "2024-03-31 23:45:00+02:00"
+    assert str(autumn[-1].tz_convert("Europe/Ljubljana")) == "2024-10-27 23:45:00+01:00"
+    assert autumn.is_unique
+
+
+def test_unpack_days_drops_empty_slots():
+    kwh = [1.0, None] + [2.0] * 94
+    df = unpack_days([(date(2024, 7, 1), kwh, [0.1] * 96)])
+    assert len(df) == 95
+    assert str(df["ts"].iloc[1]) == "2024-06-30 22:30:00+00:00"
+    assert df["kwh"].sum() == 1.0 + 2.0 * 94
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app.db.partitions import ensure_partitions
+from app.db.utils import insert_or_update_consumption_records
+
+
+def partitions(db) -> list[str]:
+    q = text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'consumption_records'::regclass ORDER BY 1"
+    )
+    return list(db.execute(q).scalars())
+
+
+def drop_partitions(db, year: int) -> None:
+    # partitions outlive the per-test TRUNCATE, so start from none for `year`
+    for name in partitions(db):
+        if name.startswith(f"consumption_records_{year}_"):
+            db.execute(text(f"DROP TABLE {name}"))
+    db.commit()
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_ensure_partitions_creates_each_local_month_once(pg):
+    drop_partitions(pg, 2031)
+    # 23:30 UTC on 31 January is already February in Ljubljana
+    lo, hi = utc(2031, 1, 31, 23, 30), utc(2031, 4, 10)
+    assert ensure_partitions(pg, lo, hi) == 3
+    assert ensure_partitions(pg, lo, hi) == 0
+    assert [p for p in partitions(pg) if p.startswith("consumption_records_2031")] == [
+        "consumption_records_2031_02",
+        "consumption_records_2031_03",
+        "consumption_records_2031_04",
+    ]
+    pg.execute(text("INSERT INTO customers (id, name) VALUES (1, 'a')"))
+    pg.execute(
+        text(
+            "INSERT INTO consumption_records (customer_id, ts, kwh, price_eur_per_kwh) "
+            "VALUES (1, :ts, 1.0, 0.1)"
+        ),
+        {"ts": lo},
+    )
+    part = pg.scalar(text("SELECT tableoid::regclass::text FROM consumption_records"))
+    assert part == "consumption_records_2031_02"
+
+
+@pytest.mark.parametrize("loader, year", [("copy", 2032), ("batched", 2033)])
+def test_loaders_create_missing_partitions(pg, loader, year):
+    drop_partitions(pg, year)
+    pg.execute(text("INSERT INTO customers (id, name) VALUES (1, 'a')"))
+    rows = [(1, utc(year, 5, 31, 22, 30), 1.0, 0.1), (1, utc(year, 7, 1), 1.0, 0.1)]
+    insert_or_update_consumption_records(rows, mode=loader, batch_size=1, db=pg)
+    created = [p for p in partitions(pg) if p.startswith(f"consumption_records_{year}")]
+    assert created == [
+        f"consumption_records_{year}_06",
+        f"consumption_records_{year}_07",
+    ]
+
+
+@pytest.mark.parametrize("loader", ["copy", "batched"])
+def test_loaders_count_inserts_and_real_updates(pg, loader):
+    pg.execute(text("INSERT INTO customers (id, name) VALUES (1, 'a')"))
+    rows = [(1, utc(2024, 7, 1, 0, 15 * i), 1.0, 0.1) for i in range(3)]
+    result = insert_or_update_consumption_records(rows, mode=loader, db=pg)
+    assert (result.inserted, result.updated, result.unchanged) == (3, 0, 0)
+
+    rows[1] = (1, rows[1][1], 2.0, 0.1)
+    result = insert_or_update_consumption_records(rows, mode=loader, db=pg)
+    assert (result.inserted, result.updated, result.unchanged) == (0, 1, 2)
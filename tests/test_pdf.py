@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services import pdf
+from app.services.invoice_run import invoice_context, month_period
+from app.services.pdf import PdfRenderPool, RenderQueueFull
+
+
+def touch_pid(directory) -> None:
+    (directory / str(os.getpid())).touch()
+
+
+def test_start_warms_every_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf, "warm_renderer", functools.partial(touch_pid, tmp_path))
+    pool = PdfRenderPool(workers=3, queue_depth=0, wait_seconds=1)
+    pool.start()
+    try:
+        assert len(list(tmp_path.iterdir())) == 3
+    finally:
+        pool.shutdown()
+
+
+def test_render_rejects_callers_beyond_workers_and_queue(monkeypatch):
+    release = threading.Event()
+
+    def slow_render(context):
+        release.wait(5)
+        return context["n"].to_bytes(1, "big")
+
+    monkeypatch.setattr(pdf, "render_invoice_pdf_bytes", slow_render)
+    pool = PdfRenderPool(workers=1, queue_depth=1, wait_seconds=0.1)
+    pool._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run():
+        admitted = [asyncio.create_task(pool.render({"n": n})) for n in (1, 2)]
+        await asyncio.sleep(0)
+        with pytest.raises(RenderQueueFull):
+            await pool.render({"n": 3})
+        release.set()
+        return await asyncio.gather(*admitted)
+
+    try:
+        assert asyncio.run(run()) == [b"\x01", b"\x02"]
+    finally:
+        pool._executor.shutdown()
+
+
+def test_invoice_template_shows_peak_demand_when_known():
+    template = pdf.env.get_template("invoices/invoice.html")
+    period = month_period("2024-07")
+    html = template.render(**invoice_context(7, "alice", *period, 12.5, 12.0, 32 / 3))
+    assert "Konična moč" in html
+    assert "<td>12.00</td>" in html
+    assert "<td>10.67</td>" in html
+
+    html = template.render(**invoice_context(7, "alice", *period, 12.5))
+    assert "Konična moč" not in html
@@ -0,0 +1,98 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from app.db.models import InvoicePdf
+from app.services.pdf_cache import (
+    DbPdfCache,
+    DiskPdfCache,
+    PdfCache,
+    pdf_cache_key,
+)
+
+CONTEXT = {
+    "invoice_number": 7,
+    "customer_name": "ACME d.o.o.",
+    "period_start": "2024-07-01T00:00:00",
+    "period_end": "2024-08-01T00:00:00",
+    "total": 12.34,
+}
+
+
+def test_key_depends_on_context_not_key_order():
+    reordered = dict(reversed(list(CONTEXT.items())))
+    assert pdf_cache_key(reordered) == pdf_cache_key(CONTEXT)
+    assert pdf_cache_key(CONTEXT | {"total": 12.35}) != pdf_cache_key(CONTEXT)
+
+
+def test_backend_without_eviction_cannot_be_created():
+    class GetOnlyCache(PdfCache):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="put_many"):
+        GetOnlyCache()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskPdfCache(tmp_path, max_bytes=250)
+    cache.put("aa01", b"x" * 100)
+    cache.put("bb02", b"y" * 100)
+    # make aa01 the older entry, then read it so it becomes the most recent
+    os.utime(cache._path("aa01"), (0, 0))
+    assert cache.get("aa01") == b"x" * 100
+    os.utime(cache._path("bb02"), (1, 1))
+    cache.put("cc03", b"z" * 100)
+    assert cache.get("bb02") is None
+    assert cache.get("aa01") == b"x" * 100
+    assert cache.get("cc03") == b"z" * 100
+
+
+def test_disk_cache_creates_its_directory_on_first_put(tmp_path):
+    cache = DiskPdfCache(tmp_path / "pdfs", max_bytes=100)
+    assert not (tmp_path / "pdfs").exists()
+    cache.put("aa01", b"x")
+    assert cache.get("aa01") == b"x"
+
+
+def test_disk_cache_tracks_size_without_listing_each_put(tmp_path):
+    DiskPdfCache(tmp_path, max_bytes=1000).put("aa01", b"x" * 100)
+    os.utime(DiskPdfCache(tmp_path, 0)._path("aa01"), (0, 0))
+    # a new process counts the entries already on disk once
+    cache = DiskPdfCache(tmp_path, max_bytes=250)
+    cache.put("bb02", b"y" * 100)
+    listings = []
+    entries = cache._entries
+    cache._entries = lambda: listings.append(1) or entries()
+    # rewriting an entry replaces its size rather than adding to it
+    cache.put("bb02", b"y" * 100)
+    assert listings == []
+    assert cache._path("aa01").exists()
+    cache.put("cc03", b"z" * 100)
+    assert listings == [1]
+    assert not cache._path("aa01").exists()
+    assert cache._total == 200
+
+
+def test_db_cache_bumps_on_read_and_evicts_least_recently_used(pg):
+    cache = DbPdfCache(max_bytes=250)
+    cache.put_many({"aa01": b"x" * 100, "bb02": b"y" * 100})
+    assert cache.get("missing") is None
+    for key, day in (("aa01", 1), ("bb02", 2)):
+        pg.execute(
+            update(InvoicePdf)
+            .filter_by(key=key)
+            .values(last_used=datetime(2024, 1, day, tzinfo=timezone.utc))
+        )
+    pg.commit()
+
+    # reading aa01 makes it the most recently used, so bb02 spills over
+    assert cache.get("aa01") == b"x" * 100
+    cache.put("cc03", b"z" * 100)
+    assert sorted(pg.execute(select(InvoicePdf.key)).scalars()) == ["aa01", "cc03"]
+    assert cache.get("bb02") is None
+    # re-putting an existing key keeps one row and only bumps it
+    cache.put("aa01", b"x" * 100)
+    assert pg.scalar(select(InvoicePdf.size).filter_by(key="aa01")) == 100
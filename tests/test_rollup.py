@@ -0,0 +1,51 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.db.models import ConsumptionMonthly
+from app.db.rollup import backfill_monthly_rollup, get_customer_month, track_spans
+from app.db.utils import insert_or_update_consumption_records
+from app.routers.customers import get_or_create_customer_id
+
+
+def test_track_spans_records_min_and_max_per_customer():
+    def ts(day):
+        return datetime(2024, 7, day, tzinfo=timezone.utc)
+
+    rows = [(1, ts(5), 1.0, 0.1), (1, ts(2), 1.0, 0.1), (2, ts(9), 1.0, 0.1), (1, ts(7), 1.0, 0.1)]
+    spans: dict = {}
+    assert list(track_spans(rows, spans)) == rows
+    assert spans == {1: [ts(2), ts(7)], 2: [ts(9), ts(9)]}
+
+
+def test_rollup_records_peak_demand_per_local_month(pg):
+    customer_id = get_or_create_customer_id("alice", pg)
+    start = datetime(2024, 7, 10, tzinfo=timezone.utc)
+    july = [1.0, 3.0, 2.0, 3.0, 0.5]
+    rows = [
+        (customer_id, start + timedelta(minutes=15 * i), kwh, 0.1)
+        for i, kwh in enumerate(july)
+    ]
+    # 22:30 UTC on 31 July is already August in Ljubljana
+    august = datetime(2024, 7, 31, 22, 30, tzinfo=timezone.utc)
+    rows.append((customer_id, august, 9.0, 0.1))
+    insert_or_update_consumption_records(rows, mode="copy", db=pg)
+
+    def peaks(month: date) -> tuple:
+        row = get_customer_month(pg, customer_id, month)
+        return row.peak_kw, row.peak_top3_kw, row.peak_ts
+
+    # ties go to the earliest reading
+    expected_july = (12.0, pytest.approx(32 / 3), start + timedelta(minutes=15))
+    expected_august = (36.0, 36.0, august)
+    assert peaks(date(2024, 7, 1)) == expected_july
+    assert peaks(date(2024, 8, 1)) == expected_august
+
+    pg.execute(delete(ConsumptionMonthly))
+    backfill_monthly_rollup(pg)
+    pg.expire_all()
+    july_records = select(ConsumptionMonthly.records).filter_by(month=date(2024, 7, 1))
+    assert pg.scalar(july_records) == 5
+    assert peaks(date(2024, 7, 1)) == expected_july
+    assert peaks(date(2024, 8, 1)) == expected_august
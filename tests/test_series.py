@@ -0,0 +1,152 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pyarrow as pa
+import pytest
+
+from app.db.utils import insert_or_update_consumption_records
+from app.routers import customers
+from app.routers.customers import get_or_create_customer_id
+from app.services import series
+
+
+def collect(chunks) -> bytes:
+    async def run():
+        return b"".join([chunk async for chunk in chunks])
+
+    return asyncio.run(run())
+
+
+async def batches(*groups):
+    for rows in groups:
+        yield rows
+
+
+def test_resolution_follows_point_budget():
+    start, end = series.local_bounds(datetime(2024, 1, 1), datetime(2025, 1, 1))
+    assert start.utcoffset().total_seconds() == 3600
+    assert series.estimate_points(start, end, "month") == 12
+    assert series.choose_resolution(start, end, 10000) == "hour"
+    assert series.choose_resolution(start, end, 400) == "day"
+    assert series.choose_resolution(start, end, 12) == "month"
+    with pytest.raises(ValueError):
+        series.choose_resolution(start, end, 11)
+    with pytest.raises(ValueError):
+        series.local_bounds(datetime(2024, 2, 1), datetime(2024, 1, 1))
+
+
+def test_encoders_emit_local_buckets():
+    rows = [
+        (datetime(2024, 3, 31, 0, 0, tzinfo=timezone.utc), 1.5, 0.3),
+        (datetime(2024, 3, 31, 1, 0, tzinfo=timezone.utc), 2.0, 0.4),
+    ]
+    body = json.loads(
+        collect(series.encode_json({"resolution": "hour"}, batches(rows)))
+    )
+    assert body["columns"] == ["ts", "kwh", "cost_eur"]
+    # the DST switch: 01:00 CET is followed by 03:00 CEST
+    assert [p[0] for p in body["points"]] == [
+        "2024-03-31T01:00:00+01:00",
+        "2024-03-31T03:00:00+02:00",
+    ]
+    assert json.loads(collect(series.encode_json({}, batches([]))))["points"] == []
+
+    table = pa.ipc.open_stream(
+        collect(series.encode_arrow(batches(rows, [(date(2024, 4, 1), 3.0, 0.6)])))
+    ).read_all()
+    assert table.num_rows == 3
+    assert table.column("kwh").to_pylist() == [1.5, 2.0, 3.0]
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def fall_back_customer(pg):
+    """1 kWh at 0.1 EUR every 15 minutes of 27 October 2024, the 25-hour day when
+    Ljubljana falls back from CEST to CET, plus a few readings around it."""
+    customer_id = get_or_create_customer_id("alice", pg)
+    day_start = utc(2024, 10, 26, 22)
+    rows = [
+        (customer_id, day_start + timedelta(minutes=15 * i), 1.0, 0.1)
+        for i in range(100)
+    ]
+    rows += [
+        (customer_id, utc(2024, 10, 26, 12), 2.0, 0.1),
+        (customer_id, utc(2024, 10, 28, 12), 2.0, 0.1),
+        (customer_id, utc(2024, 11, 10, 12), 3.0, 0.1),
+    ]
+    insert_or_update_consumption_records(rows, db=pg)
+    pg.commit()
+    return customer_id
+
+
+def get_series(api, customer_id, fmt, **params):
+    with api(customers.router, "/customers") as client:
+        response = client.get(
+            f"/customers/{customer_id}/series", params=params | {"format": fmt}
+        )
+    assert response.status_code == 200, response.text
+    if fmt == "json":
+        return [tuple(p[:2]) for p in response.json()["points"]]
+    table = pa.ipc.open_stream(response.content).read_all()
+    return [
+        (ts.isoformat(), kwh)
+        for ts, kwh in zip(
+            table.column("ts").to_pylist(), table.column("kwh").to_pylist()
+        )
+    ]
+
+
+@pytest.mark.parametrize("fmt", ["json", "arrow"])
+@pytest.mark.parametrize(
+    "resolution, points, first, kwh",
+    [
+        ("15min", 100, "2024-10-27T00:00:00+02:00", 1.0),
+        ("hour", 25, "2024-10-27T00:00:00+02:00", 4.0),
+        ("day", 1, "2024-10-27T00:00:00+02:00", 100.0),
+        ("month", 1, "2024-10-01T00:00:00+02:00", 100.0),
+    ],
+)
+def test_series_route_buckets_a_fall_back_day(
+    api, fall_back_customer, fmt, resolution, points, first, kwh
+):
+    series_points = get_series(
+        api,
+        fall_back_customer,
+        fmt,
+        start="2024-10-27T00:00:00",
+        end="2024-10-28T00:00:00",
+        resolution=resolution,
+    )
+    assert len(series_points) == points
+    assert series_points[0] == (first, kwh)
+    assert sum(k for _, k in series_points) == 100.0
+    if resolution == "hour":
+        # 02:00 happens twice and gets a bucket each time
+        assert [ts for ts, _ in series_points[2:4]] == [
+            "2024-10-27T02:00:00+02:00",
+            "2024-10-27T02:00:00+01:00",
+        ]
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [
+        # partial months at both edges
+        ("2024-10-26T15:00:00", "2024-11-15T00:00:00", [102.0, 3.0]),
+        # October whole from the rollup, November partial
+        ("2024-10-01T00:00:00", "2024-11-15T00:00:00", [104.0, 3.0]),
+        ("2024-10-01T00:00:00", "2024-12-01T00:00:00", [104.0, 3.0]),
+        ("2024-11-11T00:00:00", "2024-12-01T00:00:00", []),
+    ],
+)
+def test_month_series_counts_only_readings_in_range(
+    api, fall_back_customer, start, end, expected
+):
+    series_points = get_series(
+        api, fall_back_customer, "json", start=start, end=end, resolution="month"
+    )
+    assert [kwh for _, kwh in series_points] == expected
@@ -0,0 +1,21 @@
+from app import config
+from app.db.session import async_connect_args, async_database_url
+
+
+def test_async_database_url_swaps_driver():
+    url = async_database_url("postgresql+psycopg2://user:pw@db:5432/billing")
+    assert url.drivername == "postgresql+asyncpg"
+    assert (url.username, url.password, url.host, url.port, url.database) == (
+        "user",
+        "pw",
+        "db",
+        5432,
+        "billing",
+    )
+
+
+def test_statement_timeout_connect_args(monkeypatch):
+    monkeypatch.setattr(config, "DB_STATEMENT_TIMEOUT_MS", 0)
+    assert async_connect_args() == {}
+    monkeypatch.setattr(config, "DB_STATEMENT_TIMEOUT_MS", 5000)
+    assert async_connect_args() == {"server_settings": {"statement_timeout": "5000"}}
@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.services.tariffs import (
+    NetworkBlockTariff,
+    Tariff,
+    TwoBlockTariff,
+    bill,
+    bill_grid,
+    compile_calendar,
+    easter_sunday,
+    month_slots,
+    network_blocks,
+    slovenian_holidays,
+    tariff_from_dict,
+)
+
+TWO_BLOCK = TwoBlockTariff(high=0.2, low=0.1)
+
+
+def local(*stamps):
+    return pd.DatetimeIndex([pd.Timestamp(s, tz=config.TZ) for s in stamps])
+
+
+def test_holidays_include_easter_monday():
+    assert easter_sunday(2024) == date(2024, 3, 31)
+    assert date(2024, 4, 1) in slovenian_holidays(2024)
+    assert date(2024, 6, 25) in slovenian_holidays(2024)
+
+
+def test_dst_months_have_short_and_long_days():
+    assert len(month_slots(2024, 3)) == 31 * 96 - 4
+    assert len(month_slots(2024, 10)) == 31 * 96 + 4
+    assert len(month_slots(2024, 7)) == 31 * 96
+
+
+def test_tariff_without_prices_cannot_be_created():
+    @dataclass(frozen=True)
+    class UnpricedTariff(Tariff):
+        price: float
+
+    with pytest.raises(TypeError, match="prices"):
+        UnpricedTariff(0.1)
+
+
+def test_two_block_prices():
+    slots = local(
+        "2024-07-03 05:45",  # Wednesday, before high hours
+        "2024-07-03 06:00",
+        "2024-07-03 21:45",
+        "2024-07-06 12:00",  # Saturday
+        "2024-08-15 12:00",  # Assumption Day
+    )
+    assert TWO_BLOCK.prices(slots).tolist() == [0.1, 0.2, 0.2, 0.1, 0.1]
+
+
+def test_network_blocks_by_season_and_day_type():
+    slots = local(
+        "2024-01-10 08:00",  # higher season, working day, high band
+        "2024-01-13 08:00",  # higher season, Saturday, high band
+        "2024-07-10 06:30",  # lower season, working day, mid band
+        "2024-07-14 23:00",  # lower season, Sunday, low band
+    )
+    assert network_blocks(slots).tolist() == [1, 2, 3, 5]
+
+
+def test_bill_matches_rule_evaluation_per_row():
+    rng = np.random.default_rng(0)
+    # crosses the season change, the DST switch and Easter Monday
+    ts = pd.date_range("2024-02-27", "2024-04-03", freq="15min", tz=config.TZ)
+    kwh = rng.gamma(2.0, 0.5, len(ts))
+    tariff = tariff_from_dict(
+        {
+            "type": "combined",
+            "parts": [
+                {"type": "two_block", "high": 0.15, "low": 0.09},
+                {
+                    "type": "network",
+                    "block_prices": [0.02, 0.018, 0.015, 0.012, 0.01],
+                },
+            ],
+        }
+    )
+    expected = sum(
+        k * float(tariff.prices(pd.DatetimeIndex([t]))[0]) for t, k in zip(ts, kwh)
+    )
+    assert bill(tariff, ts.tz_convert("UTC"), kwh) == pytest.approx(expected)
+
+    ids = rng.integers(0, 3, len(ts))
+    per_customer = bill(tariff, ts, kwh, customer_ids=ids, n_customers=3)
+    assert per_customer.sum() == pytest.approx(expected)
+
+    grid = np.vstack([kwh, 2 * kwh])
+    np.testing.assert_allclose(bill_grid(tariff, ts[0], grid), [expected, 2 * expected])
+
+
+def test_calendar_rejects_naive_and_out_of_range_timestamps():
+    tariff = NetworkBlockTariff((1, 2, 3, 4, 5))
+    calendar = compile_calendar(tariff, *local("2024-05-01", "2024-05-31"))
+    with pytest.raises(TypeError):
+        calendar.prices_at(pd.DatetimeIndex(["2024-05-02"]))
+    with pytest.raises(ValueError):
+        calendar.prices_at(local("2024-06-01 00:00"))
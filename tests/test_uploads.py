@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from app.services.uploads import (
+    DiskUploadStore,
+    MemoryUploadStore,
+    UploadStore,
+    frame_to_parquet,
+)
+
+
+def _frame(n: int = 10) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Časovna Značka (CEST/CET)": ["2024-07-01T00:00:00+02:00"] * n,
+            "Poraba [kWh]": [1.5] * n,
+            "Dinamične Cene [EUR/kWh]": [0.1] * n,
+        }
+    )
+
+
+def test_store_without_pop_cannot_be_created():
+    class PutOnlyStore(UploadStore):
+        def put(self, df):
+            return "token"
+
+    with pytest.raises(TypeError, match="pop"):
+        PutOnlyStore()
+
+
+def test_memory_store_round_trip_and_single_use():
+    store = MemoryUploadStore(ttl_seconds=60, max_bytes=10_000_000)
+    token = store.put(_frame())
+    pd.testing.assert_frame_equal(store.pop(token), _frame())
+    assert store.pop(token) is None
+
+
+def test_memory_store_evicts_oldest_past_byte_limit():
+    one = len(frame_to_parquet(_frame()))
+    store = MemoryUploadStore(ttl_seconds=60, max_bytes=one * 2)
+    first = store.put(_frame())
+    store.put(_frame())
+    store.put(_frame())
+    assert store.pop(first) is None
+
+
+def test_memory_store_expires_entries():
+    store = MemoryUploadStore(ttl_seconds=-1, max_bytes=10_000_000)
+    token = store.put(_frame())
+    assert store.pop(token) is None
+
+
+def test_disk_store_round_trip_and_rejects_bad_tokens(tmp_path):
+    store = DiskUploadStore(tmp_path, ttl_seconds=60, max_bytes=10_000_000)
+    token = store.put(_frame())
+    # a second store on the same directory stands in for another worker
+    other = DiskUploadStore(tmp_path, ttl_seconds=60, max_bytes=10_000_000)
+    pd.testing.assert_frame_equal(other.pop(token), _frame())
+    assert store.pop(token) is None
+    assert store.pop("../etc/passwd") is None
+    assert list(tmp_path.iterdir()) == []